@@ -1,19 +1,25 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, stream_with_context
 from flask_cors import CORS
 from database import db
 from models import UserInterest, FlightData
 from grpc_client import UserManagerClient
 from opensky_client import OpenSkyClient
 from scheduler import DataCollectorScheduler
+from backfill import BackfillManager
+from schema import upgrade_flight_data_schema
+from pagination import encode_cursor, decode_cursor
+from flight_export import FORMATS, format_available, export_columns, iter_row_batches, stream_export
+from fast_json import json_response, FLIGHT_ENCODER, INTEREST_ENCODER
+from response_cache import ResponseCache
 import os
 import signal
 import re
 import time
-from sqlalchemy import func
+from sqlalchemy import func, or_, and_
 from datetime import datetime, timedelta, timezone
 import threading
 import grpc_server
-from prometheus_client import make_wsgi_app, Counter, Gauge
+from prometheus_client import make_wsgi_app, Counter, Gauge, Histogram
 from werkzeug.middleware.dispatcher import DispatcherMiddleware
 
 app = Flask(__name__)
@@ -46,6 +52,63 @@ HTTP_REQUESTS_TOTAL = Counter(
     ['method', 'endpoint', 'status', 'service', 'node']
 )
 
+# 4. Histogram Metric: Time spent waiting for the shared OpenSky rate limiter before each call
+# Labels: service, node
+OPENSKY_RATE_LIMIT_WAIT = Histogram(
+    'opensky_rate_limit_wait_seconds',
+    'Time spent waiting for the OpenSky rate limiter',
+    ['service', 'node'],
+    buckets=(0, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+)
+
+# 5. Gauge Metric: Remaining OpenSky API credits, as reported by the rate-limit response headers
+# Labels: service, node
+OPENSKY_REMAINING_CREDITS = Gauge(
+    'opensky_remaining_credits',
+    'Remaining OpenSky API credits reported by the API',
+    ['service', 'node']
+)
+
+# 6. Gauge Metric: Current state of each OpenSky CircuitBreaker (0 = CLOSED, 1 = HALF_OPEN, 2 = OPEN)
+# Labels: service, node, endpoint (auth, departure, arrival, all)
+CIRCUIT_BREAKER_STATE = Gauge(
+    'opensky_circuit_breaker_state',
+    'Current state of the OpenSky circuit breaker (0=closed, 1=half-open, 2=open)',
+    ['service', 'node', 'endpoint']
+)
+
+# 7. Counter Metric: CircuitBreaker state transitions
+# Labels: service, node, endpoint, state (target state)
+CIRCUIT_BREAKER_TRANSITIONS = Counter(
+    'opensky_circuit_breaker_transitions_total',
+    'Total number of OpenSky circuit breaker state transitions',
+    ['service', 'node', 'endpoint', 'state']
+)
+
+# 8. Counter Metric: Calls rejected by an OPEN/HALF_OPEN CircuitBreaker
+# Labels: service, node, endpoint
+CIRCUIT_BREAKER_REJECTED = Counter(
+    'opensky_circuit_breaker_rejected_total',
+    'Total number of OpenSky calls rejected by the circuit breaker',
+    ['service', 'node', 'endpoint']
+)
+
+# 9. Counter Metric: Rows deleted from flight_data by the retention job
+# Labels: service, node, reason (expired, unmonitored)
+RETENTION_DELETED_ROWS = Counter(
+    'flight_retention_deleted_rows_total',
+    'Total number of flight_data rows deleted by the retention job',
+    ['service', 'node', 'reason']
+)
+
+# 10. Gauge Metric: Duration of the last retention run
+# Labels: service, node
+RETENTION_DURATION = Gauge(
+    'flight_retention_duration_seconds',
+    'Time taken by the last flight_data retention run',
+    ['service', 'node']
+)
+
 # Middleware to expose /metrics endpoint
 app.wsgi_app = DispatcherMiddleware(app.wsgi_app, {
     '/metrics': make_wsgi_app()
@@ -117,17 +180,27 @@ def initialize_metrics(app):
 with app.app_context():
     wait_for_db(app)
     db.create_all()
+    upgrade_flight_data_schema()
     initialize_metrics(app)
 
+user_manager_client = UserManagerClient()
+
 def start_grpc_server():
     print("Avvio thread server gRPC Data Collector...", flush=True)
-    grpc_server.serve(app)
+    grpc_server.serve(app, on_user_deleted=user_manager_client.invalidate_user)
 
 grpc_thread = threading.Thread(target=start_grpc_server, daemon=True)
 grpc_thread.start()
 
-user_manager_client = UserManagerClient()
-opensky_client = OpenSkyClient()
+opensky_client = OpenSkyClient(
+    rate_wait_histogram=OPENSKY_RATE_LIMIT_WAIT,
+    remaining_credits_gauge=OPENSKY_REMAINING_CREDITS,
+    cb_state_gauge=CIRCUIT_BREAKER_STATE,
+    cb_transitions_counter=CIRCUIT_BREAKER_TRANSITIONS,
+    cb_rejected_counter=CIRCUIT_BREAKER_REJECTED,
+    service_name=SERVICE_NAME,
+    node_name=NODE_NAME
+)
 
 scheduler = DataCollectorScheduler(
     app,
@@ -135,11 +208,52 @@ scheduler = DataCollectorScheduler(
     opensky_client,
     opensky_counter=OPENSKY_CALLS_COUNTER,
     processing_gauge=FLIGHT_PROCESSING_GAUGE,
+    retention_deleted_counter=RETENTION_DELETED_ROWS,
+    retention_duration_gauge=RETENTION_DURATION,
     service_name=SERVICE_NAME,
     node_name=NODE_NAME
 )
 
+backfill_manager = BackfillManager(app, scheduler, opensky_client)
+
 collection_interval = int(os.getenv('COLLECTION_INTERVAL_HOURS', '12'))
+export_batch_size = int(os.getenv('EXPORT_BATCH_SIZE', '10000'))
+
+# RESPONSE CACHE:
+# Rendered responses of the flight read endpoints, keyed by (endpoint, airport, query params, airport data version).
+# The version changes only when new data is committed, so until then repeated polling is served from memory,
+# or with a 304 when the client sends back the ETag (If-None-Match).
+response_cache = ResponseCache(
+    max_entries=int(os.getenv('RESPONSE_CACHE_SIZE', '1000')),
+    max_bytes=int(os.getenv('RESPONSE_CACHE_MAX_MB', '64')) * 1024 * 1024
+)
+
+def cache_lookup(endpoint, airport_icao, *extra_key):
+    # Returns (key, response): 'response' is a 304 or a cached 200, None on a miss (then use cache_store)
+    version = scheduler.data_versions.get(airport_icao)
+    key = response_cache.make_key(endpoint, airport_icao, request.args, version) + extra_key
+    etag = response_cache.etag(key)
+
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        entry = response_cache.get(key)
+        if entry is None:
+            return key, None
+        body, mimetype = entry
+        response = Response(body, status=200, mimetype=mimetype)
+
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache' # Clients may keep it, but must revalidate
+    return key, response
+
+def cache_store(key, response):
+    response = app.make_response(response)
+    if response.status_code == 200:
+        response_cache.put(key, response.get_data(), response.mimetype)
+        response.set_etag(response_cache.etag(key))
+        response.headers['Cache-Control'] = 'no-cache'
+    return response
 
 def is_valid_email(email):
     email_regex = r'^[a-zA-Z0-9_.+-]+@[a-zA-Z0-9-]+\.[a-zA-Z0-9-.]+$'
@@ -178,7 +292,8 @@ def add_interest():
         if not is_valid_email(email):
             return jsonify({"error": "Formato email non valido"}), 400
 
-        exists, message = user_manager_client.verify_user(email)
+        # Not from the cache: a new interest must never be stored for a user that has just been deleted
+        exists, message = user_manager_client.verify_user(email, fresh=True)
 
         if not exists:
             return jsonify({
@@ -305,13 +420,15 @@ def get_user_interests(email):
                 "message": message
             }), 404
 
-        interests = db.session.execute(db.select(UserInterest).filter_by(user_email=clean_email).order_by(UserInterest.created_at.desc())).scalars().all()
+        interests = INTEREST_ENCODER.to_dicts(db.session.execute(
+            db.select(*INTEREST_ENCODER.columns).where(UserInterest.user_email == clean_email).order_by(UserInterest.created_at.desc())
+        ).all())
 
-        return jsonify({
+        return json_response({
             "email": clean_email,
-            "interests": [i.to_dict() for i in interests],
+            "interests": interests,
             "count": len(interests)
-        }), 200
+        }, 200)
 
     except Exception as e:
         return jsonify({"error": f"Errore: {str(e)}"}), 500
@@ -385,7 +502,7 @@ def get_flights(airport_icao):
                 "message": message
             }), 404
 
-        interest = db.session.execute(db.select(UserInterest).filter_by(user_email=clean_email, airport_icao=clean_icao)).scalar_one_or_none()
+        interest = db.session.execute(db.select(UserInterest.id).filter_by(user_email=clean_email, airport_icao=clean_icao)).scalar_one_or_none()
 
         if not interest:
             return jsonify({
@@ -396,6 +513,11 @@ def get_flights(airport_icao):
         start_date_str = request.args.get('start_date') # YYYY-MM-DD
         end_date_str = request.args.get('end_date') # YYYY-MM-DD
         limit = int(request.args.get('limit', 100)) # default to 100
+        cursor = request.args.get('cursor') # Opaque token returned as 'next_cursor' by the previous page
+        output_format = request.args.get('format', 'json') # 'json' (paginated) or 'ndjson' (streamed)
+
+        if output_format not in ['json', 'ndjson']:
+            return jsonify({"error": "Il parametro format, se presente, deve essere 'json' o 'ndjson'"}), 400
 
         if flight_type and flight_type not in ['departure', 'arrival']:
             return jsonify({"error": "Il parametro type, se presente, deve essere 'departure' o 'arrival'"}), 400
@@ -403,11 +525,16 @@ def get_flights(airport_icao):
         # Fix: Enforce a hard limit to prevent DoS attacks
         if limit > 1000:
             limit = 1000
+        if limit < 1:
+            limit = 1
 
-        query = db.select(FlightData).filter_by(airport_icao=clean_icao)
+        # PERFORMANCE IMPROVEMENT:
+        # Column projection read as plain rows (no FlightData instances, no per-row to_dict()),
+        # serialized by orjson in one pass instead of jsonify
+        query = db.select(*FLIGHT_ENCODER.columns).where(FlightData.airport_icao == clean_icao)
 
         if flight_type:
-            query = query.filter_by(flight_type=flight_type)
+            query = query.where(FlightData.flight_type == flight_type)
 
         start_date = None
         end_date = None
@@ -424,24 +551,142 @@ def get_flights(airport_icao):
                 end_date = datetime.strptime(end_date_str, '%Y-%m-%d')
                 end_date_inclusive = end_date.replace(hour=23, minute=59, second=59)
                 query = query.filter(FlightData.collected_at <= end_date_inclusive)
+                # A flight is always collected after it was first seen: same result, but lets MySQL prune the later partitions
+                query = query.filter(FlightData.first_seen <= int(end_date_inclusive.timestamp()))
             except ValueError:
                 return jsonify({"error": "Formato end_date non valido. Usa YYYY-MM-DD"}), 400
 
         if start_date and end_date and start_date > end_date:
              return jsonify({"error": "La data di inizio non può essere successiva alla data di fine"}), 400
 
-        flights = db.session.execute(query.order_by(FlightData.collected_at.desc()).limit(limit)).scalars().all()
-
-        return jsonify({
+        # KEYSET PAGINATION:
+        # Rows are walked in (collected_at, id) descending order and the cursor is the last row of the previous page,
+        # so every page is an index range scan on (airport_icao, collected_at, id) whatever its depth (no OFFSET)
+        if cursor:
+            try:
+                cursor_collected_at, cursor_id = decode_cursor(cursor)
+            except ValueError as e:
+                return jsonify({"error": str(e)}), 400
+            query = query.filter(or_(
+                FlightData.collected_at < cursor_collected_at,
+                and_(FlightData.collected_at == cursor_collected_at, FlightData.id < cursor_id)
+            ))
+
+        query = query.order_by(FlightData.collected_at.desc(), FlightData.id.desc())
+
+        if output_format == 'ndjson':
+            # STREAMING:
+            # One JSON object per line, read from a server-side cursor in small batches:
+            # memory stays constant whatever the number of rows (no limit is applied)
+            def generate():
+                result = db.session.execute(query.execution_options(yield_per=500))
+                for row in result:
+                    yield FLIGHT_ENCODER.to_ndjson_line(row)
+
+            return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+        cache_key, cached = cache_lookup('flights', clean_icao)
+        if cached:
+            return cached
+
+        # One extra row tells us whether another page exists, without a COUNT
+        rows = db.session.execute(query.limit(limit + 1)).all()
+        has_more = len(rows) > limit
+        flights = FLIGHT_ENCODER.to_dicts(rows[:limit])
+        next_cursor = encode_cursor(flights[-1]['collected_at'], flights[-1]['id']) if has_more else None
+
+        return cache_store(cache_key, json_response({
             "airport_icao": clean_icao,
-            "flights": [f.to_dict() for f in flights],
+            "flights": flights,
             "count": len(flights),
+            "next_cursor": next_cursor,
             "filters": {
                 "type": flight_type,
                 "start_date": start_date_str,
                 "end_date": end_date_str
             }
-        }), 200
+        }, 200))
+
+    except Exception as e:
+        return jsonify({"error": f"Errore: {str(e)}"}), 500
+
+@app.route('/flights/<airport_icao>/export', methods=['GET'])
+def export_flights(airport_icao):
+    try:
+        email = request.args.get('email')
+        export_format = request.args.get('format', 'csv') # 'csv', 'parquet' or 'arrow' (Arrow IPC stream)
+        flight_type = request.args.get('type')
+        start_date_str = request.args.get('start_date') # YYYY-MM-DD
+        end_date_str = request.args.get('end_date') # YYYY-MM-DD
+
+        if not email:
+            return jsonify({"error": "Parametro 'email' obbligatorio"}), 400
+
+        if export_format not in FORMATS:
+            return jsonify({"error": "Il parametro format deve essere 'csv', 'parquet' o 'arrow'"}), 400
+
+        if not format_available(export_format):
+            return jsonify({"error": f"Formato {export_format} non disponibile su questo server (pyarrow non installato)"}), 501
+
+        if flight_type and flight_type not in ['departure', 'arrival']:
+            return jsonify({"error": "Il parametro type, se presente, deve essere 'departure' o 'arrival'"}), 400
+
+        clean_email = email.strip().lower()
+        clean_icao = airport_icao.strip().upper()
+
+        # VALIDATION: ICAO Format
+        if len(clean_icao) != 4 or not clean_icao.isalnum():
+             return jsonify({"error": "Formato Codice ICAO non valido (4 caratteri richiesti)"}), 400
+
+        if not is_valid_email(clean_email):
+             return jsonify({"error": "Formato email non valido"}), 400
+
+        exists, message = user_manager_client.verify_user(clean_email)
+        if not exists:
+            return jsonify({
+                "error": "Utente non trovato",
+                "message": message
+            }), 404
+
+        interest = db.session.execute(db.select(UserInterest.id).filter_by(user_email=clean_email, airport_icao=clean_icao)).scalar_one_or_none()
+        if not interest:
+            return jsonify({"error": "Aeroporto non tra gli interessi dell'utente"}), 403
+
+        # Column projection only: rows are exported as plain tuples, without building FlightData objects
+        query = db.select(*export_columns()).where(FlightData.airport_icao == clean_icao)
+
+        if flight_type:
+            query = query.where(FlightData.flight_type == flight_type)
+
+        start_date = None
+        end_date = None
+        try:
+            if start_date_str:
+                start_date = datetime.strptime(start_date_str, '%Y-%m-%d')
+                query = query.where(FlightData.collected_at >= start_date)
+            if end_date_str:
+                end_date = datetime.strptime(end_date_str, '%Y-%m-%d').replace(hour=23, minute=59, second=59)
+                query = query.where(FlightData.collected_at <= end_date, FlightData.first_seen <= int(end_date.timestamp()))
+        except ValueError:
+            return jsonify({"error": "Formato data non valido. Usa YYYY-MM-DD"}), 400
+
+        if start_date and end_date and start_date > end_date:
+             return jsonify({"error": "La data di inizio non può essere successiva alla data di fine"}), 400
+
+        query = query.order_by(FlightData.collected_at, FlightData.id)
+
+        mimetype, extension = FORMATS[export_format]
+        filename = f"flights_{clean_icao}_{start_date_str or 'all'}_{end_date_str or 'now'}.{extension}"
+
+        # PERFORMANCE IMPROVEMENT:
+        # Rows are streamed from a server-side cursor in batches of 'export_batch_size' and encoded batch by batch
+        # (CSV chunks, Arrow record batches, Parquet row groups), so memory doesn't depend on the export size
+        body = stream_export(export_format, iter_row_batches(db.session, query, export_batch_size))
+        return Response(
+            stream_with_context(body),
+            mimetype=mimetype,
+            headers={"Content-Disposition": f"attachment; filename={filename}"}
+        )
 
     except Exception as e:
         return jsonify({"error": f"Errore: {str(e)}"}), 500
@@ -475,15 +720,20 @@ def get_latest_flight(airport_icao):
                 "message": message
             }), 404
 
-        interest = db.session.execute(db.select(UserInterest).filter_by(user_email=clean_email, airport_icao=clean_icao)).scalar_one_or_none()
+        interest = db.session.execute(db.select(UserInterest.id).filter_by(user_email=clean_email, airport_icao=clean_icao)).scalar_one_or_none()
         if not interest:
             return jsonify({"error": "Aeroporto non tra gli interessi dell'utente"}), 403
 
+        cache_key, cached = cache_lookup('latest', clean_icao)
+        if cached:
+            return cached
+
         def fetch_latest(f_type):
-            return db.session.execute(db.select(FlightData).filter_by(
-                airport_icao=clean_icao,
-                flight_type=f_type
-            ).order_by(FlightData.collected_at.desc())).scalars().first()
+            row = db.session.execute(db.select(*FLIGHT_ENCODER.columns).where(
+                FlightData.airport_icao == clean_icao,
+                FlightData.flight_type == f_type
+            ).order_by(FlightData.collected_at.desc()).limit(1)).first()
+            return FLIGHT_ENCODER.to_dict(row) if row else None
 
         response_data = {
             "airport_icao": clean_icao
@@ -496,7 +746,7 @@ def get_latest_flight(airport_icao):
                 return jsonify({"message": f"Nessun volo di tipo {flight_type} trovato"}), 404
 
             response_data['type'] = flight_type
-            response_data['flight'] = flight.to_dict()
+            response_data['flight'] = flight
 
         else:
             # User wants both types
@@ -506,10 +756,10 @@ def get_latest_flight(airport_icao):
             if not last_dep and not last_arr:
                 return jsonify({"message": "Nessun volo trovato"}), 404
 
-            response_data['latest_departure'] = last_dep.to_dict() if last_dep else None
-            response_data['latest_arrival'] = last_arr.to_dict() if last_arr else None
+            response_data['latest_departure'] = last_dep
+            response_data['latest_arrival'] = last_arr
 
-        return jsonify(response_data), 200
+        return cache_store(cache_key, json_response(response_data, 200))
 
     except Exception as e:
         return jsonify({"error": f"Errore: {str(e)}"}), 500
@@ -547,18 +797,19 @@ def get_average_flights(airport_icao):
                 "message": message
             }), 404
 
-        interest = db.session.execute(db.select(UserInterest).filter_by(user_email=clean_email, airport_icao=clean_icao)).scalar_one_or_none()
+        interest = db.session.execute(db.select(UserInterest.id).filter_by(user_email=clean_email, airport_icao=clean_icao)).scalar_one_or_none()
         if not interest:
             return jsonify({"error": "Aeroporto non tra gli interessi dell'utente"}), 403
 
-        cutoff_date = datetime.now(timezone.utc) - timedelta(days=days)
+        # The window ends today: the day is part of the key, so the averages roll over at midnight
+        cache_key, cached = cache_lookup('average', clean_icao, datetime.now(timezone.utc).date().isoformat())
+        if cached:
+            return cached
 
         def calculate_stats(f_type):
-            count = db.session.execute(db.select(func.count()).select_from(FlightData).filter(
-                FlightData.airport_icao == clean_icao,
-                FlightData.flight_type == f_type,
-                FlightData.collected_at >= cutoff_date
-            )).scalar()
+            # PERFORMANCE IMPROVEMENT:
+            # Read from the daily rollup (at most 'days' rows) instead of a COUNT(*) over the raw flights
+            count = int(scheduler.daily_stats.total_flights(clean_icao, f_type, days))
             avg = count / days if days > 0 else 0
             return count, round(avg, 2)
 
@@ -586,7 +837,7 @@ def get_average_flights(airport_icao):
                 "daily_average": avg_arr
             }
 
-        return jsonify(response_data), 200
+        return cache_store(cache_key, (jsonify(response_data), 200))
 
     except Exception as e:
         return jsonify({"error": f"Errore: {str(e)}"}), 500
@@ -614,46 +865,130 @@ def get_airline_stats(airport_icao):
                 "message": message
             }), 404
 
-        interest = db.session.execute(db.select(UserInterest).filter_by(user_email=clean_email, airport_icao=clean_icao)).scalar_one_or_none()
+        interest = db.session.execute(db.select(UserInterest.id).filter_by(user_email=clean_email, airport_icao=clean_icao)).scalar_one_or_none()
         if not interest:
             return jsonify({"error": "Aeroporto non tra gli interessi dell'utente"}), 403
 
-        # We get the top 5 airlines by number of recorded flights (airlines means unique callsign prefixes, like 'AAL' for American Airlines)
+        # We get the top N airlines by number of recorded flights (airlines means unique callsign prefixes, like 'AAL' for American Airlines)
+        # PERFORMANCE IMPROVEMENT:
+        # Counts come from the per-day airline rollup maintained at ingest (index lookup on the airport),
+        # instead of grouping SUBSTR(callsign, 1, 3) over every flight of the airport
+
+        top_n = int(request.args.get('limit', 5))
+        if top_n < 1: top_n = 1
+        if top_n > 50: top_n = 50
+
+        start_date_str = request.args.get('start_date') # YYYY-MM-DD, date of the flight (inclusive)
+        end_date_str = request.args.get('end_date') # YYYY-MM-DD, date of the flight (inclusive)
+        try:
+            start_date = datetime.strptime(start_date_str, '%Y-%m-%d').date() if start_date_str else None
+            end_date = datetime.strptime(end_date_str, '%Y-%m-%d').date() if end_date_str else None
+        except ValueError:
+            return jsonify({"error": "Formato data non valido. Usa YYYY-MM-DD"}), 400
 
-        airline_code = func.substr(FlightData.callsign, 1, 3)
+        if start_date and end_date and start_date > end_date:
+             return jsonify({"error": "La data di inizio non può essere successiva alla data di fine"}), 400
 
-        query = db.session.query(
-            airline_code.label('airline'),
-            func.count().label('flight_count')
-        ).filter(
-            FlightData.airport_icao == clean_icao,
-            FlightData.callsign != None,
-            FlightData.callsign != ''
-        ).group_by(
-            airline_code
-        ).order_by(
-            func.count().desc()
-        ).limit(5)
+        cache_key, cached = cache_lookup('airlines', clean_icao)
+        if cached:
+            return cached
 
-        results = query.all()
+        results = scheduler.daily_stats.top_airlines(clean_icao, top_n, start_date, end_date)
 
         stats = [
             {
-                "airline_code": row.airline,
-                "flights_recorded": row.flight_count
+                "airline_code": airline,
+                "flights_recorded": count
             }
-            for row in results
+            for airline, count in results
         ]
 
-        return jsonify({
+        return cache_store(cache_key, (jsonify({
             "airport_icao": clean_icao,
-            "stat_type": "top_5_airlines",
+            "stat_type": f"top_{top_n}_airlines",
+            "filters": {
+                "start_date": start_date_str,
+                "end_date": end_date_str
+            },
             "data": stats
-        }), 200
+        }), 200))
 
     except Exception as e:
         return jsonify({"error": f"Errore nel calcolo statistiche: {str(e)}"}), 500
 
+@app.route('/backfill', methods=['POST'])
+def start_backfill():
+    try:
+        if not request.is_json:
+            return jsonify({"error": "Content-Type must be application/json"}), 415
+
+        data = request.json
+
+        if 'email' not in data or 'airport_icao' not in data or 'start_date' not in data:
+            return jsonify({"error": "Campi 'email', 'airport_icao' e 'start_date' obbligatori"}), 400
+
+        email = str(data['email']).strip().lower()
+        airport_icao = str(data['airport_icao']).strip().upper()
+
+        if len(airport_icao) != 4 or not airport_icao.isalnum():
+             return jsonify({"error": "Formato Codice ICAO non valido (4 caratteri richiesti)"}), 400
+
+        if not is_valid_email(email):
+            return jsonify({"error": "Formato email non valido"}), 400
+
+        try:
+            start_date = datetime.strptime(str(data['start_date']), '%Y-%m-%d').replace(tzinfo=timezone.utc)
+        except ValueError:
+            return jsonify({"error": "Formato start_date non valido. Usa YYYY-MM-DD"}), 400
+
+        now = datetime.now(timezone.utc)
+        end_date = now
+        if data.get('end_date'):
+            try:
+                # end_date is inclusive: we load up to the end of that day (but never in the future)
+                end_date = min(datetime.strptime(str(data['end_date']), '%Y-%m-%d').replace(tzinfo=timezone.utc) + timedelta(days=1), now)
+            except ValueError:
+                return jsonify({"error": "Formato end_date non valido. Usa YYYY-MM-DD"}), 400
+
+        if start_date >= end_date:
+            return jsonify({"error": "La data di inizio deve essere precedente alla data di fine"}), 400
+
+        if (end_date - start_date).days > backfill_manager.max_days:
+            return jsonify({"error": f"Intervallo troppo ampio (max {backfill_manager.max_days} giorni)"}), 400
+
+        # Flights older than the retention of the airport would be removed by the next retention run
+        max_age = scheduler.retention.max_age(airport_icao)
+        if start_date < now - max_age:
+            return jsonify({"error": f"La data di inizio è oltre il periodo di conservazione dei voli per {airport_icao} ({max_age.days} giorni)"}), 400
+
+        exists, message = user_manager_client.verify_user(email)
+        if not exists:
+            return jsonify({
+                "error": "Utente non trovato",
+                "message": message
+            }), 404
+
+        interest = db.session.execute(db.select(UserInterest.id).filter_by(user_email=email, airport_icao=airport_icao)).scalar_one_or_none()
+        if not interest:
+            return jsonify({"error": "Aeroporto non tra gli interessi dell'utente"}), 403
+
+        job = backfill_manager.start(airport_icao, int(start_date.timestamp()), int(end_date.timestamp()))
+
+        return jsonify({
+            "message": "Backfill avviato",
+            "job": job
+        }), 202
+
+    except Exception as e:
+        return jsonify({"error": f"Errore: {str(e)}"}), 500
+
+@app.route('/backfill/<job_id>', methods=['GET'])
+def backfill_status(job_id):
+    job = backfill_manager.get(job_id)
+    if not job:
+        return jsonify({"error": "Job di backfill non trovato"}), 404
+    return jsonify(job), 200
+
 @app.route('/collect/manual', methods=['POST'])
 def manual_collection():
     try:
@@ -662,6 +997,49 @@ def manual_collection():
     except Exception as e:
         return jsonify({"error": f"Errore: {str(e)}"}), 500
 
+@app.route('/stats/rebuild', methods=['POST'])
+def rebuild_daily_stats():
+    try:
+        airport_icao = request.args.get('airport_icao')
+        if airport_icao:
+            airport_icao = airport_icao.strip().upper()
+            if len(airport_icao) != 4 or not airport_icao.isalnum():
+                return jsonify({"error": "Formato Codice ICAO non valido (4 caratteri richiesti)"}), 400
+
+        def rebuild():
+            with app.app_context():
+                try:
+                    scheduler.daily_stats.rebuild(airport_icao)
+                finally:
+                    db.session.remove()
+
+        threading.Thread(target=rebuild).start() # Run in separate thread, it scans flight_data
+        return jsonify({"message": "Ricostruzione statistiche giornaliere avviata"}), 202
+    except Exception as e:
+        return jsonify({"error": f"Errore: {str(e)}"}), 500
+
+@app.route('/maintenance/partitioning', methods=['POST'])
+def partition_flight_data():
+    # Explicit migration to the partitioned flight_data (FLIGHT_PARTITIONING=true): rewrites the whole table
+    partitions = scheduler.retention.partitions
+    if not partitions.enabled:
+        return jsonify({"error": "Partizionamento non abilitato (FLIGHT_PARTITIONING=false)"}), 409
+
+    def migrate():
+        with app.app_context():
+            try:
+                if not partitions.partition_table():
+                    print("[Partitioning] flight_data è già partizionata.", flush=True)
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                print(f"[Partitioning] Errore migrazione: {e}", flush=True)
+            finally:
+                db.session.remove()
+
+    threading.Thread(target=migrate).start() # Run in separate thread, the ALTER TABLE copies flight_data
+    return jsonify({"message": "Migrazione a flight_data partizionata avviata"}), 202
+
 @app.route('/scheduler/status', methods=['GET'])
 def scheduler_status():
     try:
@@ -696,4 +1074,5 @@ if __name__ == '__main__':
         print("Fermando lo scheduler e il client gRPC...", flush=True)
         scheduler.stop()
         user_manager_client.close()
+        opensky_client.close()
         print("Data Collector chiuso correttamente.", flush=True)
@@ -0,0 +1,111 @@
+import asyncio
+import aiohttp
+import os
+from concurrent.futures import ThreadPoolExecutor
+from database import db
+
+class AsyncCollectionEngine:
+    def __init__(self, scheduler):
+        self.scheduler = scheduler
+        self.app = scheduler.app
+        self.opensky_client = scheduler.opensky_client
+
+        # Max number of airports in flight at the same time (bounded by an asyncio.Semaphore)
+        self.max_concurrency = int(os.getenv('ASYNC_MAX_CONCURRENCY', '100'))
+
+        # MySQL (SQLAlchemy session) and Kafka are blocking libraries: the upsert/publish stage runs
+        # on a small dedicated pool, sized to stay within the DB connection pool (pool_size + max_overflow).
+        self.db_workers = int(os.getenv('ASYNC_DB_WORKERS', '10'))
+
+    def run(self, active_airports, airport_interests):
+        # Called from the scheduler thread: each run gets its own event loop
+        asyncio.run(self._run(active_airports, airport_interests))
+
+    async def _run(self, active_airports, airport_interests):
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        connector = aiohttp.TCPConnector(limit=self.max_concurrency, keepalive_timeout=30)
+        timeout = aiohttp.ClientTimeout(total=30)
+
+        with ThreadPoolExecutor(max_workers=self.db_workers, thread_name_prefix='async-db') as db_executor:
+            async with aiohttp.ClientSession(connector=connector, timeout=timeout) as http_session:
+                not_before = self.scheduler._not_before()
+                tasks = [
+                    self._process_airport(http_session, semaphore, db_executor, icao, airport_interests[icao], not_before)
+                    for icao in active_airports
+                ]
+                await asyncio.gather(*tasks) # Each task handles its own errors, one airport can't stop the others
+
+    async def _run_in_db_thread(self, db_executor, func, *args):
+        def wrapper():
+            with self.app.app_context():
+                try:
+                    return func(*args)
+                finally:
+                    db.session.remove()
+
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(db_executor, wrapper)
+
+    async def _process_airport(self, http_session, semaphore, db_executor, icao, interests, not_before):
+        # Same single-flight registry used by the threaded engine and by collect_single_airport
+        single_flight = self.scheduler.single_flight
+        is_leader, future = single_flight.begin(icao, not_before=not_before)
+
+        if not is_leader:
+            # Followers don't take a concurrency slot: the slots are left to the airports that must be fetched
+            print(f"[async] {icao} già in aggiornamento: attendo l'esito della raccolta in corso.", flush=True)
+            try:
+                await asyncio.wrap_future(future)
+            except Exception:
+                pass # Already logged by the collection that failed
+            return
+
+        try:
+            async with semaphore:
+                while True:
+                    try:
+                        outcome = {'result': await self._collect_airport(http_session, db_executor, icao, interests)}
+                    except Exception as e:
+                        outcome = {'error': e}
+
+                    if not single_flight.complete(icao, **outcome):
+                        break
+
+        except asyncio.CancelledError as e:
+            # Cancelled while waiting for a slot or collecting: the waiters get the error instead of hanging
+            while single_flight.complete(icao, error=e):
+                pass
+            raise
+
+    async def _collect_airport(self, http_session, db_executor, icao, interests):
+        counter = self.scheduler.opensky_counter
+        labels = self.scheduler.common_labels
+
+        try:
+            dep_begin, arr_begin, end_ts, floor_ts = await self._run_in_db_thread(db_executor, self.scheduler._get_fetch_window, icao)
+            window = self.scheduler._build_window(icao, dep_begin, arr_begin, end_ts, floor_ts)
+
+            print(f"[async] Richiedo dati per {icao} a OpenSky...", flush=True)
+
+            if counter:
+                counter.labels(**labels, status='attempt').inc()
+
+            data = await self.opensky_client.get_flights_for_airport_async(
+                http_session, icao, dep_begin, end_ts, arrivals_begin_timestamp=arr_begin
+            )
+
+            if counter:
+                counter.labels(**labels, status='success').inc()
+
+            if data:
+                data['window'] = window
+                print(f"[async] Dati scaricati per {icao}, elaborazione...", flush=True)
+                result = await self._run_in_db_thread(db_executor, self.scheduler._process_airport_data, icao, data, interests)
+                print(f"[async] Elaborazione completata per {icao}.", flush=True)
+                return result
+
+        except Exception as e:
+            if counter:
+                counter.labels(**labels, status='failure').inc()
+            print(f"[async] Errore processamento {icao}: {e}", flush=True)
+            raise
@@ -0,0 +1,129 @@
+from database import db
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from collections import OrderedDict
+from datetime import datetime, timezone
+import threading
+import uuid
+import time
+import os
+
+class BackfillManager:
+    def __init__(self, app, scheduler, opensky_client):
+        self.app = app
+        self.scheduler = scheduler
+        self.opensky_client = opensky_client
+
+        # OpenSky accepts at most this interval per /flights/departure or /flights/arrival call
+        self.chunk_seconds = int(os.getenv('BACKFILL_CHUNK_HOURS', str(self.opensky_client.AIRPORT_FLIGHTS_MAX_WINDOW // 3600))) * 3600
+        self.max_workers = int(os.getenv('BACKFILL_MAX_WORKERS', '4'))
+        self.max_days = int(os.getenv('BACKFILL_MAX_DAYS', '90'))
+
+        # In-memory registry of the jobs of this process (id -> progress), used by GET /backfill/<job_id>.
+        # Finished jobs are kept for BACKFILL_JOB_TTL_HOURS, and at most BACKFILL_MAX_JOBS of them (oldest evicted first)
+        self.jobs = OrderedDict()
+        self.finished_jobs = OrderedDict() # job_id -> finish time, in finishing order
+        self.job_ttl_seconds = int(os.getenv('BACKFILL_JOB_TTL_HOURS', '24')) * 3600
+        self.max_jobs = int(os.getenv('BACKFILL_MAX_JOBS', '1000'))
+        self.jobs_lock = threading.Lock()
+
+    def _split_range(self, begin_ts, end_ts):
+        chunks = []
+        chunk_begin = begin_ts
+        while chunk_begin < end_ts:
+            chunk_end = min(chunk_begin + self.chunk_seconds, end_ts)
+            chunks.append((chunk_begin, chunk_end))
+            chunk_begin = chunk_end
+        return chunks
+
+    def start(self, airport_icao, begin_ts, end_ts):
+        chunks = self._split_range(begin_ts, end_ts)
+        job_id = str(uuid.uuid4())
+
+        job = {
+            'job_id': job_id,
+            'airport_icao': airport_icao,
+            'begin': begin_ts,
+            'end': end_ts,
+            'state': 'running',
+            'total_chunks': len(chunks),
+            'completed_chunks': 0,
+            'failed_chunks': 0,
+            'departures_saved': 0,
+            'arrivals_saved': 0,
+            'started_at': datetime.now(timezone.utc).isoformat(),
+            'finished_at': None
+        }
+        with self.jobs_lock:
+            self._prune_jobs()
+            self.jobs[job_id] = job
+
+        # Run in a separate thread to avoid blocking the HTTP response
+        threading.Thread(target=self._run, args=(job_id, chunks), name=f"backfill-{airport_icao}").start()
+        return self.get(job_id)
+
+    def _prune_jobs(self):
+        # Must be called with jobs_lock held. Running jobs are never evicted
+        now = time.time()
+        while self.finished_jobs:
+            job_id, finished_at = next(iter(self.finished_jobs.items()))
+            if now - finished_at < self.job_ttl_seconds and len(self.finished_jobs) < self.max_jobs:
+                break
+            del self.finished_jobs[job_id]
+            self.jobs.pop(job_id, None)
+
+    def get(self, job_id):
+        with self.jobs_lock:
+            job = self.jobs.get(job_id)
+            return dict(job) if job else None
+
+    def _update(self, job_id, **increments):
+        with self.jobs_lock:
+            job = self.jobs[job_id]
+            for key, value in increments.items():
+                job[key] += value
+
+    def _run_chunk(self, job_id, airport_icao, chunk_begin, chunk_end):
+        with self.app.app_context():
+            try:
+                # Chunks run in parallel, pacing towards OpenSky is left to the client's shared rate limiter.
+                # The same window requested by two overlapping jobs is fetched and saved only once (single-flight),
+                # and the rows go through the same write path as the periodic collection (writer pipeline, or the
+                # per-airport write lock), so the two never upsert the same airport concurrently.
+                c_dep, c_arr = self.scheduler.single_flight.do(
+                    ('backfill', airport_icao, chunk_begin, chunk_end), self._fetch_and_save, airport_icao, chunk_begin, chunk_end
+                )
+
+                self._update(job_id, completed_chunks=1, departures_saved=c_dep, arrivals_saved=c_arr)
+            except Exception as e:
+                db.session.rollback()
+                self._update(job_id, failed_chunks=1)
+                print(f"[Backfill {airport_icao}] Errore chunk {chunk_begin}-{chunk_end}: {e}", flush=True)
+            finally:
+                db.session.remove()
+
+    def _fetch_and_save(self, airport_icao, chunk_begin, chunk_end):
+        data = self.opensky_client.get_flights_for_airport(airport_icao, chunk_begin, chunk_end)
+        c_dep = self.scheduler._save_flights(airport_icao, data.get('departures'), 'departure')
+        c_arr = self.scheduler._save_flights(airport_icao, data.get('arrivals'), 'arrival')
+        return c_dep, c_arr
+
+    def _run(self, job_id, chunks):
+        job = self.get(job_id)
+        airport_icao = job['airport_icao']
+        start_time = time.time()
+
+        print(f"[Backfill {airport_icao}] Avvio: {len(chunks)} finestre da {self.chunk_seconds // 3600}h...", flush=True)
+
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=f"backfill-{airport_icao}") as executor:
+            futures = [executor.submit(self._run_chunk, job_id, airport_icao, b, e) for b, e in chunks]
+            for _ in as_completed(futures):
+                pass
+
+        with self.jobs_lock:
+            job = self.jobs[job_id]
+            job['state'] = 'completed' if job['failed_chunks'] == 0 else 'completed_with_errors'
+            job['finished_at'] = datetime.now(timezone.utc).isoformat()
+            self.finished_jobs[job_id] = time.time()
+            saved = job['departures_saved'] + job['arrivals_saved']
+
+        print(f"[Backfill {airport_icao}] Terminato in {time.time() - start_time:.1f}s: {saved} voli salvati.", flush=True)
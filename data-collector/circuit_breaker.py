@@ -1,50 +1,159 @@
 import time
 import threading
+from collections import deque
 
 class CircuitBreakerOpenException(Exception):
     pass
 
 class CircuitBreaker:
-    def __init__(self, failure_threshold=3, recovery_timeout=60):
-        self.failure_threshold = failure_threshold
+    STATE_VALUES = {'CLOSED': 0, 'HALF_OPEN': 1, 'OPEN': 2} # Numeric encoding for the Prometheus state Gauge
+
+    def __init__(self, name='default', failure_rate_threshold=0.5, window_seconds=120, minimum_calls=3,
+                 recovery_timeout=60, max_recovery_timeout=600, backoff_multiplier=2,
+                 state_metric=None, transitions_metric=None, rejected_metric=None, labels=None):
+        self.name = name
+
+        # Strategy: Failure Rate over a Sliding Window.
+        # We keep the outcomes of the calls of the last 'window_seconds' and open the circuit when at least
+        # 'minimum_calls' were made and the share of failures reaches 'failure_rate_threshold'.
+        # Old sporadic errors fall out of the window instead of accumulating.
+        self.failure_rate_threshold = failure_rate_threshold
+        self.window_seconds = window_seconds
+        self.minimum_calls = minimum_calls
+        self.outcomes = deque() # (timestamp, success)
+
+        # Exponential open timeout: every failed recovery probe doubles the time spent OPEN (up to a max),
+        # a successful probe brings it back to the base value.
+        self.base_recovery_timeout = recovery_timeout
         self.recovery_timeout = recovery_timeout
-        self.failures = 0
+        self.max_recovery_timeout = max_recovery_timeout
+        self.backoff_multiplier = backoff_multiplier
+
         self.state = 'CLOSED'
-        self.last_failure_time = 0
+        self.opened_at = 0
+        self.probe_in_flight = False # In HALF_OPEN only one call (the probe) is let through
         self.lock = threading.Lock()
 
-    def call(self, func, *args, **kwargs):
+        self.state_metric = state_metric             # Prometheus Gauge: current state (0 closed, 1 half-open, 2 open)
+        self.transitions_metric = transitions_metric # Prometheus Counter: transitions, by target state
+        self.rejected_metric = rejected_metric       # Prometheus Counter: calls rejected without reaching the service
+        self.labels = dict(labels or {}, endpoint=name)
+
+        if self.state_metric:
+            self.state_metric.labels(**self.labels).set(self.STATE_VALUES[self.state])
+
+    def _transition(self, new_state):
+        # Must be called holding self.lock
+        self.state = new_state
+        if self.state_metric:
+            self.state_metric.labels(**self.labels).set(self.STATE_VALUES[new_state])
+        if self.transitions_metric:
+            self.transitions_metric.labels(**self.labels, state=new_state).inc()
+
+    def _reject(self, reason):
+        if self.rejected_metric:
+            self.rejected_metric.labels(**self.labels).inc()
+        raise CircuitBreakerOpenException(f"CircuitBreaker '{self.name}' is {reason}")
 
+    def _prune(self, now):
+        while self.outcomes and now - self.outcomes[0][0] > self.window_seconds:
+            self.outcomes.popleft()
+
+    def _before_call(self):
         with self.lock:
             if self.state == 'OPEN':
-                if time.time() - self.last_failure_time > self.recovery_timeout:
-                    self.state = 'HALF_OPEN'
-                    print("CircuitBreaker: HALF_OPEN - Tentativo di ripristino...", flush=True)
-                else:
-                    raise CircuitBreakerOpenException("CircuitBreaker is OPEN")
+                if time.time() - self.opened_at > self.recovery_timeout:
+                    self._transition('HALF_OPEN')
+                    self.probe_in_flight = True # This caller is the probe
+                    print(f"CircuitBreaker [{self.name}]: HALF_OPEN - Tentativo di ripristino...", flush=True)
+                    return
+                reason = 'OPEN'
+            elif self.state == 'HALF_OPEN' and self.probe_in_flight:
+                # The other callers don't stampede the recovering service: they fail fast until the probe's outcome is known
+                reason = 'HALF_OPEN (probe in corso)'
+            else:
+                if self.state == 'HALF_OPEN':
+                    self.probe_in_flight = True
+                return
+
+        self._reject(reason)
+
+    def _on_success(self):
+        with self.lock:
+            if self.state == 'HALF_OPEN':
+                self._transition('CLOSED')
+                self.probe_in_flight = False
+                self.outcomes.clear()
+                self.recovery_timeout = self.base_recovery_timeout
+                print(f"CircuitBreaker [{self.name}]: CLOSED - Servizio ripristinato.", flush=True)
+            elif self.state == 'CLOSED':
+                now = time.time()
+                self.outcomes.append((now, True))
+                self._prune(now)
+
+    def _on_failure(self):
+        with self.lock:
+            now = time.time()
+
+            if self.state == 'HALF_OPEN':
+                # The probe failed: back to OPEN for longer
+                self.probe_in_flight = False
+                self.recovery_timeout = min(self.max_recovery_timeout, self.recovery_timeout * self.backoff_multiplier)
+                self.opened_at = now
+                self._transition('OPEN')
+                print(f"CircuitBreaker [{self.name}]: OPEN - Probe fallita, nuovo tentativo tra {self.recovery_timeout}s.", flush=True)
+                return
+
+            if self.state != 'CLOSED':
+                return
+
+            self.outcomes.append((now, False))
+            self._prune(now)
+
+            failures = sum(1 for _, success in self.outcomes if not success)
+            if len(self.outcomes) >= self.minimum_calls and failures / len(self.outcomes) >= self.failure_rate_threshold:
+                self.opened_at = now
+                self._transition('OPEN')
+                print(f"CircuitBreaker [{self.name}]: OPEN - Troppi errori ({failures}/{len(self.outcomes)} nella finestra).", flush=True)
+
+    def _on_abort(self):
+        # The call was cancelled or interrupted before an outcome: nothing is recorded for the service,
+        # but an aborted probe must not keep the circuit HALF_OPEN forever, the next caller probes again
+        with self.lock:
+            if self.state == 'HALF_OPEN':
+                self.probe_in_flight = False
+
+    def call(self, func, *args, **kwargs):
+        self._before_call()
 
         try:
             result = func(*args, **kwargs)
-
-            with self.lock:
-                if self.state == 'HALF_OPEN':
-                    self.state = 'CLOSED'
-                    self.failures = 0
-                    print("CircuitBreaker: CLOSED - Servizio ripristinato.", flush=True)
-                elif self.state == 'CLOSED':
-                    # Strategy: Consecutive Failures.
-                    # A successful request indicates the service is healthy, so we reset
-                    # the failure count to 0 to avoid accumulating sporadic errors over long periods.
-                    self.failures = 0
+            self._on_success()
             return result
 
         except Exception as e:
-            with self.lock:
-                self.failures += 1
-                self.last_failure_time = time.time()
+            self._on_failure()
+            raise e
+
+        except BaseException:
+            # asyncio.CancelledError, KeyboardInterrupt, SystemExit
+            self._on_abort()
+            raise
+
+    async def call_async(self, func, *args, **kwargs):
+        # Same state machine as call(), but 'func' is a coroutine function awaited on the event loop
+        self._before_call()
 
-                if self.failures >= self.failure_threshold:
-                    self.state = 'OPEN'
-                    print(f"CircuitBreaker: OPEN - Troppi errori ({self.failures}).", flush=True)
+        try:
+            result = await func(*args, **kwargs)
+            self._on_success()
+            return result
 
+        except Exception as e:
+            self._on_failure()
             raise e
+
+        except BaseException:
+            # asyncio.CancelledError, KeyboardInterrupt, SystemExit
+            self._on_abort()
+            raise
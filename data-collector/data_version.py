@@ -0,0 +1,47 @@
+from database import db
+from models import AirportDataVersion
+from sqlalchemy import select
+from sqlalchemy.dialects.mysql import insert
+from datetime import datetime, timezone
+import threading
+import time
+
+class AirportDataVersions:
+    def __init__(self, ttl_seconds=5):
+        # Versions live in MySQL, so a write on any replica invalidates the caches of all of them.
+        # Reads keep them in memory for 'ttl_seconds' (a bump on this replica is visible immediately).
+        self.ttl_seconds = ttl_seconds
+        self.local = {} # airport_icao -> (version, read_at)
+        self.lock = threading.Lock()
+
+        query = insert(AirportDataVersion)
+        self.bump_statement = query.on_duplicate_key_update(
+            version=AirportDataVersion.version + 1,
+            updated_at=query.inserted.updated_at
+        )
+
+    def bump(self, airport_icao):
+        # Called after the new data has been committed
+        try:
+            db.session.execute(self.bump_statement, {'airport_icao': airport_icao, 'version': 1, 'updated_at': datetime.now(timezone.utc)})
+            db.session.commit()
+        except Exception as e:
+            # Not fatal: cached responses of this airport will just live until the next bump
+            db.session.rollback()
+            print(f"Errore aggiornamento versione dati per {airport_icao}: {e}", flush=True)
+        with self.lock:
+            self.local.pop(airport_icao, None)
+
+    def get(self, airport_icao):
+        now = time.time()
+        with self.lock:
+            cached = self.local.get(airport_icao)
+        if cached and now - cached[1] < self.ttl_seconds:
+            return cached[0]
+
+        version = db.session.execute(
+            select(AirportDataVersion.version).where(AirportDataVersion.airport_icao == airport_icao)
+        ).scalar() or 0
+        with self.lock:
+            self.local[airport_icao] = (version, now)
+        return version
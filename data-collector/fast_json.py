@@ -0,0 +1,49 @@
+from flask import Response
+from models import UserInterest
+from flight_export import EXPORT_COLUMNS
+from datetime import datetime
+import json
+
+try:
+    import orjson # Serializes dicts/lists/datetimes in C, several times faster than json + jsonify
+except ImportError:
+    orjson = None
+
+def dumps(payload):
+    # Returns bytes. datetimes are encoded as ISO 8601 (same output as isoformat()).
+    # Keys are sorted and the output is compact, like Flask's jsonify
+    if orjson is not None:
+        return orjson.dumps(payload, option=orjson.OPT_SORT_KEYS)
+    return json.dumps(payload, sort_keys=True, separators=(',', ':'),
+                      default=lambda v: v.isoformat() if isinstance(v, datetime) else str(v)).encode('utf-8')
+
+def json_response(payload, status=200):
+    return Response(dumps(payload) + b'\n', status=status, mimetype='application/json') # jsonify ends the body with a newline too
+
+class RowEncoder:
+    # Turns Core rows of a column projection into the same dicts as Model.to_dict(),
+    # without loading ORM instances: the column list and key names are fixed once, at construction
+    def __init__(self, fields):
+        self.columns = [column for column, _ in fields]
+        self.keys = tuple(key for _, key in fields)
+
+    def to_dict(self, row):
+        return dict(zip(self.keys, row))
+
+    def to_dicts(self, rows):
+        keys = self.keys
+        return [dict(zip(keys, row)) for row in rows]
+
+    def to_ndjson_line(self, row):
+        return dumps(dict(zip(self.keys, row))) + b'\n'
+
+FLIGHT_ENCODER = RowEncoder([(column, key) for column, key, _ in EXPORT_COLUMNS])
+
+INTEREST_ENCODER = RowEncoder([
+    (UserInterest.id, 'id'),
+    (UserInterest.user_email, 'user_email'),
+    (UserInterest.airport_icao, 'airport_icao'),
+    (UserInterest.high_value, 'high_value'),
+    (UserInterest.low_value, 'low_value'),
+    (UserInterest.created_at, 'created_at')
+])
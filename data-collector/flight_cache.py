@@ -0,0 +1,97 @@
+from collections import OrderedDict
+from datetime import datetime, timezone
+import threading
+
+class FlightDigestCache:
+    # Columns that the upsert can change on an existing row: if none of them changed, the row can be skipped
+    MUTABLE_FIELDS = (
+        'last_seen',
+        'est_arrival_airport',
+        'callsign',
+        'est_arrival_airport_horiz_distance',
+        'est_arrival_airport_vert_distance',
+        'arrival_airport_candidates_count'
+    )
+
+    def __init__(self, max_entries=100000):
+        # LRU of (airport_icao, icao24, first_seen) -> digest of the mutable columns as last written to MySQL.
+        # Only the 64-bit digest is kept (not the row), and the least recently seen flights are evicted first.
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.warmed_airports = {} # airport_icao -> when its digests were loaded from MySQL (naive UTC)
+        self.lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0
+
+    @staticmethod
+    def key(row):
+        return (row['airport_icao'], row['icao24'], row['first_seen'])
+
+    @classmethod
+    def digest(cls, row):
+        return hash(tuple(row.get(field) for field in cls.MUTABLE_FIELDS))
+
+    def is_unchanged(self, row):
+        key = self.key(row)
+        with self.lock:
+            digest = self.entries.get(key)
+            if digest is None:
+                return False
+            self.entries.move_to_end(key)
+            return digest == self.digest(row)
+
+    def store(self, rows):
+        # Must be called only after the rows have been committed
+        with self.lock:
+            for row in rows:
+                key = self.key(row)
+                self.entries[key] = self.digest(row)
+                self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def needs_warmup(self, airport_icao):
+        with self.lock:
+            return airport_icao not in self.warmed_airports
+
+    def warm(self, airport_icao, rows, warmed_at):
+        self.store(rows)
+        with self.lock:
+            self.warmed_airports[airport_icao] = warmed_at
+
+    @staticmethod
+    def now():
+        return datetime.now(timezone.utc).replace(tzinfo=None)
+
+    def retain_airports(self, airport_icaos, monitored_since=None):
+        # Drops the airports no longer collected by this replica (unmonitored, or moved to another shard):
+        # their rows may be deleted or rewritten elsewhere, and a stale digest must not hide a future write.
+        # 'monitored_since' (airport -> newest interest creation) also drops the airports whose interests were
+        # created after the warm-up: they may have been unmonitored in between and garbage collected by the
+        # retention leader, so they are warmed again from what is actually stored.
+        airport_icaos = set(airport_icaos)
+        with self.lock:
+            for icao, since in (monitored_since or {}).items():
+                warmed_at = self.warmed_airports.get(icao)
+                if warmed_at is not None and since is not None and since.replace(tzinfo=None) > warmed_at:
+                    airport_icaos.discard(icao)
+            self._drop(lambda icao: icao not in airport_icaos)
+
+    def drop_airports(self, airport_icaos):
+        # Called after their rows have been deleted (retention garbage collection)
+        airport_icaos = set(airport_icaos)
+        with self.lock:
+            self._drop(lambda icao: icao in airport_icaos)
+
+    def _drop(self, should_drop):
+        for key in [k for k in self.entries if should_drop(k[0])]:
+            del self.entries[key]
+        for icao in [icao for icao in self.warmed_airports if should_drop(icao)]:
+            del self.warmed_airports[icao]
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.warmed_airports.clear()
@@ -0,0 +1,122 @@
+from models import FlightData
+from datetime import datetime
+import importlib.util
+import csv
+import io
+
+# Exported columns: (FlightData column, output name as in FlightData.to_dict(), Arrow type)
+EXPORT_COLUMNS = [
+    (FlightData.id, 'id', 'int64'),
+    (FlightData.airport_icao, 'airport_icao', 'string'),
+    (FlightData.icao24, 'icao24', 'string'),
+    (FlightData.first_seen, 'firstSeen', 'int64'),
+    (FlightData.est_departure_airport, 'estDepartureAirport', 'string'),
+    (FlightData.last_seen, 'lastSeen', 'int64'),
+    (FlightData.est_arrival_airport, 'estArrivalAirport', 'string'),
+    (FlightData.callsign, 'callsign', 'string'),
+    (FlightData.est_departure_airport_horiz_distance, 'estDepartureAirportHorizDistance', 'int32'),
+    (FlightData.est_departure_airport_vert_distance, 'estDepartureAirportVertDistance', 'int32'),
+    (FlightData.est_arrival_airport_horiz_distance, 'estArrivalAirportHorizDistance', 'int32'),
+    (FlightData.est_arrival_airport_vert_distance, 'estArrivalAirportVertDistance', 'int32'),
+    (FlightData.departure_airport_candidates_count, 'departureAirportCandidatesCount', 'int32'),
+    (FlightData.arrival_airport_candidates_count, 'arrivalAirportCandidatesCount', 'int32'),
+    (FlightData.flight_type, 'flight_type', 'string'),
+    (FlightData.collected_at, 'collected_at', 'timestamp')
+]
+
+FORMATS = {
+    'csv': ('text/csv', 'csv'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet'),
+    'arrow': ('application/vnd.apache.arrow.stream', 'arrows')
+}
+
+def format_available(export_format):
+    # Arrow and Parquet need pyarrow, checked before the response starts streaming
+    return export_format == 'csv' or importlib.util.find_spec('pyarrow') is not None
+
+def export_columns():
+    return [column for column, _, _ in EXPORT_COLUMNS]
+
+def iter_row_batches(session, query, batch_size):
+    # Server-side cursor (rows are streamed from MySQL, not buffered by the driver) read in fixed-size
+    # batches of plain Core rows: no ORM objects and at most one batch in memory
+    result = session.execute(query.execution_options(stream_results=True, yield_per=batch_size))
+    for rows in result.partitions(batch_size):
+        yield rows
+
+class _ChunkSink:
+    # Minimal writable file: pyarrow writes into it and the response generator drains it after each batch
+    def __init__(self):
+        self.chunks = []
+        self.closed = False
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+def stream_csv(row_batches):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow([name for _, name, _ in EXPORT_COLUMNS])
+    for rows in row_batches:
+        writer.writerows(
+            [value.isoformat() if isinstance(value, datetime) else value for value in row] for row in rows
+        )
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate(0)
+    if buffer.tell():
+        yield buffer.getvalue()
+
+def _arrow_schema(pa):
+    types = {'int64': pa.int64(), 'int32': pa.int32(), 'string': pa.string(), 'timestamp': pa.timestamp('us')}
+    return pa.schema([(name, types[type_name]) for _, name, type_name in EXPORT_COLUMNS])
+
+def _record_batch(pa, schema, rows):
+    columns = list(zip(*rows)) if rows else [[] for _ in EXPORT_COLUMNS]
+    return pa.RecordBatch.from_arrays(
+        [pa.array(values, type=field.type) for values, field in zip(columns, schema)],
+        schema=schema
+    )
+
+def stream_arrow(row_batches):
+    import pyarrow as pa # Optional dependency: only needed by the Arrow/Parquet exports
+
+    schema = _arrow_schema(pa)
+    sink = _ChunkSink()
+    with pa.ipc.new_stream(sink, schema) as writer:
+        for rows in row_batches:
+            writer.write_batch(_record_batch(pa, schema, rows))
+            yield sink.drain()
+    yield sink.drain()
+
+def stream_parquet(row_batches):
+    import pyarrow as pa # Optional dependency: only needed by the Arrow/Parquet exports
+    import pyarrow.parquet as pq
+
+    schema = _arrow_schema(pa)
+    sink = _ChunkSink()
+    # Every batch becomes a row group, written out as soon as it is complete (the footer comes at the end)
+    with pq.ParquetWriter(pa.PythonFile(sink, mode='w'), schema, compression='snappy') as writer:
+        for rows in row_batches:
+            writer.write_batch(_record_batch(pa, schema, rows))
+            yield sink.drain()
+    yield sink.drain()
+
+def stream_export(export_format, row_batches):
+    if export_format == 'csv':
+        return stream_csv(row_batches)
+    if export_format == 'arrow':
+        return stream_arrow(row_batches)
+    return stream_parquet(row_batches)
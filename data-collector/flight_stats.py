@@ -0,0 +1,219 @@
+from database import db
+from models import FlightData, FlightDailyStats, FlightAirlineDailyStats
+from sqlalchemy import select, delete, update, func, tuple_, not_, case
+from sqlalchemy.dialects.mysql import insert
+from datetime import datetime, timezone, timedelta
+import time
+
+def airline_prefix(callsign):
+    # Same definition as the former SUBSTR(callsign, 1, 3) leaderboard
+    return callsign[:3] if callsign else None
+
+class DailyStatsRollup:
+    def __init__(self, data_versions=None):
+        self.data_versions = data_versions # Bumped after a rebuild, the cached stats responses are stale
+
+        # Counters are adjusted at ingest: the deltas of the batch are added to the stored values
+        query = insert(FlightDailyStats)
+        self.increment_statement = query.on_duplicate_key_update(flights=FlightDailyStats.flights + query.inserted.flights)
+        query = insert(FlightAirlineDailyStats)
+        self.airline_increment_statement = query.on_duplicate_key_update(flights=FlightAirlineDailyStats.flights + query.inserted.flights)
+
+    @staticmethod
+    def flight_date(timestamp):
+        return datetime.fromtimestamp(timestamp, timezone.utc).date()
+
+    @classmethod
+    def stats_date(cls, flight_type, first_seen, last_seen):
+        # Day a flight counts for: departures on the day they left, arrivals on the day they landed
+        # (same semantics as the lookback counts sent to the Alert System)
+        if flight_type == 'arrival' and last_seen:
+            return cls.flight_date(last_seen)
+        return cls.flight_date(first_seen)
+
+    def record(self, rows):
+        # Must run in the same transaction as the flight upsert, BEFORE it: a flight counts only if its
+        # (icao24, first_seen, airport_icao) key isn't stored yet, otherwise the upsert is just an update.
+        # The keys are read with a locking read (FOR UPDATE): stored rows and the gaps of missing keys stay locked
+        # until commit, so a concurrent transaction writing the same flights (backfill, another replica, the
+        # synchronous fallback of the writer) waits and then sees them stored, or deadlocks and is retried,
+        # instead of counting the same new flight twice.
+        # The upsert also rewrites the callsign and last_seen, so the airline counters move when an existing flight
+        # changes prefix, and the arrival counters when its landing moves to another day.
+        first_rows = {} # The first occurrence of a key is the one inserted (its flight_type is kept)...
+        last_rows = {}  # ...the last one is what the row looks like after the batch
+        for row in rows:
+            key = (row['icao24'], row['first_seen'], row['airport_icao'])
+            first_rows.setdefault(key, row)
+            last_rows[key] = row
+        if not first_rows:
+            return
+
+        existing = db.session.execute(
+            select(FlightData.icao24, FlightData.first_seen, FlightData.airport_icao, FlightData.airline_prefix,
+                   FlightData.flight_type, FlightData.last_seen)
+            .where(tuple_(FlightData.icao24, FlightData.first_seen, FlightData.airport_icao).in_(list(first_rows.keys())))
+            .with_for_update()
+        ).all()
+        stored = {(icao24, first_seen, icao): (prefix, f_type, last_seen) for icao24, first_seen, icao, prefix, f_type, last_seen in existing}
+
+        buckets = {}
+        airline_buckets = {}
+
+        def add_airline(icao, day, prefix, delta):
+            if prefix:
+                bucket = (icao, day, prefix)
+                airline_buckets[bucket] = airline_buckets.get(bucket, 0) + delta
+
+        def add_flight(icao, day, f_type, delta):
+            bucket = (icao, day, f_type)
+            buckets[bucket] = buckets.get(bucket, 0) + delta
+
+        for key, row in first_rows.items():
+            icao = row['airport_icao']
+            day = self.flight_date(row['first_seen'])
+            new_prefix = last_rows[key].get('airline_prefix')
+            new_last_seen = last_rows[key].get('last_seen')
+
+            if key in stored:
+                old_prefix, f_type, old_last_seen = stored[key]
+                if old_prefix != new_prefix:
+                    add_airline(icao, day, old_prefix, -1)
+                    add_airline(icao, day, new_prefix, 1)
+                old_day = self.stats_date(f_type, row['first_seen'], old_last_seen)
+                new_day = self.stats_date(f_type, row['first_seen'], new_last_seen)
+                if old_day != new_day:
+                    add_flight(icao, old_day, f_type, -1)
+                    add_flight(icao, new_day, f_type, 1)
+            else:
+                # The flight_type of the inserted row is kept, the other columns end up as in the last occurrence
+                add_flight(icao, self.stats_date(row['flight_type'], row['first_seen'], new_last_seen), row['flight_type'], 1)
+                add_airline(icao, day, new_prefix, 1)
+
+        if any(buckets.values()):
+            db.session.execute(self.increment_statement, [
+                {'airport_icao': icao, 'flight_date': day, 'flight_type': f_type, 'flights': count}
+                for (icao, day, f_type), count in sorted(buckets.items()) if count
+            ])
+        airline_values = [
+            {'airport_icao': icao, 'flight_date': day, 'airline_prefix': prefix, 'flights': count}
+            for (icao, day, prefix), count in sorted(airline_buckets.items()) if count
+        ]
+        if airline_values:
+            db.session.execute(self.airline_increment_statement, airline_values)
+
+    def total_flights(self, airport_icao, flight_type, days):
+        # Flights of the last 'days' calendar days (today included)
+        since = datetime.now(timezone.utc).date() - timedelta(days=days - 1)
+        return db.session.execute(select(func.coalesce(func.sum(FlightDailyStats.flights), 0)).where(
+            FlightDailyStats.airport_icao == airport_icao,
+            FlightDailyStats.flight_type == flight_type,
+            FlightDailyStats.flight_date >= since
+        )).scalar()
+
+    def top_airlines(self, airport_icao, limit, start_date=None, end_date=None):
+        # Top-N airline prefixes, optionally in a range of flight dates (inclusive)
+        flights = func.sum(FlightAirlineDailyStats.flights)
+        query = select(FlightAirlineDailyStats.airline_prefix, flights).where(FlightAirlineDailyStats.airport_icao == airport_icao)
+        if start_date:
+            query = query.where(FlightAirlineDailyStats.flight_date >= start_date)
+        if end_date:
+            query = query.where(FlightAirlineDailyStats.flight_date <= end_date)
+        query = query.group_by(FlightAirlineDailyStats.airline_prefix).having(flights > 0).order_by(flights.desc()).limit(limit)
+        return [(prefix, int(count)) for prefix, count in db.session.execute(query).all()]
+
+    def retain_airports(self, airport_icaos):
+        # Called by the garbage collection: stats of unmonitored airports go away with their flights
+        deleted = 0
+        for model in (FlightDailyStats, FlightAirlineDailyStats):
+            query = delete(model)
+            if airport_icaos:
+                query = query.where(not_(model.airport_icao.in_(airport_icaos)))
+            deleted += db.session.execute(query).rowcount
+        return deleted
+
+    def _fill_airline_prefixes(self, airport_icao, batch_size=5000):
+        # Rows stored before the airline_prefix column existed: filled in primary-key batches
+        last_id = 0
+        while True:
+            ids = db.session.execute(
+                select(FlightData.id)
+                .where(FlightData.airport_icao == airport_icao, FlightData.id > last_id,
+                       FlightData.airline_prefix == None, FlightData.callsign != None, FlightData.callsign != '')
+                .order_by(FlightData.id).limit(batch_size)
+            ).scalars().all()
+            if not ids:
+                return
+            db.session.execute(update(FlightData).where(FlightData.id.in_(ids)).values(airline_prefix=func.substr(FlightData.callsign, 1, 3)))
+            db.session.commit()
+            last_id = ids[-1]
+
+    def rebuild(self, airport_icao=None):
+        # Recomputes the rollups from flight_data (e.g. for data stored before the rollups existed).
+        # Days older than the oldest raw flight are kept: their raw rows may have been removed by the retention.
+        start_time = time.time()
+        airports = [airport_icao] if airport_icao else db.session.execute(select(FlightData.airport_icao).distinct()).scalars().all()
+        day_number = func.floor(FlightData.first_seen / 86400) # Timezone-independent UTC day
+        # Arrivals count on the day they landed (see stats_date)
+        stats_timestamp = case(
+            (FlightData.flight_type == 'arrival', func.coalesce(func.nullif(FlightData.last_seen, 0), FlightData.first_seen)),
+            else_=FlightData.first_seen
+        )
+        stats_day_number = func.floor(stats_timestamp / 86400)
+
+        rows_written = 0
+        for icao in airports:
+            try:
+                counts = db.session.execute(
+                    select(stats_day_number, FlightData.flight_type, func.count())
+                    .where(FlightData.airport_icao == icao)
+                    .group_by(stats_day_number, FlightData.flight_type)
+                ).all()
+                if not counts:
+                    continue
+
+                values = [
+                    {'airport_icao': icao, 'flight_date': self.flight_date(int(day) * 86400), 'flight_type': f_type, 'flights': count}
+                    for day, f_type, count in counts
+                ]
+                # Every rollup day of the airport (arrivals included, they land after first_seen) starts from here
+                first_day = self.flight_date(db.session.execute(
+                    select(func.min(FlightData.first_seen)).where(FlightData.airport_icao == icao)
+                ).scalar())
+
+                db.session.execute(delete(FlightDailyStats).where(
+                    FlightDailyStats.airport_icao == icao,
+                    FlightDailyStats.flight_date >= first_day
+                ))
+                db.session.execute(insert(FlightDailyStats), values)
+                db.session.commit()
+                rows_written += len(values)
+
+                self._fill_airline_prefixes(icao)
+                airline_counts = db.session.execute(
+                    select(day_number, FlightData.airline_prefix, func.count())
+                    .where(FlightData.airport_icao == icao, FlightData.airline_prefix != None)
+                    .group_by(day_number, FlightData.airline_prefix)
+                ).all()
+                airline_values = [
+                    {'airport_icao': icao, 'flight_date': self.flight_date(int(day) * 86400), 'airline_prefix': prefix, 'flights': count}
+                    for day, prefix, count in airline_counts
+                ]
+
+                db.session.execute(delete(FlightAirlineDailyStats).where(
+                    FlightAirlineDailyStats.airport_icao == icao,
+                    FlightAirlineDailyStats.flight_date >= first_day
+                ))
+                if airline_values:
+                    db.session.execute(insert(FlightAirlineDailyStats), airline_values)
+                db.session.commit()
+                rows_written += len(airline_values)
+
+                if self.data_versions:
+                    self.data_versions.bump(icao)
+            except Exception as e:
+                db.session.rollback()
+                print(f"[Stats] Errore ricostruzione statistiche per {icao}: {e}", flush=True)
+
+        print(f"[Stats] Statistiche giornaliere ricostruite per {len(airports)} aeroporti ({rows_written} righe) in {time.time() - start_time:.1f}s.", flush=True)
+        return rows_written
@@ -0,0 +1,155 @@
+from database import db
+from concurrent.futures import Future
+import threading
+import random
+import queue
+import time
+import zlib
+
+class _WriteRequest:
+    def __init__(self, airport_icao, rows):
+        self.airport_icao = airport_icao
+        self.rows = rows
+        self.future = Future()
+
+class FlightWriter:
+    def __init__(self, app, upsert_statement, num_writers=1, queue_size=100, batch_rows=5000, max_wait_ms=200, max_retries=5, before_write=None, on_commit=None):
+        self.app = app
+        self.upsert_statement = upsert_statement
+        self.num_writers = max(1, num_writers)
+        self.batch_rows = batch_rows
+        self.max_wait = max_wait_ms / 1000.0
+        self.max_retries = max(1, max_retries) # Attempts of a batch that hits a deadlock / lock wait timeout
+        self.before_write = before_write # Called with the rows inside the write transaction, before the upsert (e.g. rollup counters)
+        self.on_commit = on_commit # Called with the committed rows (e.g. to update the change-detection cache)
+
+        # One bounded queue per writer: a full queue blocks the fetch workers (backpressure),
+        # and an airport always goes to the same writer, so writers never compete for the same rows
+        self.queues = [queue.Queue(maxsize=queue_size) for _ in range(self.num_writers)]
+        self.threads = []
+        self.running = False
+        self.lock = threading.Lock() # Orders submit() against stop(): nothing is queued after the stop marker
+
+    def start(self):
+        if self.running:
+            return
+        self.running = True
+        for i, q in enumerate(self.queues):
+            t = threading.Thread(target=self._writer_loop, args=(q,), name=f"flight-writer-{i}", daemon=True)
+            t.start()
+            self.threads.append(t)
+        print(f"[Writer] Avviati {self.num_writers} writer per flight_data (batch fino a {self.batch_rows} righe).", flush=True)
+
+    def stop(self):
+        # Pending requests are written before the writers exit
+        with self.lock:
+            if not self.running:
+                return
+            self.running = False
+        for q in self.queues:
+            q.put(None)
+        for t in self.threads:
+            t.join()
+        self.threads = []
+        print("[Writer] Writer fermati.", flush=True)
+
+    def submit(self, airport_icao, rows):
+        # Returns a Future resolved (with the number of rows) once the rows are committed.
+        # Once the writers are stopped (e.g. a backfill still running at shutdown) the rows are written
+        # synchronously by the caller instead of waiting forever on a queue nobody reads.
+        request = _WriteRequest(airport_icao, rows)
+        q = self.queues[zlib.crc32(airport_icao.encode('utf-8')) % self.num_writers]
+        while True:
+            with self.lock:
+                if not self.running:
+                    break
+                try:
+                    q.put_nowait(request)
+                    return request.future
+                except queue.Full:
+                    pass
+            time.sleep(0.01) # Queue full: wait for the writers (backpressure) without holding the lock
+
+        self._write([request])
+        return request.future
+
+    def _next_batch(self, q):
+        # Blocks for the first request, then merges whatever else arrives (possibly from other airports)
+        # until the batch is full or 'max_wait' has elapsed
+        first = q.get()
+        if first is None:
+            return None, True
+
+        batch = [first]
+        rows = len(first.rows)
+        deadline = time.time() + self.max_wait
+        while rows < self.batch_rows:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            try:
+                request = q.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if request is None:
+                return batch, True
+            batch.append(request)
+            rows += len(request.rows)
+
+        return batch, False
+
+    def _write(self, batch):
+        rows = [row for request in batch for row in request.rows]
+        # Key order (same as the unique index): pages are touched sequentially and lock order is deterministic
+        rows.sort(key=lambda x: (x['icao24'], x['first_seen'], x['airport_icao']))
+
+        start_time = time.time()
+        error = None
+        with self.app.app_context():
+            for attempt in range(self.max_retries):
+                try:
+                    if self.before_write:
+                        self.before_write(rows)
+                    db.session.execute(self.upsert_statement, rows)
+                    db.session.commit()
+                    error = None
+                    break
+                except Exception as e:
+                    db.session.rollback()
+                    error = e
+                    error_str = str(e).lower()
+                    # Deadlock (1213) / lock wait timeout (1205), e.g. gap locks between writers with WRITER_THREADS > 1:
+                    # the whole transaction was rolled back, so the batch is simply retried with backoff + jitter
+                    if ("deadlock" in error_str or "1213" in error_str or "1205" in error_str) and attempt < self.max_retries - 1:
+                        print(f"[Writer] Conflitto di lock su batch di {len(rows)} righe. Riprovo ({attempt+1}/{self.max_retries})...", flush=True)
+                        time.sleep(random.uniform(0.5, 1.0) * (2 ** attempt) * 0.1)
+                        continue
+                    airports = sorted({request.airport_icao for request in batch})
+                    print(f"[Writer] Errore scrittura batch ({len(rows)} righe, {', '.join(airports)}): {e}", flush=True)
+                    break
+            db.session.remove()
+
+        if error is not None:
+            if len(batch) > 1:
+                # A bad row must not fail the other airports merged in the same batch: write each request on its own
+                for request in batch:
+                    self._write([request])
+            else:
+                batch[0].future.set_exception(error)
+            return
+
+        if self.on_commit:
+            self.on_commit(rows)
+
+        elapsed = time.time() - start_time
+        print(f"[Writer] Commit {len(rows)} righe da {len(batch)} richieste in {elapsed:.2f}s ({len(rows) / max(elapsed, 1e-6):.0f} righe/s).", flush=True)
+        for request in batch:
+            request.future.set_result(len(request.rows))
+
+    def _writer_loop(self, q):
+        while True:
+            batch, stop = self._next_batch(q)
+            if batch:
+                self._write(batch)
+            if stop:
+                break
@@ -1,11 +1,142 @@
 import grpc
 import user_service_pb2
 import user_service_pb2_grpc
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+import threading
+import queue
+import time
 import os
 import json
 
+class UserVerificationCache:
+    def __init__(self, max_entries=10000, ttl_seconds=60, negative_ttl_seconds=5, stale_seconds=600):
+        # LRU of VerifyUser results: email -> (exists, message, stored_at).
+        # "Not found" answers expire sooner, so a user who just registered isn't rejected for long.
+        # Expired positive entries are kept (until evicted) and used only if user-manager is unreachable.
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.negative_ttl_seconds = negative_ttl_seconds
+        self.stale_seconds = stale_seconds
+        self.entries = OrderedDict()
+        self.tombstones = {} # email -> deleted_at: users being deleted, not cached as existing for 'ttl_seconds'
+        self.lock = threading.Lock()
+
+    def _tombstoned(self, email, now):
+        # Must be called with the lock held
+        deleted_at = self.tombstones.get(email)
+        if deleted_at is None:
+            return False
+        if now - deleted_at < self.ttl_seconds:
+            return True
+        del self.tombstones[email]
+        return False
+
+    def _lookup(self, email, max_age):
+        now = time.time()
+        with self.lock:
+            if self._tombstoned(email, now):
+                return False, "Utente eliminato"
+            entry = self.entries.get(email)
+            if entry is None:
+                return None
+            exists, message, stored_at = entry
+            if now - stored_at >= max_age(exists):
+                return None
+            self.entries.move_to_end(email)
+            return exists, message
+
+    def get(self, email):
+        return self._lookup(email, lambda exists: self.ttl_seconds if exists else self.negative_ttl_seconds)
+
+    def get_stale(self, email):
+        # Fallback when VerifyUser fails: only positive answers, up to 'stale_seconds' old
+        return self._lookup(email, lambda exists: self.stale_seconds if exists else 0)
+
+    def put(self, email, exists, message):
+        # Returns the answer to use: a VerifyUser answer racing with the deletion must not bring the user back
+        if self.max_entries <= 0:
+            return exists, message
+        with self.lock:
+            if self._tombstoned(email, time.time()):
+                return False, "Utente eliminato"
+            self.entries[email] = (exists, message, time.time())
+            self.entries.move_to_end(email)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        return exists, message
+
+    def invalidate(self, email):
+        # The user is being deleted: user-manager removes it only after DeleteInterests returns, so a VerifyUser
+        # in flight (or sent right after) can still answer True. The tombstone outlives the positive TTL and
+        # wins over such answers; after it expires, VerifyUser is authoritative again.
+        # Note: DeleteInterests reaches a single data-collector replica, the others catch up within the TTL.
+        with self.lock:
+            self.entries.pop(email, None)
+            if self.max_entries > 0:
+                now = time.time()
+                self.tombstones[email] = now
+                for expired in [e for e, deleted_at in self.tombstones.items() if now - deleted_at >= self.ttl_seconds]:
+                    del self.tombstones[expired]
+
+class VerifyUsersBatcher:
+    def __init__(self, verify_batch, max_batch=100, max_wait_ms=2, concurrency=4):
+        # Coalesces concurrent single lookups: the first email waits up to 'max_wait_ms' for others,
+        # then the whole batch goes out as one VerifyUsers RPC (sent from a small pool, so a slow
+        # batch doesn't hold back the next one)
+        self.verify_batch = verify_batch # emails -> {email: exists}
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self.queue = queue.Queue()
+        self.executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='verify-users')
+        self.thread = threading.Thread(target=self._run, name='verify-users-batcher', daemon=True)
+        self.thread.start()
+
+    def submit(self, email):
+        # Returns a Future resolved with 'exists' (or with the gRPC error of the batch)
+        future = Future()
+        self.queue.put((email, future))
+        return future
+
+    def _next_batch(self):
+        batch = [self.queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _send(self, batch):
+        try:
+            results = self.verify_batch(list(dict.fromkeys(email for email, _ in batch)))
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        for email, future in batch:
+            future.set_result(results.get(email, False))
+
+    def _run(self):
+        while True:
+            self.executor.submit(self._send, self._next_batch())
+
 class UserManagerClient:
     def __init__(self):
+        # VERIFICATION CACHE:
+        # Every REST endpoint verifies the user before doing any work: the answers are cached for a while
+        # instead of paying a gRPC round-trip to user-manager per request
+        self.verification_cache = UserVerificationCache(
+            max_entries=int(os.getenv('USER_CACHE_SIZE', '10000')),
+            ttl_seconds=int(os.getenv('USER_CACHE_TTL_SECONDS', '60')),
+            negative_ttl_seconds=int(os.getenv('USER_CACHE_NEGATIVE_TTL_SECONDS', '5')),
+            stale_seconds=int(os.getenv('USER_CACHE_STALE_SECONDS', '600'))
+        )
+
         self.host = os.getenv('USER_MANAGER_HOST', 'user-manager')
         self.port = os.getenv('USER_MANAGER_GRPC_PORT', '50051')
 
@@ -21,6 +152,10 @@ class UserManagerClient:
                         "retryableStatusCodes": ["UNAVAILABLE"]
                     },
                     "timeout": "10s"
+                },
+                {
+                    # Long-lived stream: no overall deadline
+                    "name": [{"service": "user_service.UserService", "method": "VerifyUsersStream"}]
                 }
             ]
         }
@@ -44,16 +179,67 @@ class UserManagerClient:
         self.channel = grpc.insecure_channel(target, options=options)
         self.stub = user_service_pb2_grpc.UserServiceStub(self.channel)
 
-    def verify_user(self, email):
+        # MICRO-BATCHING:
+        # Cache misses of concurrent requests are merged into VerifyUsers RPCs instead of one VerifyUser each
+        self.batcher = None
+        if os.getenv('VERIFY_USERS_BATCHING', 'true').lower() == 'true':
+            self.batcher = VerifyUsersBatcher(
+                self.verify_users,
+                max_batch=int(os.getenv('VERIFY_USERS_BATCH_SIZE', '100')),
+                max_wait_ms=float(os.getenv('VERIFY_USERS_BATCH_WAIT_MS', '2')),
+                concurrency=int(os.getenv('VERIFY_USERS_BATCH_CONCURRENCY', '4'))
+            )
+
+    def verify_user(self, email, fresh=False):
+        # fresh=True skips the cached answer (e.g. before storing new data for the user), the result is cached anyway.
+        # A user being deleted is reported as missing even if user-manager still has it.
+        if not fresh:
+            cached = self.verification_cache.get(email)
+            if cached is not None:
+                return cached
+
         try:
-            print("Invio richiesta VerifyUser...", flush=True)
-            request = user_service_pb2.VerifyUserRequest(email=email)
-            response = self.stub.VerifyUser(request)
-            return response.exists, response.message
+            exists, message = self._verify_remote(email)
+            return self.verification_cache.put(email, exists, message)
         except grpc.RpcError as e:
             print(f"Errore gRPC critico dopo retry: {e.details()}", flush=True)
+            stale = self.verification_cache.get_stale(email)
+            if stale is not None:
+                print(f"User-manager non raggiungibile, uso la verifica in cache per {email}.", flush=True)
+                return stale
             return False, f"Errore di comunicazione: {e.details()}"
 
+    def _verify_remote(self, email):
+        if self.batcher:
+            try:
+                exists = self.batcher.submit(email).result()
+                return exists, "Utente trovato" if exists else "Utente non trovato"
+            except grpc.RpcError as e:
+                if e.code() != grpc.StatusCode.UNIMPLEMENTED:
+                    raise
+                # user-manager without VerifyUsers (e.g. during a rolling update): back to the unary call
+                print("VerifyUsers non disponibile, uso VerifyUser.", flush=True)
+                self.batcher = None
+
+        print("Invio richiesta VerifyUser...", flush=True)
+        response = self.stub.VerifyUser(user_service_pb2.VerifyUserRequest(email=email))
+        return response.exists, response.message
+
+    def verify_users(self, emails):
+        # One RPC (one IN query on user-manager) per batch: returns {email: exists}
+        print(f"Invio richiesta VerifyUsers ({len(emails)} email)...", flush=True)
+        response = self.stub.VerifyUsers(user_service_pb2.VerifyUsersRequest(emails=emails))
+        return {result.email: result.exists for result in response.results}
+
+    def verify_users_stream(self, email_batches):
+        # Bidirectional stream for long bulk checks: yields {email: exists} for every batch sent
+        requests = (user_service_pb2.VerifyUsersRequest(emails=list(batch)) for batch in email_batches)
+        for response in self.stub.VerifyUsersStream(requests):
+            yield {result.email: result.exists for result in response.results}
+
+    def invalidate_user(self, email):
+        self.verification_cache.invalidate(email)
+
     def get_user(self, email):
         try:
             print("Invio richiesta GetUser...", flush=True)
@@ -6,14 +6,19 @@ from database import db
 from models import UserInterest
 
 class DataCollectorServicer(data_collector_service_pb2_grpc.DataCollectorServiceServicer):
-    def __init__(self, app):
+    def __init__(self, app, on_user_deleted=None):
         self.app = app
+        self.on_user_deleted = on_user_deleted # Drops the user from the verification cache
 
     def DeleteInterests(self, request, context):
         with self.app.app_context():
             try:
                 print(f"Ricevuta richiesta gRPC di cancellazione interessi per: {request.email}", flush=True)
 
+                # DeleteInterests is the first step of a user deletion in user-manager: from now on the user is gone
+                if self.on_user_deleted:
+                    self.on_user_deleted(request.email.strip().lower())
+
                 deleted = db.session.execute(
                     db.delete(UserInterest).where(UserInterest.user_email == request.email)
                 )
@@ -36,7 +41,7 @@ class DataCollectorServicer(data_collector_service_pb2_grpc.DataCollectorService
                     message=error_msg
                 )
 
-def serve(app):
+def serve(app, on_user_deleted=None):
     server_options = [
         ('grpc.keepalive_time_ms', 10000),
         ('grpc.keepalive_timeout_ms', 5000),
@@ -47,7 +52,7 @@ def serve(app):
     server = grpc.server(futures.ThreadPoolExecutor(max_workers=10), options=server_options)
 
     data_collector_service_pb2_grpc.add_DataCollectorServiceServicer_to_server(
-        DataCollectorServicer(app), server
+        DataCollectorServicer(app, on_user_deleted), server
     )
 
     server.add_insecure_port('[::]:50052')
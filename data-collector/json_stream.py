@@ -0,0 +1,64 @@
+import codecs
+import json
+
+_decoder = json.JSONDecoder()
+_WHITESPACE = ' \t\n\r'
+_NUMBER_END = _WHITESPACE + ',]'
+
+def iter_json_array(chunks):
+    # Incremental parser for a top-level JSON array (like the OpenSky flight lists).
+    # It yields one element at a time while the body is still being downloaded, so the whole
+    # response is never held in memory: only the current chunk and the element being decoded.
+    # Any other top-level value (object, string, number...) is rejected with ValueError, only 'null' is
+    # accepted (as an empty list).
+    utf8 = codecs.getincrementaldecoder('utf-8')()
+    buffer = ''
+    pos = 0
+    started = False
+    finished = False
+
+    def feed(chunk):
+        nonlocal buffer, pos
+        buffer = buffer[pos:] + utf8.decode(chunk) # Drop what was already consumed before appending
+        pos = 0
+
+    chunk_iter = iter(chunks)
+
+    while not finished:
+        # Skip whitespace and the separators between elements
+        while pos < len(buffer) and (buffer[pos] in _WHITESPACE or (started and buffer[pos] == ',')):
+            pos += 1
+
+        if pos < len(buffer):
+            char = buffer[pos]
+            if not started:
+                if char == '[':
+                    started = True
+                    pos += 1
+                    continue
+                if buffer.startswith('null', pos): # OpenSky may answer 'null' for empty results
+                    return
+                if not 'null'.startswith(buffer[pos:pos + 4]):
+                    raise ValueError("JSON array atteso")
+
+            if char == ']':
+                finished = True
+                continue
+
+            try:
+                item, end = _decoder.raw_decode(buffer, pos)
+                # A number is complete only once a delimiter follows it: "1." + "5" first decodes as 1
+                if not isinstance(item, (int, float)) or (end < len(buffer) and buffer[end] in _NUMBER_END):
+                    pos = end
+                    yield item
+                    continue
+            except json.JSONDecodeError:
+                pass # Element split across chunks: read more data and try again
+
+        chunk = next(chunk_iter, None)
+        if chunk is None:
+            if not started and not buffer[pos:].strip():
+                return # Empty body
+            raise ValueError("JSON troncato o non valido")
+        if chunk:
+            feed(chunk)
@@ -37,11 +37,12 @@ class FlightData(db.Model):
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     airport_icao = db.Column(db.String(10), nullable=False, index=True)
     icao24 = db.Column(db.String(50), nullable=False)
-    first_seen = db.Column(db.BigInteger, nullable=False)
+    first_seen = db.Column(db.BigInteger, nullable=False)  # Added to the PK only by the partitioning migration (partitioning.py)
     est_departure_airport = db.Column(db.String(10))
     last_seen = db.Column(db.BigInteger)
     est_arrival_airport = db.Column(db.String(10))
     callsign = db.Column(db.String(20))
+    airline_prefix = db.Column(db.String(3))  # First 3 characters of the callsign (ICAO airline designator), set at ingest
     est_departure_airport_horiz_distance = db.Column(db.Integer)
     est_departure_airport_vert_distance = db.Column(db.Integer)
     est_arrival_airport_horiz_distance = db.Column(db.Integer)
@@ -51,7 +52,11 @@ class FlightData(db.Model):
     flight_type = db.Column(db.String(20), nullable=False)  # 'departure' or 'arrival'
     collected_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc), index=True)
 
-    __table_args__ = (db.UniqueConstraint('icao24', 'first_seen', 'airport_icao', name='unique_flight'),)
+    __table_args__ = (
+        db.UniqueConstraint('icao24', 'first_seen', 'airport_icao', name='unique_flight'),
+        db.Index('ix_flight_airport_airline', 'airport_icao', 'airline_prefix'),
+        db.Index('ix_flight_airport_collected', 'airport_icao', 'collected_at', 'id'),  # Keyset pagination on (collected_at, id)
+    )
 
     def to_dict(self):
         return {
@@ -72,3 +77,97 @@ class FlightData(db.Model):
             'flight_type': self.flight_type,
             'collected_at': self.collected_at.isoformat() if self.collected_at else None
         }
+
+class FetchWatermark(db.Model):
+    __tablename__ = 'fetch_watermarks'
+
+    # High-water mark of the last successful OpenSky fetch for an airport/direction (unix timestamp of the window end)
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    airport_icao = db.Column(db.String(10), nullable=False)
+    flight_type = db.Column(db.String(20), nullable=False)  # 'departure' or 'arrival'
+    last_end = db.Column(db.BigInteger, nullable=False)
+    updated_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+
+    __table_args__ = (db.UniqueConstraint('airport_icao', 'flight_type', name='unique_watermark'),)
+
+    def to_dict(self):
+        return {
+            'airport_icao': self.airport_icao,
+            'flight_type': self.flight_type,
+            'last_end': self.last_end,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+        }
+
+class CollectorReplica(db.Model):
+    __tablename__ = 'collector_replicas'
+
+    # One row per live data-collector replica, refreshed by its heartbeat (used to shard airports across replicas)
+    replica_id = db.Column(db.String(255), primary_key=True)
+    last_heartbeat = db.Column(db.DateTime, nullable=False)
+    started_at = db.Column(db.DateTime, nullable=False)
+
+    def to_dict(self):
+        return {
+            'replica_id': self.replica_id,
+            'last_heartbeat': self.last_heartbeat.isoformat() if self.last_heartbeat else None,
+            'started_at': self.started_at.isoformat() if self.started_at else None
+        }
+
+class FlightDailyStats(db.Model):
+    __tablename__ = 'flight_daily_stats'
+
+    # Rollup of flight_data: number of flights per airport, day and direction, maintained at ingest so that
+    # aggregate endpoints read a few rows instead of counting raw flights
+    # (day = UTC date of first_seen for departures, of last_seen for arrivals, see DailyStatsRollup.stats_date)
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    airport_icao = db.Column(db.String(10), nullable=False)
+    flight_date = db.Column(db.Date, nullable=False)
+    flight_type = db.Column(db.String(20), nullable=False)  # 'departure' or 'arrival'
+    flights = db.Column(db.Integer, nullable=False, default=0)
+
+    __table_args__ = (db.UniqueConstraint('airport_icao', 'flight_date', 'flight_type', name='unique_daily_stats'),)
+
+    def to_dict(self):
+        return {
+            'airport_icao': self.airport_icao,
+            'flight_date': self.flight_date.isoformat() if self.flight_date else None,
+            'flight_type': self.flight_type,
+            'flights': self.flights
+        }
+
+class FlightAirlineDailyStats(db.Model):
+    __tablename__ = 'flight_airline_daily_stats'
+
+    # Rollup of flight_data: number of flights per airport, day and airline prefix, maintained at ingest so that
+    # the airline leaderboard doesn't group raw flights
+    # (day = UTC date of first_seen for both directions, unlike flight_daily_stats where arrivals use last_seen)
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    airport_icao = db.Column(db.String(10), nullable=False)
+    flight_date = db.Column(db.Date, nullable=False)
+    airline_prefix = db.Column(db.String(3), nullable=False)
+    flights = db.Column(db.Integer, nullable=False, default=0)
+
+    __table_args__ = (db.UniqueConstraint('airport_icao', 'flight_date', 'airline_prefix', name='unique_airline_daily_stats'),)
+
+    def to_dict(self):
+        return {
+            'airport_icao': self.airport_icao,
+            'flight_date': self.flight_date.isoformat() if self.flight_date else None,
+            'airline_prefix': self.airline_prefix,
+            'flights': self.flights
+        }
+
+class AirportDataVersion(db.Model):
+    __tablename__ = 'airport_data_versions'
+
+    # Incremented every time the stored flights of an airport change (used to validate cached HTTP responses)
+    airport_icao = db.Column(db.String(10), primary_key=True)
+    version = db.Column(db.BigInteger, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+
+    def to_dict(self):
+        return {
+            'airport_icao': self.airport_icao,
+            'version': self.version,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+        }
@@ -1,14 +1,88 @@
 import requests
+from requests.adapters import HTTPAdapter
+import asyncio
+import json
 import os
+import queue
 import threading
 import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from datetime import datetime, timedelta
 from circuit_breaker import CircuitBreaker, CircuitBreakerOpenException
+from rate_limiter import TokenBucketRateLimiter
+from json_stream import iter_json_array
+
+class _PrefetchedStream:
+    # Iterator over the flights of a streamed response that a fetch worker downloads in the background.
+    # Flights are handed over in small lists through a bounded queue: memory stays bounded, and the download
+    # only waits when the consumer (the upsert loop) is behind.
+    _END = object()
+
+    def __init__(self, max_chunks, chunk_items=1000):
+        self.queue = queue.Queue(maxsize=max_chunks)
+        self.chunk_items = chunk_items
+        self.cancelled = threading.Event()
+        self.current = iter(())
+        self.finished = False
+
+    def _put(self, item):
+        while not self.cancelled.is_set():
+            try:
+                self.queue.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def fill(self, flights):
+        # Runs on the fetch pool. Returns True once the whole response has been read, False if the consumer gave up;
+        # a download/parse error is forwarded to the consumer and re-raised
+        try:
+            chunk = []
+            for flight in flights:
+                chunk.append(flight)
+                if len(chunk) >= self.chunk_items:
+                    if not self._put(chunk):
+                        return False
+                    chunk = []
+            if chunk and not self._put(chunk):
+                return False
+            return self._put(self._END)
+        except Exception as e:
+            self._put(e)
+            raise
+        finally:
+            flights.close() # Gives the connection back to the pool if we stopped early
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        while True:
+            for flight in self.current:
+                return flight
+            if self.finished:
+                raise StopIteration
+            item = self.queue.get()
+            if item is self._END:
+                self.finished = True
+                raise StopIteration
+            if isinstance(item, Exception):
+                self.finished = True
+                raise item
+            self.current = iter(item)
+
+    def close(self):
+        self.cancelled.set()
 
 class OpenSkyClient:
-    def __init__(self):
-        self.api_url = "https://opensky-network.org/api"
-        self.auth_url = "https://auth.opensky-network.org/auth/realms/opensky-network/protocol/openid-connect/token"
+    ALL_FLIGHTS_MAX_WINDOW = 2 * 3600 # Max interval accepted by /flights/all (seconds)
+    AIRPORT_FLIGHTS_MAX_WINDOW = 7 * 24 * 3600 # Max interval accepted by /flights/departure and /flights/arrival (seconds)
+
+    def __init__(self, rate_wait_histogram=None, remaining_credits_gauge=None, cb_state_gauge=None, cb_transitions_counter=None, cb_rejected_counter=None, service_name='unknown', node_name='unknown'):
+        # Both URLs can be overridden to point the collector at the offline OpenSky mock (see opensky-mock/)
+        self.api_url = os.getenv('OPENSKY_API_URL', "https://opensky-network.org/api")
+        self.auth_url = os.getenv('OPENSKY_AUTH_URL', "https://auth.opensky-network.org/auth/realms/opensky-network/protocol/openid-connect/token")
 
         self.client_id = os.getenv('CLIENT_ID')
         self.client_secret = os.getenv('CLIENT_SECRET')
@@ -19,7 +93,58 @@ class OpenSkyClient:
         # Thread safety lock for authentication to prevent race conditions
         self._auth_lock = threading.Lock()
 
-        self.cb = CircuitBreaker(failure_threshold=3, recovery_timeout=60)
+        # One CircuitBreaker per endpoint: a flaky token endpoint doesn't block data fetches (and vice versa)
+        labels = {'service': service_name, 'node': node_name}
+        self.breakers = {
+            endpoint: CircuitBreaker(
+                name=endpoint,
+                failure_rate_threshold=float(os.getenv('CB_FAILURE_RATE_THRESHOLD', '0.5')),
+                window_seconds=int(os.getenv('CB_WINDOW_SECONDS', '120')),
+                minimum_calls=int(os.getenv('CB_MINIMUM_CALLS', '3')),
+                recovery_timeout=int(os.getenv('CB_RECOVERY_TIMEOUT', '60')),
+                max_recovery_timeout=int(os.getenv('CB_MAX_RECOVERY_TIMEOUT', '600')),
+                state_metric=cb_state_gauge,
+                transitions_metric=cb_transitions_counter,
+                rejected_metric=cb_rejected_counter,
+                labels=labels
+            )
+            for endpoint in ('auth', 'departure', 'arrival', 'all')
+        }
+
+        # CONNECTION POOLING:
+        # A single Session shared by all collector threads keeps TCP/TLS connections alive (HTTP keep-alive),
+        # so we pay the handshake only once per pooled connection instead of once per request.
+        # urllib3's pool is thread-safe, so the Session can be used concurrently.
+        pool_size = int(os.getenv('OPENSKY_POOL_SIZE', '10'))
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=pool_size, max_retries=0) # Retries are handled by our CircuitBreaker, not by urllib3
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+        # Chunk size used when streaming response bodies (see _iter_flights)
+        self.stream_chunk_size = int(os.getenv('OPENSKY_STREAM_CHUNK_SIZE', '65536'))
+        # Lists of 1000 flights a streamed response can be ahead of the upserts (see iter_flights_for_airport)
+        self.stream_prefetch_chunks = int(os.getenv('OPENSKY_STREAM_PREFETCH_CHUNKS', '20'))
+
+        # Worldwide /flights/all slices downloaded at the same time in bulk mode (see get_flights_for_airports)
+        self.bulk_max_slices = max(1, int(os.getenv('OPENSKY_BULK_MAX_SLICES', '2')))
+
+        # Executor used to fetch departures and arrivals of the same airport concurrently
+        self._fetch_executor = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix='opensky-fetch')
+
+        # SHARED RATE LIMITER:
+        # A token bucket shared by every collector thread (and coroutine) paces all OpenSky calls,
+        # and adapts to the remaining credits reported by the API, so we stay just under the quota
+        # instead of bursting and tripping the CircuitBreaker with 429s.
+        self.rate_limiter = TokenBucketRateLimiter(
+            rate=float(os.getenv('OPENSKY_RATE_PER_SECOND', '2')),
+            capacity=int(os.getenv('OPENSKY_RATE_BURST', '2')),
+            low_credits_threshold=int(os.getenv('OPENSKY_LOW_CREDITS_THRESHOLD', '100')),
+            low_credits_rate=float(os.getenv('OPENSKY_LOW_CREDITS_RATE', '0.1')),
+            wait_metric=rate_wait_histogram,
+            credits_metric=remaining_credits_gauge,
+            labels={'service': service_name, 'node': node_name}
+        )
 
     def _make_http_call(self, method, url, **kwargs): # This method is wrapped by the Circuit Breaker (it's like a bridge where we can handle errors)
 
@@ -27,8 +152,12 @@ class OpenSkyClient:
         # If the response is a 5xx or 429, we raise an exception to trigger the CB logic
         # The CB will except these exceptions called here and raise them up to the caller (e.g., get_departures)
 
+        self.rate_limiter.acquire()
+
         response = method(url, **kwargs) # Here is where we make the actual HTTP call
 
+        self.rate_limiter.update_from_headers(response.headers) # Remaining credits / Retry-After feed back into the limiter
+
         if 500 <= response.status_code < 600: # Server Errors (e.g., Internal Server Error, Bad Gateway, etc.)
             raise Exception(f"Server Error: {response.status_code}")
 
@@ -45,7 +174,7 @@ class OpenSkyClient:
             'client_secret': self.client_secret
         }
         try:
-            response = self.cb.call(self._make_http_call, requests.post, self.auth_url, data=payload, timeout=10)
+            response = self.breakers['auth'].call(self._make_http_call, self.session.post, self.auth_url, data=payload, timeout=10)
 
             if response.status_code == 200:
                 data = response.json()
@@ -82,88 +211,298 @@ class OpenSkyClient:
 
         return {'Authorization': f'Bearer {self.token}'}
 
-    def get_departures(self, airport_icao, begin_timestamp=None, end_timestamp=None):
-        if not begin_timestamp:
-            begin_timestamp = int((datetime.now() - timedelta(hours=24)).timestamp())
-        if not end_timestamp:
-            end_timestamp = int(datetime.now().timestamp())
-
-        url = f"{self.api_url}/flights/departure"
-        params = {'airport': airport_icao, 'begin': begin_timestamp, 'end': end_timestamp}
+    def _get_flights(self, endpoint, params, label):
+        url = f"{self.api_url}/flights/{endpoint}"
 
         try:
-            print(f"Recupero partenze da {airport_icao}...", flush=True)
             # We call get_headers() which handles token refresh automatically
-            response = self.cb.call(self._make_http_call, requests.get, url, params=params, headers=self.get_headers(), timeout=30)
+            response = self.breakers[endpoint].call(self._make_http_call, self.session.get, url, params=params, headers=self.get_headers(), timeout=30)
 
             if response.status_code == 200:
                 try:
                     flights = response.json()
                     return flights if flights else []
                 except ValueError:
-                    print(f"Warning: JSON vuoto/invalido per {airport_icao}", flush=True)
-                    raise Exception(f"JSON risposta non valido per {airport_icao}")
+                    print(f"Warning: JSON vuoto/invalido per {label}", flush=True)
+                    raise Exception(f"JSON risposta non valido per {label}")
 
             elif response.status_code == 401:
                 # 401 Explicitly means Token Expired or Invalid.
-                print(f"401 Unauthorized per {airport_icao}. Token scaduto o non valido. Forzo aggiornamento...", flush=True)
+                print(f"401 Unauthorized per {label}. Token scaduto o non valido. Forzo aggiornamento...", flush=True)
 
                 # Set token to None to ensure _perform_login is called next time
                 self.token = None
 
                 # Recursive retry (the next call will trigger get_headers -> login)
-                # Note: Recursive call is also protected by CB because it calls get_departures again
-                return self.get_departures(airport_icao, begin_timestamp, end_timestamp)
+                # Note: Recursive call is also protected by CB because it calls _get_flights again
+                return self._get_flights(endpoint, params, label)
 
             elif response.status_code == 404:
-                print(f"Nessun dato trovato per {airport_icao}", flush=True)
+                print(f"Nessun dato trovato per {label}", flush=True)
                 return []
 
             else:
-                print(f"Errore inatteso {response.status_code} per {airport_icao}", flush=True)
+                print(f"Errore inatteso {response.status_code} per {label}", flush=True)
                 raise Exception(f"Errore API {response.status_code}")
 
         except CircuitBreakerOpenException:
-            print(f"CircuitBreaker OPEN: Saltata richiesta per {airport_icao}", flush=True)
+            print(f"CircuitBreaker OPEN: Saltata richiesta per {label}", flush=True)
             raise
         except Exception as e:
             # Here we handle: 500 errors, 429 Rate Limits, Timeouts, etc.
             print(f"Errore richiesta (Server/Network/RateLimit): {str(e)}", flush=True)
             raise e
 
+    def _iter_flights(self, endpoint, params, label):
+        # STREAMING VARIANT of _get_flights:
+        # the body is read in chunks and parsed incrementally, so flights are yielded one by one
+        # without ever building the full list in memory (busy hubs can return tens of MB per day).
+        url = f"{self.api_url}/flights/{endpoint}"
+
+        try:
+            response = self.breakers[endpoint].call(self._make_http_call, self.session.get, url, params=params, headers=self.get_headers(), timeout=30, stream=True)
+        except CircuitBreakerOpenException:
+            print(f"CircuitBreaker OPEN: Saltata richiesta per {label}", flush=True)
+            raise
+        except Exception as e:
+            print(f"Errore richiesta (Server/Network/RateLimit): {str(e)}", flush=True)
+            raise e
+
+        with response: # Always give the connection back to the pool, even if the consumer stops early
+            if response.status_code == 200:
+                try:
+                    yield from iter_json_array(response.iter_content(chunk_size=self.stream_chunk_size))
+                except ValueError:
+                    print(f"Warning: JSON vuoto/invalido per {label}", flush=True)
+                    raise Exception(f"JSON risposta non valido per {label}")
+
+            elif response.status_code == 401:
+                print(f"401 Unauthorized per {label}. Token scaduto o non valido. Forzo aggiornamento...", flush=True)
+                self.token = None
+                response.close()
+                yield from self._iter_flights(endpoint, params, label)
+
+            elif response.status_code == 404:
+                print(f"Nessun dato trovato per {label}", flush=True)
+
+            else:
+                print(f"Errore inatteso {response.status_code} per {label}", flush=True)
+                raise Exception(f"Errore API {response.status_code}")
+
+    def iter_departures(self, airport_icao, begin_timestamp, end_timestamp):
+        print(f"Recupero (streaming) partenze da {airport_icao}...", flush=True)
+        params = {'airport': airport_icao, 'begin': begin_timestamp, 'end': end_timestamp}
+        return self._iter_flights('departure', params, airport_icao)
+
+    def iter_arrivals(self, airport_icao, begin_timestamp, end_timestamp):
+        print(f"Recupero (streaming) arrivi a {airport_icao}...", flush=True)
+        params = {'airport': airport_icao, 'begin': begin_timestamp, 'end': end_timestamp}
+        return self._iter_flights('arrival', params, airport_icao)
+
+    def iter_flights_for_airport(self, airport_icao, begin_timestamp, end_timestamp, arrivals_begin_timestamp=None, on_done=None):
+        # STREAMING + CONCURRENT: like get_flights_for_airport, both requests run at the same time on the fetch pool,
+        # but the flights are returned as iterators filled while the responses are downloaded.
+        # on_done(success) is called once both responses have been read to the end (or one of them failed);
+        # the consumer must close() the iterators if it stops early.
+        if arrivals_begin_timestamp is None:
+            arrivals_begin_timestamp = begin_timestamp
+
+        departures = _PrefetchedStream(self.stream_prefetch_chunks)
+        arrivals = _PrefetchedStream(self.stream_prefetch_chunks)
+        futures = [
+            self._fetch_executor.submit(departures.fill, self.iter_departures(airport_icao, begin_timestamp, end_timestamp)),
+            self._fetch_executor.submit(arrivals.fill, self.iter_arrivals(airport_icao, arrivals_begin_timestamp, end_timestamp))
+        ]
+
+        if on_done:
+            pending = [len(futures)]
+            lock = threading.Lock()
+
+            def report(_):
+                with lock:
+                    pending[0] -= 1
+                    if pending[0]:
+                        return
+                if any(f.exception() for f in futures):
+                    on_done(False)
+                elif all(f.result() for f in futures): # Not reported if the consumer stopped reading
+                    on_done(True)
+
+            for future in futures:
+                future.add_done_callback(report)
+
+        return {'departures': departures, 'arrivals': arrivals}
+
+    def get_departures(self, airport_icao, begin_timestamp=None, end_timestamp=None):
+        if not begin_timestamp:
+            begin_timestamp = int((datetime.now() - timedelta(hours=24)).timestamp())
+        if not end_timestamp:
+            end_timestamp = int(datetime.now().timestamp())
+
+        print(f"Recupero partenze da {airport_icao}...", flush=True)
+        params = {'airport': airport_icao, 'begin': begin_timestamp, 'end': end_timestamp}
+        return self._get_flights('departure', params, airport_icao)
+
     def get_arrivals(self, airport_icao, begin_timestamp=None, end_timestamp=None):
         if not begin_timestamp:
             begin_timestamp = int((datetime.now() - timedelta(hours=24)).timestamp())
         if not end_timestamp:
             end_timestamp = int(datetime.now().timestamp())
 
-        url = f"{self.api_url}/flights/arrival"
+        print(f"Recupero arrivi a {airport_icao}...", flush=True)
+        params = {'airport': airport_icao, 'begin': begin_timestamp, 'end': end_timestamp}
+        return self._get_flights('arrival', params, airport_icao)
+
+    def iter_all_flights(self, begin_timestamp, end_timestamp):
+        # /flights/all returns every flight of the network in the interval (OpenSky allows at most 2 hours per call):
+        # a worldwide slice is always streamed, never loaded as a whole
+        print(f"Recupero (streaming) tutti i voli tra {begin_timestamp} e {end_timestamp}...", flush=True)
+        params = {'begin': begin_timestamp, 'end': end_timestamp}
+        return self._iter_flights('all', params, f"intervallo {begin_timestamp}-{end_timestamp}")
+
+    def _filter_all_flights(self, monitored, begin_timestamp, end_timestamp):
+        # Runs on the fetch pool: the slice is parsed while it is downloaded and only the flights
+        # of monitored airports are kept, so memory depends on them and not on the whole network
+        departures, arrivals = [], []
+        for flight in self.iter_all_flights(begin_timestamp, end_timestamp):
+            if not flight.get('icao24') or not flight.get('firstSeen'):
+                continue
+            if flight.get('estDepartureAirport') in monitored:
+                departures.append(flight)
+            if flight.get('estArrivalAirport') in monitored:
+                arrivals.append(flight)
+        return departures, arrivals
+
+    def get_flights_for_airport(self, airport_icao, begin_timestamp=None, end_timestamp=None, arrivals_begin_timestamp=None): # We do not use trying/catching here, we let exceptions propagate to the caller
+
+        # Departures and arrivals can have different watermarks, so arrivals may start from their own timestamp
+        if arrivals_begin_timestamp is None:
+            arrivals_begin_timestamp = begin_timestamp
+
+        # Departures and arrivals are independent, so we fetch them concurrently over the pooled session:
+        # the airport costs about one round-trip instead of two plus a sleep (pacing is done by the shared rate limiter).
+        departures_future = self._fetch_executor.submit(self.get_departures, airport_icao, begin_timestamp, end_timestamp)
+        arrivals_future = self._fetch_executor.submit(self.get_arrivals, airport_icao, arrivals_begin_timestamp, end_timestamp)
+
+        departures = departures_future.result() # If one of the calls fails, .result() re-raises its exception here
+        arrivals = arrivals_future.result()
+
+        return {
+            'departures': departures,
+            'arrivals': arrivals,
+            'total': len(departures) + len(arrivals)
+        }
+
+    def get_flights_for_airports(self, airport_icaos, begin_timestamp, end_timestamp):
+        # BULK MODE:
+        # Instead of 2 calls per airport, we pull /flights/all in slices of at most ALL_FLIGHTS_MAX_WINDOW seconds
+        # and split each slice locally into per-airport departure/arrival buckets while it is parsed.
+        # The number of calls now depends on the window length, not on the number of airports.
+        monitored = set(airport_icaos)
+        buckets = {icao: {'departures': {}, 'arrivals': {}} for icao in monitored}
+
+        slices = []
+        slice_begin = begin_timestamp
+        while slice_begin < end_timestamp:
+            slice_end = min(slice_begin + self.ALL_FLIGHTS_MAX_WINDOW, end_timestamp)
+            slices.append((slice_begin, slice_end))
+            slice_begin = slice_end
+
+        # At most 'bulk_max_slices' slices are downloaded at the same time: the next one starts when one is done
+        remaining = iter(slices)
+        pending = set()
+
+        def submit_next():
+            next_slice = next(remaining, None)
+            if next_slice:
+                pending.add(self._fetch_executor.submit(self._filter_all_flights, monitored, *next_slice))
+
+        for _ in range(self.bulk_max_slices):
+            submit_next()
+
+        try:
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    pending.discard(future)
+                    departures, arrivals = future.result()
+                    for flight in departures:
+                        key = (flight['icao24'], flight['firstSeen']) # Same flight can show up in adjacent slices
+                        buckets[flight['estDepartureAirport']]['departures'][key] = flight
+                    for flight in arrivals:
+                        key = (flight['icao24'], flight['firstSeen'])
+                        buckets[flight['estArrivalAirport']]['arrivals'][key] = flight
+                    submit_next()
+        finally:
+            for future in pending:
+                future.cancel() # After an error, slices that didn't start yet are not downloaded
+
+        print(f"Bulk: {len(slices)} chiamate /flights/all per {len(monitored)} aeroporti.", flush=True)
+
+        result = {}
+        for icao, bucket in buckets.items():
+            departures = list(bucket['departures'].values())
+            arrivals = list(bucket['arrivals'].values())
+            result[icao] = {
+                'departures': departures,
+                'arrivals': arrivals,
+                'total': len(departures) + len(arrivals)
+            }
+        return result
+
+    # ---------------- ASYNCIO VARIANTS (used by the asyncio collection engine) ----------------
+    # The HTTP session is owned by the caller (it must live on the caller's event loop), while
+    # token, rate limiter and CircuitBreaker are the same objects shared with the threaded path.
+
+    async def _get_headers_async(self):
+        if self._is_token_expired():
+            # Login is rare and uses the blocking Session, so we move it off the event loop
+            return await asyncio.to_thread(self.get_headers)
+        return {'Authorization': f'Bearer {self.token}'}
+
+    async def _make_http_call_async(self, http_session, url, params):
+        await self.rate_limiter.acquire_async()
+
+        headers = await self._get_headers_async()
+        async with http_session.get(url, params=params, headers=headers) as response:
+            self.rate_limiter.update_from_headers(response.headers)
+
+            if 500 <= response.status < 600:
+                raise Exception(f"Server Error: {response.status}")
+
+            if response.status == 429:
+                raise Exception("Rate Limit Exceeded")
+
+            body = await response.read() if response.status == 200 else None
+            return response.status, body
+
+    async def _get_flights_async(self, http_session, endpoint, airport_icao, begin_timestamp, end_timestamp):
+        url = f"{self.api_url}/flights/{endpoint}"
         params = {'airport': airport_icao, 'begin': begin_timestamp, 'end': end_timestamp}
 
         try:
-            print(f"Recupero arrivi a {airport_icao}...", flush=True)
-            response = self.cb.call(self._make_http_call, requests.get, url, params=params, headers=self.get_headers(), timeout=30)
+            status, body = await self.breakers[endpoint].call_async(self._make_http_call_async, http_session, url, params)
 
-            if response.status_code == 200:
+            if status == 200:
                 try:
-                    flights = response.json()
+                    flights = json.loads(body) if body else []
                     return flights if flights else []
                 except ValueError:
                     print(f"Warning: JSON vuoto/invalido per {airport_icao}", flush=True)
                     raise Exception(f"JSON risposta non valido per {airport_icao}")
 
-            elif response.status_code == 401:
+            elif status == 401:
                 print(f"401 Unauthorized per {airport_icao}. Token scaduto. Forzo aggiornamento...", flush=True)
                 self.token = None
-                return self.get_arrivals(airport_icao, begin_timestamp, end_timestamp)
+                return await self._get_flights_async(http_session, endpoint, airport_icao, begin_timestamp, end_timestamp)
 
-            elif response.status_code == 404:
+            elif status == 404:
                 print(f"Nessun dato trovato per {airport_icao}", flush=True)
                 return []
 
             else:
-                print(f"Errore inatteso {response.status_code} per {airport_icao}", flush=True)
-                raise Exception(f"Errore API {response.status_code}")
+                print(f"Errore inatteso {status} per {airport_icao}", flush=True)
+                raise Exception(f"Errore API {status}")
 
         except CircuitBreakerOpenException:
             print(f"CircuitBreaker OPEN: Saltata richiesta per {airport_icao}", flush=True)
@@ -172,16 +511,21 @@ class OpenSkyClient:
             print(f"Errore richiesta (Server/Network/RateLimit): {str(e)}", flush=True)
             raise e
 
-    def get_flights_for_airport(self, airport_icao, begin_timestamp=None, end_timestamp=None): # We do not use trying/catching here, we let exceptions propagate to the caller
-
-        departures = self.get_departures(airport_icao, begin_timestamp, end_timestamp)
+    async def get_flights_for_airport_async(self, http_session, airport_icao, begin_timestamp, end_timestamp, arrivals_begin_timestamp=None):
+        if arrivals_begin_timestamp is None:
+            arrivals_begin_timestamp = begin_timestamp
 
-        time.sleep(0.5)
-
-        arrivals = self.get_arrivals(airport_icao, begin_timestamp, end_timestamp)
+        departures, arrivals = await asyncio.gather(
+            self._get_flights_async(http_session, 'departure', airport_icao, begin_timestamp, end_timestamp),
+            self._get_flights_async(http_session, 'arrival', airport_icao, arrivals_begin_timestamp, end_timestamp)
+        )
 
         return {
             'departures': departures,
             'arrivals': arrivals,
             'total': len(departures) + len(arrivals)
         }
+
+    def close(self):
+        self._fetch_executor.shutdown(wait=False)
+        self.session.close()
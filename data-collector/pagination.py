@@ -0,0 +1,19 @@
+from datetime import datetime
+import base64
+import json
+
+# Keyset pagination on (collected_at, id): the cursor is the position of the last row returned,
+# encoded so that clients treat it as an opaque token
+
+def encode_cursor(collected_at, row_id):
+    payload = json.dumps([collected_at.isoformat() if collected_at else None, row_id], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+def decode_cursor(token):
+    # Raises ValueError on a malformed cursor
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        collected_at, row_id = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')).decode('utf-8'))
+        return (datetime.fromisoformat(collected_at) if collected_at else None), int(row_id)
+    except Exception:
+        raise ValueError("Cursor non valido")
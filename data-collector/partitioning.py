@@ -0,0 +1,104 @@
+from database import db
+from sqlalchemy import text
+from datetime import datetime, timedelta, timezone
+import os
+
+class FlightPartitionManager:
+    TABLE = 'flight_data'
+
+    def __init__(self, retention_days):
+        # RANGE partitioning on 'first_seen' (one partition per day or week). MySQL requires the partitioning column
+        # in every unique key: 'first_seen' already is in 'unique_flight' (so the upsert keeps working unchanged) and
+        # is added to the primary key. 'collected_at' can't be used: it changes on every upsert and isn't in the unique key.
+        # The batched retention DELETEs use 'first_seen' as well, so both paths expire the same flights.
+        # Converting the table is an explicit migration (partition_table(), POST /maintenance/partitioning):
+        # it rewrites the whole table, so it never runs implicitly inside the retention job.
+        self.enabled = os.getenv('FLIGHT_PARTITIONING', 'false').strip().lower() == 'true'
+        self.granularity = os.getenv('FLIGHT_PARTITION_GRANULARITY', 'day').strip().lower() # 'day' or 'week'
+        self.precreate = int(os.getenv('FLIGHT_PARTITION_PRECREATE', '7')) # Future partitions kept ready
+        self.retention_days = retention_days # Partitions entirely older than this are dropped
+
+    def _period_start(self, dt):
+        start = datetime(dt.year, dt.month, dt.day, tzinfo=timezone.utc)
+        if self.granularity == 'week':
+            start -= timedelta(days=start.weekday())
+        return start
+
+    def _next_period(self, start):
+        return start + timedelta(days=7 if self.granularity == 'week' else 1)
+
+    def _partition_clause(self, start):
+        # The partition named after its first day holds the flights with first_seen in [start, next period)
+        upper = int(self._next_period(start).timestamp())
+        return f"PARTITION p{start.strftime('%Y%m%d')} VALUES LESS THAN ({upper})"
+
+    def _list_partitions(self):
+        rows = db.session.execute(text(
+            "SELECT PARTITION_NAME, PARTITION_DESCRIPTION, TABLE_ROWS FROM information_schema.PARTITIONS "
+            "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :table ORDER BY PARTITION_ORDINAL_POSITION"
+        ), {'table': self.TABLE}).all()
+        return [row for row in rows if row[0] is not None]
+
+    def partition_table(self):
+        # One-off migration (blocking: ALTER TABLE copies flight_data). Returns False if already partitioned.
+        if self._list_partitions():
+            return False
+
+        now = datetime.now(timezone.utc)
+        print(f"[Partitioning] Conversione di {self.TABLE} in tabella partizionata per {self.granularity}...", flush=True)
+
+        pk_columns = db.session.execute(text(
+            "SELECT COLUMN_NAME FROM information_schema.KEY_COLUMN_USAGE "
+            "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :table AND CONSTRAINT_NAME = 'PRIMARY'"
+        ), {'table': self.TABLE}).scalars().all()
+        if 'first_seen' not in pk_columns:
+            # Tables created before partitioning support have PRIMARY KEY (id)
+            db.session.execute(text(f"ALTER TABLE {self.TABLE} DROP PRIMARY KEY, ADD PRIMARY KEY (id, first_seen)"))
+
+        # Everything older than the retention goes into a single 'p_history' partition (dropped at the next run)
+        first = self._period_start(now - timedelta(days=self.retention_days))
+        clauses = [f"PARTITION p_history VALUES LESS THAN ({int(first.timestamp())})"]
+        start = first
+        while start <= now:
+            clauses.append(self._partition_clause(start))
+            start = self._next_period(start)
+        clauses.append("PARTITION pmax VALUES LESS THAN MAXVALUE")
+
+        db.session.execute(text(f"ALTER TABLE {self.TABLE} PARTITION BY RANGE (first_seen) ({', '.join(clauses)})"))
+        print(f"[Partitioning] {self.TABLE} partizionata ({len(clauses)} partizioni).", flush=True)
+        return True
+
+    def maintain(self):
+        # Returns the (estimated) number of rows removed by dropping expired partitions
+        if not self.enabled:
+            return 0
+
+        now = datetime.now(timezone.utc)
+        partitions = self._list_partitions()
+        if not partitions:
+            print(f"[Partitioning] {self.TABLE} non è ancora partizionata: eseguire la migrazione (POST /maintenance/partitioning).", flush=True)
+            return 0
+
+        # Future partitions: 'pmax' is empty in steady state, so splitting it is instantaneous
+        bounded = [(name, int(upper)) for name, upper, _ in partitions if upper != 'MAXVALUE']
+        last_upper = datetime.fromtimestamp(bounded[-1][1], timezone.utc) if bounded else self._period_start(now)
+        target = self._period_start(now + timedelta(days=self.precreate * (7 if self.granularity == 'week' else 1)))
+
+        clauses = []
+        start = last_upper
+        while start <= target:
+            clauses.append(self._partition_clause(start))
+            start = self._next_period(start)
+        if clauses:
+            clauses.append("PARTITION pmax VALUES LESS THAN MAXVALUE")
+            db.session.execute(text(f"ALTER TABLE {self.TABLE} REORGANIZE PARTITION pmax INTO ({', '.join(clauses)})"))
+            print(f"[Partitioning] Create {len(clauses) - 1} nuove partizioni.", flush=True)
+
+        # Expired partitions: DROP PARTITION is a metadata operation, no row-by-row DELETE
+        cutoff = int((now - timedelta(days=self.retention_days)).timestamp())
+        expired = [(name, rows or 0) for name, upper, rows in partitions if upper != 'MAXVALUE' and int(upper) <= cutoff]
+        if expired:
+            db.session.execute(text(f"ALTER TABLE {self.TABLE} DROP PARTITION {', '.join(name for name, _ in expired)}"))
+            print(f"[Partitioning] Eliminate {len(expired)} partizioni scadute ({', '.join(name for name, _ in expired)}).", flush=True)
+
+        return sum(rows for _, rows in expired)
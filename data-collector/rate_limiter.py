@@ -0,0 +1,99 @@
+import time
+import threading
+import asyncio
+
+class TokenBucketRateLimiter:
+    def __init__(self, rate=2.0, capacity=2, low_credits_threshold=100, low_credits_rate=0.1, wait_metric=None, credits_metric=None, labels=None):
+        self.rate = rate                  # Tokens added per second (steady request rate)
+        self.capacity = capacity          # Max burst size
+        self.tokens = float(capacity)
+        self.last_refill = time.monotonic()
+
+        # OpenSky reports the remaining API credits in the response headers: when they get low,
+        # we slow down to 'low_credits_rate' so that the quota is not exhausted before it resets.
+        self.low_credits_threshold = low_credits_threshold
+        self.low_credits_rate = low_credits_rate
+        self.remaining_credits = None
+
+        # If the server tells us to back off (429 + Retry-After), nobody gets a token before this instant
+        self.blocked_until = 0.0
+
+        self.wait_metric = wait_metric         # Prometheus Histogram: time spent waiting for a token
+        self.credits_metric = credits_metric   # Prometheus Gauge: remaining credits reported by OpenSky
+        self.labels = labels or {}
+
+        # The lock is only held to reserve a token (never while sleeping), so the same limiter
+        # can be shared by the collector threads and by coroutines running on an event loop.
+        self.lock = threading.Lock()
+
+    def _current_rate(self):
+        if self.remaining_credits is not None and self.remaining_credits <= self.low_credits_threshold:
+            return min(self.rate, self.low_credits_rate)
+        return self.rate
+
+    def _reserve(self):
+        with self.lock:
+            now = time.monotonic()
+            rate = self._current_rate()
+
+            # During a Retry-After block 'last_refill' is the end of the block: nothing refills before it
+            if now > self.last_refill:
+                self.tokens = min(self.capacity, self.tokens + (now - self.last_refill) * rate)
+                self.last_refill = now
+
+            # The token is always taken: if the bucket is empty it goes negative ("debt"),
+            # and the caller waits for the time needed to pay it back. This keeps the ordering fair (FIFO).
+            # The debt is paid back from the end of the block, so callers queued during it are still spaced out.
+            self.tokens -= 1
+            debt = -self.tokens / rate if self.tokens < 0 else 0.0
+
+            return max(0.0, self.last_refill - now) + debt
+
+    def _observe(self, wait):
+        if self.wait_metric:
+            self.wait_metric.labels(**self.labels).observe(wait)
+
+    def acquire(self):
+        wait = self._reserve()
+        self._observe(wait)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    async def acquire_async(self):
+        wait = self._reserve()
+        self._observe(wait)
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return wait
+
+    def update_from_headers(self, headers):
+        if not headers:
+            return
+
+        remaining = headers.get('X-Rate-Limit-Remaining')
+        if remaining is not None:
+            try:
+                with self.lock:
+                    self.remaining_credits = int(remaining)
+                if self.credits_metric:
+                    self.credits_metric.labels(**self.labels).set(self.remaining_credits)
+            except ValueError:
+                pass
+
+        retry_after = headers.get('X-Rate-Limit-Retry-After-Seconds') or headers.get('Retry-After')
+        if retry_after is not None:
+            try:
+                self.block_for(float(retry_after))
+            except ValueError:
+                pass
+
+    def block_for(self, seconds):
+        with self.lock:
+            now = time.monotonic()
+            if now > self.last_refill:
+                self.tokens = min(self.capacity, self.tokens + (now - self.last_refill) * self._current_rate())
+            self.blocked_until = max(self.blocked_until, now + seconds)
+            self.last_refill = max(self.last_refill, self.blocked_until) # Tokens start refilling when the block ends
+            self.tokens = min(self.tokens, 0) # Empty the bucket so no burst is released when the block ends
+        print(f"RateLimiter: richieste sospese per {seconds:.0f}s (indicato da OpenSky).", flush=True)
@@ -0,0 +1,44 @@
+from collections import OrderedDict
+import hashlib
+import threading
+
+class ResponseCache:
+    def __init__(self, max_entries=1000, max_bytes=64 * 1024 * 1024):
+        # LRU of rendered response bodies. The airport data version is part of the key, so entries are never
+        # invalidated explicitly: after a bump they are simply not requested anymore and age out.
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict() # key -> (body, mimetype)
+        self.size = 0
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def make_key(endpoint, airport_icao, params, version):
+        # Query parameters are normalized (sorted, 'email' excluded: the user checks run before the cache)
+        normalized = tuple(sorted((k, v) for k, v in params.items(multi=True) if k != 'email'))
+        return (endpoint, airport_icao, normalized, version)
+
+    @staticmethod
+    def etag(key):
+        # Unquoted: Response.set_etag adds the quotes
+        return hashlib.sha1(repr(key).encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+            return entry
+
+    def put(self, key, body, mimetype):
+        if self.max_entries <= 0 or len(body) > self.max_bytes:
+            return
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.size -= len(old[0])
+            self.entries[key] = (body, mimetype)
+            self.size += len(body)
+            while self.entries and (len(self.entries) > self.max_entries or self.size > self.max_bytes):
+                _, (evicted, _) = self.entries.popitem(last=False)
+                self.size -= len(evicted)
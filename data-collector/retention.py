@@ -0,0 +1,142 @@
+from database import db
+from models import UserInterest, FlightData
+from partitioning import FlightPartitionManager
+from flight_stats import DailyStatsRollup
+from sqlalchemy import select, delete
+from datetime import timedelta
+import time
+import math
+import os
+
+class RetentionManager:
+    def __init__(self, app, min_age_seconds=0, data_versions=None, on_airports_removed=None, deleted_counter=None, duration_gauge=None, labels=None):
+        self.app = app
+
+        # Default max age of a flight (on 'first_seen', like the partitions) and per-airport overrides, e.g. "KJFK=7,LIRF=90"
+        self.default_days = int(os.getenv('FLIGHT_RETENTION_DAYS', '30'))
+        self.overrides = {}
+        for item in os.getenv('FLIGHT_RETENTION_OVERRIDES', '').split(','):
+            if '=' in item:
+                icao, days = item.split('=', 1)
+                self.overrides[icao.strip().upper()] = int(days)
+
+        # Rows still inside the collection window must never expire: the change-detection cache
+        # would otherwise skip re-inserting them
+        self.min_age_seconds = min_age_seconds
+
+        # Small batches, walked in primary-key order, with a pause in between: every DELETE holds its locks
+        # only for a few milliseconds and the collection writers are never blocked for long
+        self.batch_size = int(os.getenv('RETENTION_BATCH_SIZE', '1000'))
+        self.batch_pause = int(os.getenv('RETENTION_BATCH_PAUSE_MS', '100')) / 1000.0
+
+        # With partitioning enabled, whole days/weeks older than the longest retention are dropped as partitions;
+        # the batched DELETEs below only deal with shorter per-airport retentions and unmonitored airports
+        self.partitions = FlightPartitionManager(max([self.default_days, math.ceil(min_age_seconds / 86400)] + list(self.overrides.values())))
+
+        self.daily_stats = DailyStatsRollup()
+        self.data_versions = data_versions # Bumped for the airports whose flights were removed
+        # Drops the change-detection digests of garbage-collected airports (on this replica; the others
+        # re-warm when the airport is monitored again, see FlightDigestCache.retain_airports)
+        self.on_airports_removed = on_airports_removed
+
+        self.deleted_counter = deleted_counter # Prometheus Counter: rows removed, by reason (expired, unmonitored, partition_dropped)
+        self.duration_gauge = duration_gauge   # Prometheus Gauge: duration of the last retention run
+        self.labels = labels or {}
+
+    def max_age_days(self, airport_icao):
+        return self.overrides.get(airport_icao, self.default_days)
+
+    def max_age(self, airport_icao):
+        # Effective max age (never inside the collection window). Also the limit for backfilled history:
+        # older flights would be deleted (or their partition dropped) by the next run
+        return max(timedelta(days=self.max_age_days(airport_icao)), timedelta(seconds=self.min_age_seconds))
+
+    def _delete_in_batches(self, *conditions):
+        deleted = 0
+        last_id = 0
+        while True:
+            ids = db.session.execute(
+                select(FlightData.id)
+                .where(FlightData.id > last_id, *conditions)
+                .order_by(FlightData.id)
+                .limit(self.batch_size)
+            ).scalars().all()
+            if not ids:
+                break
+
+            result = db.session.execute(delete(FlightData).where(FlightData.id.in_(ids)))
+            db.session.commit()
+            deleted += result.rowcount
+            last_id = ids[-1]
+
+            if len(ids) < self.batch_size:
+                break
+            time.sleep(self.batch_pause)
+
+        return deleted
+
+    def _record(self, reason, deleted):
+        if self.deleted_counter and deleted:
+            self.deleted_counter.labels(**self.labels, reason=reason).inc(deleted)
+
+    def run(self):
+        start_time = time.time()
+        expired_total = 0
+        unmonitored_total = 0
+
+        with self.app.app_context():
+            dropped = 0
+            try:
+                dropped = self.partitions.maintain()
+                db.session.commit()
+                self._record('partition_dropped', dropped)
+            except Exception as e:
+                db.session.rollback()
+                print(f"[Partitioning] Errore manutenzione partizioni: {e}", flush=True)
+
+            try:
+                active_airports = set(db.session.execute(select(UserInterest.airport_icao).distinct()).scalars().all())
+                stored_airports = set(db.session.execute(select(FlightData.airport_icao).distinct()).scalars().all())
+
+                # The daily stats outlive the raw rows (they are kept after expiry), but not the airport's monitoring
+                self.daily_stats.retain_airports(active_airports)
+                db.session.commit()
+
+                # Garbage Collection: flights of airports nobody monitors anymore
+                for icao in sorted(stored_airports - active_airports):
+                    deleted = self._delete_in_batches(FlightData.airport_icao == icao)
+                    self._record('unmonitored', deleted)
+                    unmonitored_total += deleted
+
+                    # If the airport is monitored again, its cached responses (flights and stats) must not be served
+                    if self.data_versions:
+                        self.data_versions.bump(icao)
+
+                    if self.on_airports_removed:
+                        self.on_airports_removed([icao])
+
+                # Retention: flights older than the max age of their airport
+                for icao in sorted(stored_airports & active_airports):
+                    cutoff = int(time.time() - self.max_age(icao).total_seconds())
+                    deleted = self._delete_in_batches(FlightData.airport_icao == icao, FlightData.first_seen < cutoff)
+                    self._record('expired', deleted)
+                    expired_total += deleted
+
+                    if self.data_versions and (deleted or dropped):
+                        self.data_versions.bump(icao)
+
+            except Exception as e:
+                db.session.rollback()
+                print(f"[Retention] Errore durante la pulizia voli: {e}", flush=True)
+
+            finally:
+                db.session.remove()
+
+        elapsed = time.time() - start_time
+        if self.duration_gauge:
+            self.duration_gauge.labels(**self.labels).set(elapsed)
+
+        if expired_total or unmonitored_total:
+            print(f"[Retention] Rimossi {expired_total} voli scaduti e {unmonitored_total} voli di aeroporti non monitorati in {elapsed:.1f}s.", flush=True)
+        else:
+            print("[Retention] Nessun volo da pulire.", flush=True)
@@ -1,21 +1,30 @@
 from apscheduler.schedulers.background import BackgroundScheduler
 from database import db
-from models import UserInterest, FlightData
+from models import UserInterest, FlightData, FetchWatermark
 from opensky_client import OpenSkyClient
-from datetime import datetime
+from single_flight import SingleFlight
+from flight_cache import FlightDigestCache
+from flight_writer import FlightWriter
+from retention import RetentionManager
+from flight_stats import DailyStatsRollup, airline_prefix
+from data_version import AirportDataVersions
+from sharding import ReplicaMembership
+from datetime import datetime, timezone, timedelta
 from flask import Flask
 from concurrent.futures import ThreadPoolExecutor, as_completed
 import threading
-from sqlalchemy import select, delete, not_
+from sqlalchemy import select, func, or_, and_
 from sqlalchemy.dialects.mysql import insert # Importing the specific MySQL dialect 'insert' to enable the ON DUPLICATE KEY UPDATE' feature (Upsert).
 from kafka import KafkaProducer
 import json
 import os
 import time
 import random
+import math
 
 class DataCollectorScheduler:
-    def __init__(self, app: Flask, db, opensky_client: OpenSkyClient, opensky_counter=None, processing_gauge=None, service_name='unknown', node_name='unknown'):
+    def __init__(self, app: Flask, db, opensky_client: OpenSkyClient, opensky_counter=None, processing_gauge=None,
+                 retention_deleted_counter=None, retention_duration_gauge=None, service_name='unknown', node_name='unknown'):
         self.app = app
         self.db = db
         self.opensky_client = opensky_client
@@ -32,11 +41,117 @@ class DataCollectorScheduler:
 
         self.kafka_lock = threading.Lock()
 
-        # CONCURRENCY CONTROL:
-        # Set to track airports currently being updated to avoid race conditions
-        # between manual triggers and the periodic job.
-        self.processing_airports = set()
-        self.processing_lock = threading.Lock()
+        # CONCURRENCY CONTROL (SINGLE-FLIGHT):
+        # At most one collection per airport is in flight. A second caller for the same airport (e.g. a manual
+        # trigger during the periodic job) doesn't start a duplicate OpenSky call and isn't silently dropped:
+        # it waits for the in-flight collection and gets its outcome. If that collection started too long ago
+        # for the caller (more than 'freshness_seconds'), a single rerun is queued right after it.
+        self.single_flight = SingleFlight()
+        self.freshness_seconds = int(os.getenv('SINGLE_FLIGHT_FRESHNESS_SECONDS', '300'))
+
+        # INCREMENTAL FETCHING:
+        # Each airport/direction keeps a persisted watermark (end of the last successful fetch window),
+        # so every run only asks OpenSky for the flights since then (minus a small overlap for late updates),
+        # instead of re-downloading the whole lookback window each time.
+        self.lookback_hours = int(os.getenv('COLLECTION_LOOKBACK_HOURS', '24'))
+        self.watermark_overlap_seconds = int(os.getenv('WATERMARK_OVERLAP_MINUTES', '120')) * 60
+
+        # Pacing towards OpenSky is done by the client's shared rate limiter, so parallelism is configurable
+        self.max_workers = int(os.getenv('COLLECTION_MAX_WORKERS', '5'))
+
+        # STREAMING:
+        # When enabled, departures/arrivals are parsed incrementally from the HTTP body and written
+        # in batches of 'upsert_batch_size' rows, so per-worker memory doesn't grow with the airport size.
+        self.streaming = os.getenv('OPENSKY_STREAMING', 'false').strip().lower() == 'true'
+        self.upsert_batch_size = int(os.getenv('UPSERT_BATCH_SIZE', '500'))
+
+        # CHUNKED UPSERTS:
+        # The upsert statement is built once and reused for every chunk: rows are passed as a parameter list
+        # (executemany), so SQLAlchemy compiles it a single time (compiled cache) and PyMySQL packs the chunk
+        # into multi-row INSERTs. Only a failed chunk is retried, never the whole airport.
+        self.upsert_max_retries = int(os.getenv('UPSERT_MAX_RETRIES', '5'))
+        self.upsert_statement = self._build_upsert_statement()
+
+        # CHANGE DETECTION:
+        # Overlapping windows re-fetch mostly flights that are already stored and unchanged. A bounded LRU of
+        # digests (airport_icao, icao24, first_seen) -> mutable columns, warmed from the DB on the first save of
+        # each airport, lets _save_flights send MySQL only new or changed rows. 0 disables it.
+        self.flight_cache = FlightDigestCache(int(os.getenv('CHANGE_DETECTION_CACHE_SIZE', '100000')))
+
+        # DATA VERSIONS:
+        # Bumped after every save that changed an airport's flights: cached HTTP responses are keyed on it
+        self.data_versions = AirportDataVersions(int(os.getenv('DATA_VERSION_TTL_SECONDS', '5')))
+
+        # DAILY ROLLUP:
+        # flight_daily_stats (airport, day, direction) -> flights is incremented in the same transaction
+        # as every upsert, counting only the flights that weren't stored yet
+        self.daily_stats = DailyStatsRollup(data_versions=self.data_versions)
+
+        # WRITE PIPELINE:
+        # Collector threads don't write flight_data themselves: they hand their chunks to a few dedicated writer
+        # threads (bounded queues), which merge chunks of different airports into large key-ordered batches and
+        # commit each batch in a single transaction. Fetching keeps going while the writers commit, and since
+        # an airport always goes to the same writer, concurrent upserts no longer deadlock each other.
+        self.write_pipeline = os.getenv('WRITE_PIPELINE', 'true').strip().lower() == 'true'
+        self.write_locks = {} # airport_icao -> Lock, used when the pipeline is disabled (see _write_chunk)
+        self.write_locks_lock = threading.Lock()
+        self.writer = FlightWriter(
+            app,
+            self.upsert_statement,
+            num_writers=int(os.getenv('WRITER_THREADS', '1')),
+            queue_size=int(os.getenv('WRITER_QUEUE_SIZE', '100')),
+            batch_rows=int(os.getenv('WRITER_BATCH_ROWS', '5000')),
+            max_wait_ms=int(os.getenv('WRITER_MAX_WAIT_MS', '200')),
+            max_retries=self.upsert_max_retries,
+            before_write=self.daily_stats.record,
+            on_commit=self.flight_cache.store if self.flight_cache.enabled else None
+        )
+
+        # RETENTION:
+        # Expired flights (per-airport max age) and flights of unmonitored airports are deleted by a separate
+        # job, in small primary-key-ordered batches, instead of one big DELETE inside every collection run.
+        self.retention = RetentionManager(
+            app,
+            min_age_seconds=self.lookback_hours * 3600 + self.watermark_overlap_seconds + 86400,
+            data_versions=self.data_versions,
+            on_airports_removed=self.flight_cache.drop_airports,
+            deleted_counter=retention_deleted_counter,
+            duration_gauge=retention_duration_gauge,
+            labels=self.common_labels
+        )
+        self.retention_interval_minutes = int(os.getenv('RETENTION_INTERVAL_MINUTES', '60'))
+
+        # BULK MODE:
+        # Above this number of monitored airports, the periodic job uses /flights/all (calls scale with the window)
+        # instead of /flights/departure + /flights/arrival per airport (calls scale with the airports). 0 disables it.
+        self.bulk_min_airports = int(os.getenv('BULK_COLLECTION_MIN_AIRPORTS', '20'))
+
+        # ADAPTIVE SCHEDULING:
+        # Instead of one global job refreshing every airport at once, each airport gets its own job whose
+        # interval depends on its traffic, its number of subscribers and how close the recent counts are
+        # to the users' thresholds. A planner job periodically recomputes the intervals.
+        self.adaptive = os.getenv('ADAPTIVE_SCHEDULING', 'false').strip().lower() == 'true'
+        self.adaptive_planner_minutes = int(os.getenv('ADAPTIVE_PLANNER_MINUTES', '30'))
+        self.adaptive_min_minutes = int(os.getenv('ADAPTIVE_MIN_INTERVAL_MINUTES', '30'))
+        self.adaptive_reference_flights = int(os.getenv('ADAPTIVE_REFERENCE_FLIGHTS_PER_DAY', '200')) # Traffic of a "normal" airport
+        self.adaptive_jitter = float(os.getenv('ADAPTIVE_JITTER_RATIO', '0.1'))
+        self.interval_hours = 12 # Base interval, set by start()
+        self.airport_intervals = {} # icao -> currently scheduled interval (seconds)
+
+        # SHARDING:
+        # With several replicas, each one only collects the airports that the consistent-hash ring assigns to it.
+        # Membership comes from heartbeat rows in MySQL, so no external coordination service is needed.
+        self.membership = ReplicaMembership(app)
+        self.collected_airports = set() # Airports this replica collected in the last periodic run (its shard)
+
+        # COLLECTION ENGINE:
+        # 'threads' (default) fans airports out to a ThreadPoolExecutor, 'asyncio' runs them as coroutines
+        # on a single event loop (thousands of in-flight requests without thousands of OS threads).
+        self.engine = os.getenv('COLLECTION_ENGINE', 'threads').strip().lower()
+        self.async_engine = None
+        if self.engine == 'asyncio':
+            from async_engine import AsyncCollectionEngine # Imported lazily: aiohttp is only needed by this engine
+            self.async_engine = AsyncCollectionEngine(self)
 
         self._connect_kafka()
 
@@ -57,69 +172,191 @@ class DataCollectorScheduler:
             print(f"Errore connessione Kafka: {e}", flush=True)
             self.kafka_producer = None
 
-    def _acquire_lock(self, icao):
-        with self.processing_lock:
-            if icao in self.processing_airports:
-                return False
-            self.processing_airports.add(icao)
-            return True
+    def _not_before(self, max_staleness=None):
+        return time.time() - (self.freshness_seconds if max_staleness is None else max_staleness)
 
-    def _release_lock(self, icao):
-        with self.processing_lock:
-            self.processing_airports.discard(icao)
+    def _get_fetch_window(self, icao):
+        now_ts = int(time.time())
+        floor_ts = now_ts - self.lookback_hours * 3600 # We never look further back than the original window
 
-    def collect_single_airport(self, target_icao):
-        thread_name = threading.current_thread().name
+        rows = db.session.execute(select(FetchWatermark).filter_by(airport_icao=icao)).scalars().all()
+        watermarks = {row.flight_type: row.last_end for row in rows}
 
-        if not self._acquire_lock(target_icao):
-            print(f"[{thread_name}] SKIP {target_icao}: Già in fase di aggiornamento.", flush=True)
-            return
+        def begin_for(flight_type):
+            last_end = watermarks.get(flight_type)
+            if last_end is None:
+                return floor_ts
+            return max(floor_ts, last_end - self.watermark_overlap_seconds)
 
-        try:
-            if not self.kafka_producer:
-                with self.kafka_lock:
-                    if not self.kafka_producer:
-                        self._connect_kafka()
+        return begin_for('departure'), begin_for('arrival'), now_ts, floor_ts
 
-            with self.app.app_context():
-                try:
-                    print(f"\n[{thread_name}] [Trigger] Avvio raccolta mirata per {target_icao}...", flush=True)
+    def _build_window(self, icao, dep_begin, arr_begin, end_ts, floor_ts):
+        incremental = dep_begin > floor_ts or arr_begin > floor_ts
+        if incremental:
+            print(f"[{icao}] Fetch incrementale: partenze da {dep_begin}, arrivi da {arr_begin} (fino a {end_ts}).", flush=True)
+        return {'end': end_ts, 'floor': floor_ts, 'incremental': incremental}
 
-                    query = select(UserInterest).filter_by(airport_icao=target_icao)
-                    interests_objs = db.session.execute(query).scalars().all()
+    def _fetch_airport(self, icao):
+        dep_begin, arr_begin, end_ts, floor_ts = self._get_fetch_window(icao)
+        window = self._build_window(icao, dep_begin, arr_begin, end_ts, floor_ts)
 
-                    if not interests_objs:
-                        print(f"[{thread_name}] Nessun interesse trovato per {target_icao}, abort.", flush=True)
-                        return
+        if self.streaming:
+            # Both responses are downloaded concurrently while their flights are being upserted: network/API errors
+            # surface during the save stage, and the outcome is recorded once the streams have been read to the end
+            flight_data = self.opensky_client.iter_flights_for_airport(
+                icao, dep_begin, end_ts, arrivals_begin_timestamp=arr_begin, on_done=self._record_stream_outcome
+            )
+            flight_data['window'] = window
+            return flight_data
 
-                    try:
-                        if self.opensky_counter:
-                            self.opensky_counter.labels(**self.common_labels, status='attempt').inc()
-                        flight_data = self.opensky_client.get_flights_for_airport(target_icao)
-                        if self.opensky_counter:
-                            self.opensky_counter.labels(**self.common_labels, status='success').inc()
-                    except Exception as e:
-                        if self.opensky_counter:
-                            self.opensky_counter.labels(**self.common_labels, status='failure').inc()
-                        print(f"[{thread_name}] Errore download {target_icao}: {e}", flush=True)
-                        return
+        flight_data = self.opensky_client.get_flights_for_airport(icao, dep_begin, end_ts, arrivals_begin_timestamp=arr_begin)
 
-                    if not flight_data:
-                        return
+        if flight_data is not None:
+            flight_data['window'] = window
+        return flight_data
 
-                    interests = [i.to_dict() for i in interests_objs]
+    def _record_stream_outcome(self, success):
+        if self.opensky_counter:
+            self.opensky_counter.labels(**self.common_labels, status='success' if success else 'failure').inc()
 
-                    self._process_airport_data(target_icao, flight_data, interests)
+    def _advance_watermarks(self, airport_icao, flight_data):
+        window = flight_data.get('window') if flight_data else None
+        if not window:
+            return
 
+        try:
+            now = datetime.now(timezone.utc)
+            rows = [
+                {'airport_icao': airport_icao, 'flight_type': f_type, 'last_end': window['end'], 'updated_at': now}
+                for f_type in ('departure', 'arrival')
+            ]
+            query = insert(FetchWatermark).values(rows)
+            query = query.on_duplicate_key_update(
+                last_end=func.greatest(FetchWatermark.last_end, query.inserted.last_end), # Watermarks only move forward
+                updated_at=query.inserted.updated_at
+            )
+            db.session.execute(query)
+            db.session.commit()
+        except Exception as e:
+            # Not fatal: next run will simply re-fetch a larger window
+            db.session.rollback()
+            print(f"Errore aggiornamento watermark per {airport_icao}: {e}", flush=True)
+
+    def _count_recent_flights(self, airport_icao, since_ts):
+        # With incremental windows the fetched lists only contain new flights, so the counts sent to the
+        # Alert System (which compares them to the user thresholds) are computed on the whole lookback window.
+        c_dep = db.session.execute(select(func.count()).select_from(FlightData).filter(
+            FlightData.airport_icao == airport_icao,
+            FlightData.flight_type == 'departure',
+            FlightData.first_seen >= since_ts
+        )).scalar()
+        c_arr = db.session.execute(select(func.count()).select_from(FlightData).filter(
+            FlightData.airport_icao == airport_icao,
+            FlightData.flight_type == 'arrival',
+            FlightData.last_seen >= since_ts
+        )).scalar()
+        return c_dep, c_arr
+
+    def _collect_bulk(self, active_airports, airport_interests):
+        thread_name = threading.current_thread().name
+
+        windows = {icao: self._get_fetch_window(icao) for icao in active_airports}
+        end_ts = max(w[2] for w in windows.values())
+        floor_ts = end_ts - self.lookback_hours * 3600
+        begin_ts = min(min(w[0], w[1]) for w in windows.values()) # One window covering every airport's watermark
+
+        print(f"[{thread_name}] Raccolta BULK per {len(active_airports)} aeroporti ({begin_ts} -> {end_ts})...", flush=True)
+
+        try:
+            if self.opensky_counter:
+                self.opensky_counter.labels(**self.common_labels, status='attempt').inc()
+
+            buckets = self.opensky_client.get_flights_for_airports(active_airports, begin_ts, end_ts)
+
+            if self.opensky_counter:
+                self.opensky_counter.labels(**self.common_labels, status='success').inc()
+        except Exception as e:
+            if self.opensky_counter:
+                self.opensky_counter.labels(**self.common_labels, status='failure').inc()
+            print(f"[{thread_name}] Errore raccolta BULK: {e}", flush=True)
+            return
+
+        def store(icao):
+            with self.app.app_context():
+                try:
+                    data = buckets[icao]
+                    data['window'] = self._build_window(icao, begin_ts, begin_ts, end_ts, floor_ts)
+                    return self._process_airport_data(icao, data, airport_interests[icao])
                 finally:
                     db.session.remove()
 
+        def store_wrapper(icao):
+            try:
+                # If the airport is already being collected, its in-flight run is at least as fresh as our bulk data
+                self.single_flight.do(icao, store, icao)
+            except Exception as e:
+                print(f"[{threading.current_thread().name}] Errore salvataggio BULK {icao}: {e}", flush=True)
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = [executor.submit(store_wrapper, icao) for icao in active_airports]
+            for _ in as_completed(futures):
+                pass
+
+    def collect_single_airport(self, target_icao, max_staleness=None):
+        # Returns the outcome of the collection ({'departures': n, 'arrivals': n}) or None,
+        # also when it was performed by another caller that was already collecting this airport
+        thread_name = threading.current_thread().name
+
+        try:
+            return self.single_flight.do(target_icao, self._collect_single_airport, target_icao, not_before=self._not_before(max_staleness))
         except Exception as e:
             print(f"[{thread_name}] Errore durante la raccolta mirata: {e}", flush=True)
-        finally:
-            self._release_lock(target_icao)
+            return None
+
+    def _collect_single_airport(self, target_icao):
+        thread_name = threading.current_thread().name
+
+        if not self.kafka_producer:
+            with self.kafka_lock:
+                if not self.kafka_producer:
+                    self._connect_kafka()
+
+        with self.app.app_context():
+            try:
+                print(f"\n[{thread_name}] [Trigger] Avvio raccolta mirata per {target_icao}...", flush=True)
+
+                query = select(UserInterest).filter_by(airport_icao=target_icao)
+                interests_objs = db.session.execute(query).scalars().all()
+
+                if not interests_objs:
+                    print(f"[{thread_name}] Nessun interesse trovato per {target_icao}, abort.", flush=True)
+                    return None
 
-    def collect_data_job(self):
+                try:
+                    if self.opensky_counter:
+                        self.opensky_counter.labels(**self.common_labels, status='attempt').inc()
+                    flight_data = self._fetch_airport(target_icao)
+                    if self.opensky_counter and not self.streaming: # Streams are recorded by _record_stream_outcome
+                        self.opensky_counter.labels(**self.common_labels, status='success').inc()
+                except Exception as e:
+                    if self.opensky_counter:
+                        self.opensky_counter.labels(**self.common_labels, status='failure').inc()
+                    print(f"[{thread_name}] Errore download {target_icao}: {e}", flush=True)
+                    raise # Propagated to every caller waiting on this collection
+
+                if not flight_data:
+                    return None
+
+                interests = [i.to_dict() for i in interests_objs]
+
+                return self._process_airport_data(target_icao, flight_data, interests)
+
+            finally:
+                db.session.remove()
+
+    def collect_data_job(self, rebalance=False):
+        # rebalance=True (membership changed): only the airports that this replica didn't collect so far, e.g. the
+        # shard of a replica that left, are collected right away instead of waiting for the next interval
         start_time = time.time() # Start timer for Prometheus Gauge
 
         if not self.kafka_producer:
@@ -141,74 +378,82 @@ class DataCollectorScheduler:
                     if interest.airport_icao not in airport_interests:
                         airport_interests[interest.airport_icao] = []
                     airport_interests[interest.airport_icao].append(interest.to_dict())
+                monitored_since = self._monitored_since(interests)
 
                 active_airports = list(airport_interests.keys())
 
-                # Garbage Collection
-                try:
+                # Bulk collection costs the same whatever the number of airports, so the leader runs it for everybody;
+                # otherwise every replica only collects its own shard of airports
+                use_bulk = self.bulk_min_airports and len(active_airports) >= self.bulk_min_airports
+                if use_bulk and not self.membership.is_leader():
+                    active_airports = []
+                elif not use_bulk:
+                    active_airports = [icao for icao in active_airports if self.membership.owns(icao)]
+
+                self.flight_cache.retain_airports(active_airports, monitored_since)
+
+                previous_airports = self.collected_airports
+                self.collected_airports = set(active_airports)
+                if rebalance:
+                    active_airports = [icao for icao in active_airports if icao not in previous_airports]
                     if not active_airports:
-                        print("Nessun interesse attivo. Pulizia completa voli...", flush=True)
-                        deleted = db.session.execute(delete(FlightData))
-                        db.session.commit()
-                        if deleted.rowcount > 0:
-                            print(f"Pulizia completata: rimossi {deleted.rowcount} voli.", flush=True)
-                        if self.processing_gauge:
-                            self.processing_gauge.labels(**self.common_labels).set(time.time() - start_time)
                         return
-                    else:
-                        # Delete flight data where airport_icao is NOT IN active_airports
-                        print("Pulizia voli di aeroporti non più monitorati...", flush=True)
-                        cleanup_query = delete(FlightData).where(
-                            not_(FlightData.airport_icao.in_(active_airports))
-                        )
-                        deleted = db.session.execute(cleanup_query)
-                        db.session.commit()
-                        if deleted.rowcount > 0:
-                            print(f"Pulizia completata: rimossi {deleted.rowcount} voli.", flush=True)
-                        else:
-                            print("Nessun volo da pulire.", flush=True)
-                except Exception as e:
-                    db.session.rollback()
-                    print(f"Errore durante la pulizia voli: {e}", flush=True)
+                    print(f"[Sharding] Nuovi aeroporti assegnati a questa replica: {', '.join(active_airports)}", flush=True)
+
+                if not active_airports:
+                    print("Nessun aeroporto assegnato a questa replica.", flush=True)
+                    if self.processing_gauge:
+                        self.processing_gauge.labels(**self.common_labels).set(time.time() - start_time)
+                    return
 
                 print(f"Aeroporti da monitorare: {', '.join(active_airports)}", flush=True)
 
-                # Using a wrapper to handle locking per airport task (Note: "Counter" provided by Prometheus client is thread-safe, so no extra locking needed there)
-                def process_wrapper(icao):
+                # Using a wrapper to handle single-flight per airport task (Note: "Counter" provided by Prometheus client is thread-safe, so no extra locking needed there)
+                def process(icao):
                     with self.app.app_context():
                         thread_name = threading.current_thread().name
-                        if not self._acquire_lock(icao):
-                            print(f"[{thread_name}] SKIP {icao}: Già in aggiornamento da altro thread.", flush=True)
-                            return
-
                         try:
                             print(f"[{thread_name}] Richiedo dati per {icao} a OpenSky...", flush=True)
 
                             if self.opensky_counter:
                                 self.opensky_counter.labels(**self.common_labels, status='attempt').inc()
 
-                            data = self.opensky_client.get_flights_for_airport(icao)
+                            data = self._fetch_airport(icao)
 
-                            if self.opensky_counter:
+                            if self.opensky_counter and not self.streaming: # Streams are recorded by _record_stream_outcome
                                 self.opensky_counter.labels(**self.common_labels, status='success').inc()
 
                             if data:
                                 print(f"[{thread_name}] Dati scaricati per {icao}, elaborazione...", flush=True)
-                                self._process_airport_data(icao, data, airport_interests[icao])
+                                result = self._process_airport_data(icao, data, airport_interests[icao])
                                 print(f"[{thread_name}] Elaborazione completata per {icao}.", flush=True)
+                                return result
                         except Exception as e:
                             if self.opensky_counter:
                                 self.opensky_counter.labels(**self.common_labels, status='failure').inc()
                             print(f"[{thread_name}] Errore processamento {icao}: {e}", flush=True)
+                            raise
                         finally:
-                            self._release_lock(icao)
                             db.session.remove()
 
+                not_before = self._not_before()
+
+                def process_wrapper(icao):
+                    try:
+                        self.single_flight.do(icao, process, icao, not_before=not_before)
+                    except Exception:
+                        pass # Already logged by the collection that failed
+
                 # Execute tasks in parallel
-                with ThreadPoolExecutor(max_workers=5) as executor:
-                    futures = [executor.submit(process_wrapper, icao) for icao in active_airports]
-                    for _ in as_completed(futures):
-                        pass
+                if use_bulk:
+                    self._collect_bulk(active_airports, airport_interests)
+                elif self.async_engine:
+                    self.async_engine.run(active_airports, airport_interests)
+                else:
+                    with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                        futures = [executor.submit(process_wrapper, icao) for icao in active_airports]
+                        for _ in as_completed(futures):
+                            pass
 
                 print(f"\nRaccolta periodica completata.", flush=True)
 
@@ -228,9 +473,12 @@ class DataCollectorScheduler:
 
         if not flight_data or (not flight_data.get('departures') and not flight_data.get('arrivals')):
             print(f"[{airport_icao}] Nessun dato voli da salvare.", flush=True)
-            return
+            # An empty window is still a successful fetch, so the watermark can move forward
+            self._advance_watermarks(airport_icao, flight_data)
+            return {'departures': 0, 'arrivals': 0}
 
         db_success = False
+        result = None # Outcome returned to the caller(s): rows saved per direction, None if the DB save failed
 
         try:
             if flight_data.get('departures'):
@@ -241,13 +489,29 @@ class DataCollectorScheduler:
 
             print(f"-> DB OK {airport_icao}: Salvati {c_dep} partenze, {c_arr} arrivi.", flush=True)
             db_success = True
+            result = {'departures': c_dep, 'arrivals': c_arr}
+
+            self._advance_watermarks(airport_icao, flight_data)
 
         except Exception as e:
             db.session.rollback()
             print(f"Errore critico salvataggio DB per {airport_icao}: {e}", flush=True)
             db_success = False
 
+        finally:
+            # Streamed responses: stop the downloads still running if the save stopped early
+            for key in ('departures', 'arrivals'):
+                if hasattr(flight_data.get(key), 'close'):
+                    flight_data[key].close()
+
         if db_success:
+            window = flight_data.get('window')
+            if window and window['incremental']:
+                try:
+                    c_dep, c_arr = self._count_recent_flights(airport_icao, window['floor'])
+                except Exception as e:
+                    print(f"Errore conteggio voli recenti per {airport_icao}: {e}", flush=True)
+
             messages_to_send = []
             try:
                 for interest in interests:
@@ -262,7 +526,7 @@ class DataCollectorScheduler:
                     })
             except Exception as e:
                 print(f"Errore lettura dati per invio Kafka {airport_icao}: {e}", flush=True)
-                return
+                return result
 
             max_kafka_retries = 5
 
@@ -303,6 +567,8 @@ class DataCollectorScheduler:
                     else:
                         print(f"-> Kafka ERROR: Impossibile connettersi. Alert saltati per {airport_icao}.", flush=True)
 
+        return result
+
     def _save_flights(self, airport_icao, flight_data_list, flight_type):
         if not flight_data_list:
             return 0
@@ -311,12 +577,26 @@ class DataCollectorScheduler:
         # Instead of executing a DB query for every single flight inside the loop (O(N) complexity),
         # we now simply prepare a list of dictionaries in memory (O(1) complexity).
         # This avoids network latency and massive DB I/O overhead.
-        insert_values = []
+        # 'flight_data_list' can be any iterable (also a streaming generator): rows are accumulated
+        # in chunks of 'upsert_batch_size', so memory and statement size stay bounded whatever the airport size.
+        saved = 0
+        skipped = 0 # Already stored and unchanged (change detection)
+        pending = [] # Futures of the chunks handed to the writer pipeline
+        use_writer = self.write_pipeline and self.writer.running
+        chunks = 0
+        start_time = time.time()
+        collected_at = datetime.now()
+
+        use_cache = self.flight_cache.enabled
+        if use_cache and self.flight_cache.needs_warmup(airport_icao):
+            self._warm_flight_cache(airport_icao)
+
+        batch = []
         for flight in flight_data_list:
             if not flight.get('icao24') or not flight.get('firstSeen'):
                 continue
 
-            insert_values.append({
+            row = {
                 "airport_icao": airport_icao,
                 "icao24": flight.get('icao24'),
                 "first_seen": flight.get('firstSeen'),
@@ -324,6 +604,7 @@ class DataCollectorScheduler:
                 "last_seen": flight.get('lastSeen'),
                 "est_arrival_airport": flight.get('estArrivalAirport'),
                 "callsign": flight.get('callsign'),
+                "airline_prefix": airline_prefix(flight.get('callsign')),
                 "est_departure_airport_horiz_distance": flight.get('estDepartureAirportHorizDistance'),
                 "est_departure_airport_vert_distance": flight.get('estDepartureAirportVertDistance'),
                 "est_arrival_airport_horiz_distance": flight.get('estArrivalAirportHorizDistance'),
@@ -331,51 +612,293 @@ class DataCollectorScheduler:
                 "departure_airport_candidates_count": flight.get('departureAirportCandidatesCount'),
                 "arrival_airport_candidates_count": flight.get('arrivalAirportCandidatesCount'),
                 "flight_type": flight_type,
-                "collected_at": datetime.now()
-            })
+                "collected_at": collected_at
+            }
 
-        if not insert_values:
+            if use_cache and self.flight_cache.is_unchanged(row):
+                skipped += 1
+                continue
+            batch.append(row)
+
+            if len(batch) >= self.upsert_batch_size:
+                saved += self._write_chunk(airport_icao, batch, pending if use_writer else None)
+                chunks += 1
+                batch = []
+
+        if batch:
+            saved += self._write_chunk(airport_icao, batch, pending if use_writer else None)
+            chunks += 1
+
+        # The caller advances the watermarks after we return, so we wait until every chunk is committed
+        # (a writer error is re-raised here)
+        for future in pending:
+            saved += future.result()
+
+        if saved:
+            self.data_versions.bump(airport_icao)
+
+        elapsed = time.time() - start_time
+        if saved:
+            print(f"[{airport_icao}] Upsert {flight_type}: {saved} righe in {chunks} chunk, {elapsed:.2f}s ({saved / max(elapsed, 1e-6):.0f} righe/s).", flush=True)
+        if skipped:
+            print(f"[{airport_icao}] {skipped} voli {flight_type} invariati non riscritti.", flush=True)
+
+        # Flights now up to date in the DB (written + unchanged): callers use it as the count of the window
+        return saved + skipped
+
+    def _airport_write_lock(self, airport_icao):
+        with self.write_locks_lock:
+            return self.write_locks.setdefault(airport_icao, threading.Lock())
+
+    def _write_chunk(self, airport_icao, batch, pending):
+        if pending is not None:
+            # Queued to the writers (blocks only if their queue is full): the cache is updated by the writer on commit
+            pending.append(self.writer.submit(airport_icao, batch))
             return 0
 
-        insert_values.sort(key=lambda x: x['icao24']) # Sorting to reduce deadlocks on concurrent inserts
+        # Without the pipeline, writes of the same airport (periodic collection, backfill, triggers) are serialized
+        # here like the writers do: concurrent transactions would both count the same new flight in the daily rollups
+        with self._airport_write_lock(airport_icao):
+            saved = self._upsert_flights_batch(airport_icao, batch)
+        if self.flight_cache.enabled:
+            self.flight_cache.store(batch) # Only once committed
+        return saved
+
+    @staticmethod
+    def _monitored_since(interests):
+        # Newest interest per airport: a removed and re-added airport shows up as a creation after the warm-up
+        latest = {}
+        for interest in interests:
+            if interest.created_at and (interest.airport_icao not in latest or interest.created_at > latest[interest.airport_icao]):
+                latest[interest.airport_icao] = interest.created_at
+        return latest
+
+    def _warm_flight_cache(self, airport_icao):
+        # Loads the digests of the flights that the next windows can return again (the lookback window),
+        # so even the first collection after a restart only writes what changed
+        floor_ts = int(time.time()) - self.lookback_hours * 3600 - self.watermark_overlap_seconds
+        columns = [getattr(FlightData, field) for field in ('airport_icao', 'icao24', 'first_seen') + FlightDigestCache.MUTABLE_FIELDS]
+
+        try:
+            warmed_at = self.flight_cache.now()
+            rows = db.session.execute(
+                select(*columns)
+                .where(FlightData.airport_icao == airport_icao, or_(FlightData.first_seen >= floor_ts, FlightData.last_seen >= floor_ts))
+                .limit(self.flight_cache.max_entries)
+            ).mappings().all()
+            self.flight_cache.warm(airport_icao, rows, warmed_at)
+        except Exception as e:
+            # Not fatal: without warm-up every flight is simply written once more
+            db.session.rollback()
+            print(f"Errore warm-up cache voli per {airport_icao}: {e}", flush=True)
 
-        query = insert(FlightData).values(insert_values)
+    def _build_upsert_statement(self):
+        query = insert(FlightData)
 
         # "ON DUPLICATE KEY UPDATE" clause:
         # This logic delegates the "check if exists" to the Database Engine.
         # If the Unique Constraint (icao24 + first_seen + airport_icao) matches a row,
         # it updates the specified fields. If not, it inserts a new row.
-        on_duplicate_key_query = query.on_duplicate_key_update(
+        # Every value comes from the row itself (VALUES(...)), so the statement has no per-call literals and can be reused.
+        return query.on_duplicate_key_update(
             last_seen=query.inserted.last_seen,
             est_arrival_airport=query.inserted.est_arrival_airport,
             callsign=query.inserted.callsign,
+            airline_prefix=query.inserted.airline_prefix,
             est_arrival_airport_horiz_distance=query.inserted.est_arrival_airport_horiz_distance,
             est_arrival_airport_vert_distance=query.inserted.est_arrival_airport_vert_distance,
             arrival_airport_candidates_count=query.inserted.arrival_airport_candidates_count,
-            collected_at=datetime.now() # Update timestamp to know we saw this flight again
+            collected_at=query.inserted.collected_at # Update timestamp to know we saw this flight again
         )
 
-        max_retries = 5
-        for attempt in range(max_retries):
+    def _upsert_flights_batch(self, airport_icao, insert_values):
+        insert_values.sort(key=lambda x: x['icao24']) # Sorting to reduce deadlocks on concurrent inserts
+
+        for attempt in range(self.upsert_max_retries):
             try:
-                db.session.execute(on_duplicate_key_query)
+                self.daily_stats.record(insert_values)
+                # Parameter list -> executemany on the cached statement (one compiled statement, batched by the driver)
+                db.session.execute(self.upsert_statement, insert_values)
                 db.session.commit()
                 return len(insert_values)
 
             except Exception as e:
                 db.session.rollback()
                 error_str = str(e).lower()
-                if "deadlock" in error_str or "1213" in error_str:
-                    if attempt < max_retries - 1:
-                        sleep_time = random.uniform(0.5, 2.0) #Basically, to prevent deadlocks, we wait a random time before retrying (like exponential backoff)
-                        print(f"Deadlock rilevato per {airport_icao}. Riprovo ({attempt+1}/{max_retries})...", flush=True)
+                # Deadlock (1213) / lock wait timeout (1205): the rollup's locking read can make concurrent writers of the same flights wait
+                if "deadlock" in error_str or "1213" in error_str or "1205" in error_str:
+                    if attempt < self.upsert_max_retries - 1:
+                        # Only this chunk is retried (the previous ones are already committed), with exponential backoff + jitter
+                        sleep_time = random.uniform(0.5, 1.0) * (2 ** attempt)
+                        print(f"Deadlock rilevato per {airport_icao} ({len(insert_values)} righe). Riprovo il chunk ({attempt+1}/{self.upsert_max_retries})...", flush=True)
                         time.sleep(sleep_time)
                         continue
 
                 print(f"Errore bulk upsert per {airport_icao}: {e}", flush=True)
                 raise e
 
+    def _compute_airport_interval(self, flights_per_day, subscribers, recent_count, thresholds):
+        base = self.interval_hours * 3600
+
+        # Busier airports change faster: sqrt scaling around the reference traffic, bounded to [0.5x, 2x]
+        traffic_factor = min(2.0, max(0.5, (flights_per_day / self.adaptive_reference_flights) ** 0.5))
+
+        # More subscribers means more people waiting for fresh data (1 -> 1x, 4 -> 1.5x, 16+ -> 2x)
+        subscriber_factor = min(2.0, 1 + 0.25 * math.log2(max(1, subscribers)))
+
+        # If the recent count is close to a user threshold, an alert may be about to fire: poll more often
+        proximity_factor = 1.0
+        for threshold in thresholds:
+            distance = abs(recent_count - threshold) / max(threshold, 1)
+            if distance < 0.1:
+                proximity_factor = max(proximity_factor, 3.0)
+            elif distance < 0.25:
+                proximity_factor = max(proximity_factor, 2.0)
+
+        interval = base / (traffic_factor * subscriber_factor * proximity_factor)
+        return int(min(base * 2, max(self.adaptive_min_minutes * 60, interval)))
+
+    def plan_adaptive_jobs(self):
+        with self.app.app_context():
+            try:
+                interests = db.session.execute(select(UserInterest)).scalars().all()
+
+                airport_interests = {}
+                for interest in interests:
+                    airport_interests.setdefault(interest.airport_icao, []).append(interest)
+
+                # Only the airports of this replica's shard get a job here
+                active_airports = [icao for icao in airport_interests.keys() if self.membership.owns(icao)]
+                self.flight_cache.retain_airports(active_airports, self._monitored_since(interests))
+
+                # Observed traffic (last 7 days) and the count that the Alert System would see now (lookback window),
+                # both computed with one grouped query for all airports
+                week_cutoff = datetime.now() - timedelta(days=7)
+                traffic = dict(db.session.execute(
+                    select(FlightData.airport_icao, func.count())
+                    .where(FlightData.collected_at >= week_cutoff)
+                    .group_by(FlightData.airport_icao)
+                ).all())
+
+                floor_ts = int(time.time()) - self.lookback_hours * 3600
+                recent = dict(db.session.execute(
+                    select(FlightData.airport_icao, func.count())
+                    .where(or_(
+                        and_(FlightData.flight_type == 'departure', FlightData.first_seen >= floor_ts),
+                        and_(FlightData.flight_type == 'arrival', FlightData.last_seen >= floor_ts)
+                    ))
+                    .group_by(FlightData.airport_icao)
+                ).all())
+
+                for icao in active_airports:
+                    thresholds = [v for i in airport_interests[icao] for v in (i.high_value, i.low_value) if v is not None]
+                    interval = self._compute_airport_interval(traffic.get(icao, 0) / 7, len(airport_interests[icao]), recent.get(icao, 0), thresholds)
+                    self._schedule_airport(icao, interval)
+
+                # Airports that nobody monitors anymore (or moved to another replica) lose their job
+                for icao in list(self.airport_intervals.keys()):
+                    if icao not in active_airports:
+                        self._unschedule_airport(icao)
+
+                print(f"Pianificazione adattiva aggiornata per {len(active_airports)} aeroporti.", flush=True)
+
+            except Exception as e:
+                db.session.rollback()
+                print(f"Errore durante la pianificazione adattiva: {e}", flush=True)
+            finally:
+                db.session.remove()
+
+    def _schedule_airport(self, icao, interval):
+        current = self.airport_intervals.get(icao)
+
+        # Small changes are ignored, otherwise every planning round would reset the next run time
+        if current and abs(interval - current) / current < 0.2:
+            return
+
+        job_id = f'collect_{icao}'
+        job = self.scheduler.get_job(job_id) if current else None
+        if job and job.next_run_time:
+            # Rescheduled airport: a shorter interval must not postpone the run that was already planned
+            first_run = min(job.next_run_time, datetime.now(job.next_run_time.tzinfo) + timedelta(seconds=interval))
+        else:
+            # New airports start at a random point of their interval, so runs are spread instead of all firing at once
+            first_run = datetime.now() + timedelta(seconds=random.uniform(0, interval))
+
+        self.scheduler.add_job(
+            self.collect_single_airport,
+            'interval',
+            seconds=interval,
+            args=[icao],
+            id=job_id,
+            name=f'Raccolta Dati {icao}',
+            next_run_time=first_run,
+            jitter=int(interval * self.adaptive_jitter),
+            replace_existing=True
+        )
+        self.airport_intervals[icao] = interval
+        print(f"[{icao}] Raccolta pianificata ogni {interval // 60} minuti.", flush=True)
+
+    def _unschedule_airport(self, icao):
+        try:
+            self.scheduler.remove_job(f'collect_{icao}')
+        except Exception:
+            pass
+        self.airport_intervals.pop(icao, None)
+        print(f"[{icao}] Raccolta rimossa da questa replica.", flush=True)
+
+    def retention_job(self):
+        # Cluster-wide task, run by the leader replica only
+        if self.membership.is_leader():
+            self.retention.run()
+
+    def heartbeat_job(self):
+        changed = self.membership.heartbeat()
+        if changed and self.adaptive:
+            # Rebalance right away: jobs of the airports we lost are removed, the new ones are scheduled
+            self.plan_adaptive_jobs()
+        elif changed:
+            # The airports we took over (e.g. from a crashed replica whose row just expired) are collected now
+            threading.Thread(target=self.collect_data_job, kwargs={'rebalance': True}).start()
+
     def start(self, interval_hours=12):
+        self.interval_hours = interval_hours
+
+        if self.write_pipeline:
+            self.writer.start()
+
+        # First heartbeat before any collection, so we already know our shard
+        self.membership.heartbeat()
+        self.scheduler.add_job(
+            self.heartbeat_job,
+            'interval',
+            seconds=self.membership.heartbeat_seconds,
+            id='replica_heartbeat',
+            name='Heartbeat Replica',
+            replace_existing=True
+        )
+        self.scheduler.add_job(
+            self.retention_job,
+            'interval',
+            minutes=self.retention_interval_minutes,
+            id='flight_retention',
+            name='Retention Voli',
+            replace_existing=True
+        )
+
+        if self.adaptive:
+            self.scheduler.add_job(
+                self.plan_adaptive_jobs,
+                'interval',
+                minutes=self.adaptive_planner_minutes,
+                id='plan_adaptive_jobs',
+                name='Pianificazione Raccolta Adattiva',
+                replace_existing=True
+            )
+            self.scheduler.start()
+            print(f"Scheduler avviato in modalità adattiva (intervallo base {interval_hours} ore)", flush=True)
+            threading.Thread(target=self.plan_adaptive_jobs).start()
+            return
+
         self.scheduler.add_job(
             self.collect_data_job,
             'interval',
@@ -392,6 +915,8 @@ class DataCollectorScheduler:
     def stop(self):
         self.scheduler.shutdown()
         print("Scheduler fermato", flush=True)
+        self.writer.stop() # Running jobs are over: flush what is still queued
+        self.membership.leave()
         if self.kafka_producer:
             try:
                 self.kafka_producer.close()
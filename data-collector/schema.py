@@ -0,0 +1,34 @@
+from database import db
+from sqlalchemy import text
+
+def _flight_data_columns():
+    return db.session.execute(text(
+        "SELECT COLUMN_NAME FROM information_schema.COLUMNS WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'flight_data'"
+    )).scalars().all()
+
+def _flight_data_indexes():
+    return db.session.execute(text(
+        "SELECT DISTINCT INDEX_NAME FROM information_schema.STATISTICS WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'flight_data'"
+    )).scalars().all()
+
+def upgrade_flight_data_schema():
+    # db.create_all() doesn't alter existing tables: columns and indexes added to FlightData after
+    # the table was created are added here (the values of old rows are filled by the stats rebuild).
+    # Everything missing goes into a single ALTER TABLE, so the table is altered once
+    columns = _flight_data_columns()
+    indexes = _flight_data_indexes()
+    changes = []
+
+    if 'airline_prefix' not in columns:
+        print("[Schema] Aggiunta colonna airline_prefix a flight_data...", flush=True)
+        changes.append("ADD COLUMN airline_prefix VARCHAR(3) NULL")
+    if 'ix_flight_airport_airline' not in indexes:
+        print("[Schema] Aggiunta indice ix_flight_airport_airline...", flush=True)
+        changes.append("ADD INDEX ix_flight_airport_airline (airport_icao, airline_prefix)")
+    if 'ix_flight_airport_collected' not in indexes:
+        print("[Schema] Aggiunta indice ix_flight_airport_collected...", flush=True)
+        changes.append("ADD INDEX ix_flight_airport_collected (airport_icao, collected_at, id)")
+
+    if changes:
+        db.session.execute(text(f"ALTER TABLE flight_data {', '.join(changes)}"))
+    db.session.commit()
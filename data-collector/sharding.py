@@ -0,0 +1,116 @@
+from database import db
+from models import CollectorReplica
+from sqlalchemy import select, delete, func, text
+from sqlalchemy.dialects.mysql import insert
+from bisect import bisect
+import hashlib
+import socket
+import threading
+import uuid
+import os
+
+class ConsistentHashRing:
+    def __init__(self, nodes, vnodes=100):
+        # Every replica is placed on the ring 'vnodes' times, so airports spread evenly and
+        # only ~1/N of them move when a replica joins or leaves
+        self.nodes = sorted(nodes)
+        self.ring = sorted((self._hash(f"{node}#{i}"), node) for node in self.nodes for i in range(vnodes))
+        self.keys = [h for h, _ in self.ring]
+
+    @staticmethod
+    def _hash(key):
+        return int(hashlib.md5(key.encode('utf-8')).hexdigest()[:16], 16)
+
+    def get(self, key):
+        if not self.ring:
+            return None
+        idx = bisect(self.keys, self._hash(key)) % len(self.ring)
+        return self.ring[idx][1]
+
+class ReplicaMembership:
+    def __init__(self, app):
+        self.app = app
+
+        # POD_NAME is injected by Kubernetes (Downward API), otherwise we fall back to hostname + random suffix
+        self.replica_id = os.getenv('POD_NAME') or f"{socket.gethostname()}-{uuid.uuid4().hex[:6]}"
+
+        # Off by default (single instance, e.g. docker compose): the Kubernetes deployment turns it on
+        self.enabled = os.getenv('SHARDING_ENABLED', 'false').strip().lower() == 'true'
+        self.heartbeat_seconds = int(os.getenv('SHARDING_HEARTBEAT_SECONDS', '15'))
+        self.ttl_seconds = int(os.getenv('SHARDING_TTL_SECONDS', '45')) # A replica without heartbeat for this long is considered gone
+        self.vnodes = int(os.getenv('SHARDING_VNODES', '100'))
+
+        # Until the first heartbeat succeeds we behave as a single replica (we own every airport)
+        self.members = [self.replica_id]
+        self.ring = ConsistentHashRing(self.members, self.vnodes)
+        self.lock = threading.Lock()
+
+    def heartbeat(self):
+        # Registers this replica and refreshes the view of the live members (rows in 'collector_replicas').
+        # DB time (NOW()) is used for both writing and checking heartbeats, so clock skew between pods doesn't matter.
+        # Returns True if the membership changed (airports must be rebalanced).
+        if not self.enabled:
+            return False
+
+        with self.app.app_context():
+            try:
+                query = insert(CollectorReplica).values(replica_id=self.replica_id, last_heartbeat=func.now(), started_at=func.now())
+                query = query.on_duplicate_key_update(last_heartbeat=func.now())
+                db.session.execute(query)
+
+                # Rows of replicas that died without leave() (crash, OOM kill): already out of the ring, removed
+                # here so the table doesn't grow with every pod name ever used. Any replica can do it, the DELETE is idempotent.
+                db.session.execute(delete(CollectorReplica).where(
+                    func.timestampdiff(text('SECOND'), CollectorReplica.last_heartbeat, func.now()) > self.ttl_seconds
+                ))
+                db.session.commit()
+
+                alive = db.session.execute(
+                    select(CollectorReplica.replica_id).where(
+                        func.timestampdiff(text('SECOND'), CollectorReplica.last_heartbeat, func.now()) <= self.ttl_seconds
+                    )
+                ).scalars().all()
+
+                members = sorted(set(alive) | {self.replica_id})
+            except Exception as e:
+                db.session.rollback()
+                print(f"[Sharding] Errore heartbeat: {e}", flush=True)
+                return False
+            finally:
+                db.session.remove()
+
+        with self.lock:
+            if members == self.members:
+                return False
+            self.members = members
+            self.ring = ConsistentHashRing(members, self.vnodes)
+
+        print(f"[Sharding] Membership aggiornata: {len(members)} repliche attive ({', '.join(members)}).", flush=True)
+        return True
+
+    def leave(self):
+        # Called on shutdown: removing our row lets the other replicas take over our airports immediately
+        if not self.enabled:
+            return
+        with self.app.app_context():
+            try:
+                db.session.execute(delete(CollectorReplica).where(CollectorReplica.replica_id == self.replica_id))
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                print(f"[Sharding] Errore rimozione replica: {e}", flush=True)
+            finally:
+                db.session.remove()
+
+    def owns(self, airport_icao):
+        if not self.enabled:
+            return True
+        with self.lock:
+            return self.ring.get(airport_icao) == self.replica_id
+
+    def is_leader(self):
+        # The lowest replica id runs the cluster-wide tasks (garbage collection, bulk /flights/all collection)
+        if not self.enabled:
+            return True
+        with self.lock:
+            return self.members[0] == self.replica_id
@@ -0,0 +1,75 @@
+from concurrent.futures import Future
+import threading
+import time
+
+class _Call:
+    def __init__(self):
+        self.future = Future()
+        self.started_at = time.time()
+        self.rerun = None # _Call waiting to start as soon as this one completes
+
+class SingleFlight:
+    def __init__(self):
+        self.calls = {} # key -> _Call currently in flight
+        self.lock = threading.Lock()
+
+    def begin(self, key, not_before=None):
+        # Returns (is_leader, future).
+        # The leader must run the work and then call complete(). Everybody else receives the future of the
+        # in-flight call, or of a queued rerun if the in-flight call started before 'not_before'
+        # (i.e. its data would be older than what the caller needs).
+        with self.lock:
+            call = self.calls.get(key)
+            if call is None:
+                call = _Call()
+                self.calls[key] = call
+                return True, call.future
+
+            if not_before is not None and call.started_at < not_before:
+                if call.rerun is None:
+                    call.rerun = _Call()
+                return False, call.rerun.future
+
+            return False, call.future
+
+    def complete(self, key, result=None, error=None):
+        # Publishes the outcome to every waiter. Returns True if a rerun was requested meanwhile:
+        # in that case the caller is the leader of the rerun and must run the work again (and call complete again).
+        with self.lock:
+            call = self.calls[key]
+            rerun = call.rerun
+            if rerun is None:
+                del self.calls[key]
+            else:
+                rerun.started_at = time.time()
+                self.calls[key] = rerun
+
+        if error is not None:
+            call.future.set_exception(error)
+        else:
+            call.future.set_result(result)
+        return rerun is not None
+
+    def is_running(self, key):
+        with self.lock:
+            return key in self.calls
+
+    def do(self, key, func, *args, not_before=None, **kwargs):
+        is_leader, future = self.begin(key, not_before=not_before)
+
+        if not is_leader:
+            print(f"[{threading.current_thread().name}] {key} già in aggiornamento: attendo l'esito della raccolta in corso.", flush=True)
+            return future.result() # Re-raises the leader's exception, if any
+
+        first_future = future
+        while True:
+            try:
+                outcome = {'result': func(*args, **kwargs)}
+            except Exception as e:
+                outcome = {'error': e}
+
+            if not self.complete(key, **outcome):
+                break
+            print(f"[{threading.current_thread().name}] {key}: rieseguo la raccolta richiesta da un altro chiamante.", flush=True)
+
+        return first_future.result()
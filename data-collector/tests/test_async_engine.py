@@ -0,0 +1,64 @@
+import asyncio
+import types
+
+import pytest
+
+from async_engine import AsyncCollectionEngine
+from single_flight import SingleFlight
+
+
+@pytest.fixture
+def engine(monkeypatch):
+    scheduler = types.SimpleNamespace(app=None, opensky_client=None, single_flight=SingleFlight())
+    engine = AsyncCollectionEngine(scheduler)
+    collected = []
+
+    async def collect_airport(http_session, db_executor, icao, interests):
+        collected.append(icao)
+        await asyncio.sleep(0)
+        return icao
+
+    monkeypatch.setattr(engine, '_collect_airport', collect_airport)
+    return engine, collected
+
+
+def test_followers_do_not_hold_a_concurrency_slot(engine):
+    engine, collected = engine
+    single_flight = engine.scheduler.single_flight
+    single_flight.begin('LIRF') # Collection of LIRF in flight elsewhere (e.g. a manual trigger)
+
+    async def run():
+        semaphore = asyncio.Semaphore(1)
+        follower = asyncio.ensure_future(engine._process_airport(None, semaphore, None, 'LIRF', [], None))
+        await asyncio.sleep(0)
+        # The only slot is free for an airport that must actually be fetched
+        await asyncio.wait_for(engine._process_airport(None, semaphore, None, 'KJFK', [], None), timeout=1)
+        assert not follower.done()
+
+        single_flight.complete('LIRF', result='done')
+        await asyncio.wait_for(follower, timeout=1)
+
+    asyncio.run(run())
+    assert collected == ['KJFK']
+    assert not single_flight.is_running('LIRF')
+
+
+def test_cancelled_leader_releases_its_waiters(engine):
+    engine, collected = engine
+    single_flight = engine.scheduler.single_flight
+
+    async def run():
+        semaphore = asyncio.Semaphore(0) # The leader never gets a slot
+        leader = asyncio.ensure_future(engine._process_airport(None, semaphore, None, 'LIRF', [], None))
+        await asyncio.sleep(0)
+        _, future = single_flight.begin('LIRF')
+
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return future
+
+    future = asyncio.run(run())
+    assert future.done()
+    assert not single_flight.is_running('LIRF')
+    assert collected == []
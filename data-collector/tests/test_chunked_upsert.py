@@ -0,0 +1,105 @@
+import types
+
+import pytest
+from flask import Flask
+from sqlalchemy.dialects import mysql
+
+import scheduler as scheduler_module
+from scheduler import DataCollectorScheduler
+
+
+class FakeSession:
+    def __init__(self, fail_times=0, error='(1213, Deadlock found when trying to get lock)'):
+        self.executed = [] # (statement, rows) of the committed chunks
+        self.fail_times = fail_times
+        self.error = error
+        self.attempts = 0
+        self.rollbacks = 0
+        self.pending = None
+
+    def execute(self, statement, rows):
+        self.attempts += 1
+        if self.fail_times:
+            self.fail_times -= 1
+            raise Exception(self.error)
+        self.pending = (statement, list(rows))
+
+    def commit(self):
+        self.executed.append(self.pending)
+
+    def rollback(self):
+        self.rollbacks += 1
+
+
+@pytest.fixture
+def collector(monkeypatch):
+    monkeypatch.setenv('WRITE_PIPELINE', 'false')
+    monkeypatch.setenv('CHANGE_DETECTION_CACHE_SIZE', '0')
+    monkeypatch.setenv('UPSERT_BATCH_SIZE', '3')
+    monkeypatch.setattr(DataCollectorScheduler, '_connect_kafka', lambda self: None)
+    monkeypatch.setattr(scheduler_module.time, 'sleep', lambda seconds: None)
+
+    collector = DataCollectorScheduler(Flask(__name__), None, opensky_client=None)
+    session = FakeSession()
+    monkeypatch.setattr(scheduler_module, 'db', types.SimpleNamespace(session=session))
+    collector.daily_stats.record = lambda rows: None
+    collector.data_versions.bump = lambda airport_icao: None
+    return collector, session
+
+
+def flights(count):
+    return [{'icao24': f"a{n:05x}", 'firstSeen': 1700000000 + n, 'lastSeen': 1700003600 + n, 'callsign': 'AZA123 '} for n in range(count)]
+
+
+def test_rows_are_written_in_chunks_through_one_cached_statement(collector):
+    collector, session = collector
+    statement = collector.upsert_statement
+
+    assert collector._save_flights('LIRF', flights(7), 'departure') == 7
+
+    # 7 rows with UPSERT_BATCH_SIZE=3 -> 3 executemany calls, always on the statement built once in __init__
+    assert [len(rows) for _, rows in session.executed] == [3, 3, 1]
+    assert all(executed is statement for executed, _ in session.executed)
+    assert collector.upsert_statement is statement
+
+
+def test_invalid_flights_are_skipped(collector):
+    collector, session = collector
+    rows = flights(2) + [{'icao24': None, 'firstSeen': 1}, {'icao24': 'abc123'}]
+
+    assert collector._save_flights('LIRF', rows, 'arrival') == 2
+    assert [len(rows) for _, rows in session.executed] == [2]
+
+
+def test_statement_has_no_per_call_literals(collector):
+    collector, _ = collector
+    sql = str(collector.upsert_statement.compile(dialect=mysql.dialect()))
+
+    assert 'ON DUPLICATE KEY UPDATE' in sql
+    assert 'last_seen = VALUES(last_seen)' in sql
+    assert 'collected_at = VALUES(collected_at)' in sql
+    # Identity columns of the unique key are never overwritten
+    assert 'first_seen = VALUES' not in sql
+    assert 'icao24 = VALUES' not in sql
+
+
+def test_only_the_deadlocked_chunk_is_retried(collector):
+    collector, session = collector
+    assert collector._save_flights('LIRF', flights(3), 'departure') == 3
+
+    session.fail_times = 2
+    rows = [dict(row, airport_icao='LIRF', flight_type='departure') for row in flights(2)]
+    assert collector._upsert_flights_batch('LIRF', rows) == 2
+    assert session.rollbacks == 2
+    assert [len(rows) for _, rows in session.executed] == [3, 2] # The first chunk is not written again
+
+
+def test_other_errors_are_not_retried(collector):
+    collector, session = collector
+    session.fail_times = 1
+    session.error = 'Data too long for column callsign'
+
+    with pytest.raises(Exception, match='Data too long'):
+        collector._upsert_flights_batch('LIRF', [{'icao24': 'abc123'}])
+    assert session.attempts == 1
+    assert session.executed == []
@@ -0,0 +1,117 @@
+import asyncio
+
+import pytest
+
+from circuit_breaker import CircuitBreaker, CircuitBreakerOpenException
+
+
+def fail():
+    raise ConnectionError('down')
+
+
+def make_breaker(**kwargs):
+    params = dict(failure_rate_threshold=0.5, window_seconds=60, minimum_calls=3, recovery_timeout=60, max_recovery_timeout=600)
+    params.update(kwargs)
+    return CircuitBreaker(name='test', **params)
+
+
+def test_opens_when_failure_rate_reaches_threshold():
+    cb = make_breaker()
+    cb.call(lambda: 'ok')
+    for _ in range(2):
+        with pytest.raises(ConnectionError):
+            cb.call(fail)
+    assert cb.state == 'OPEN' # 2 failures out of 3 calls
+
+    with pytest.raises(CircuitBreakerOpenException):
+        cb.call(lambda: 'ok')
+
+
+def test_stays_closed_below_minimum_calls():
+    cb = make_breaker(minimum_calls=5)
+    for _ in range(4):
+        with pytest.raises(ConnectionError):
+            cb.call(fail)
+    assert cb.state == 'CLOSED'
+
+
+def test_successful_probe_closes_the_circuit():
+    cb = make_breaker(recovery_timeout=-1) # The recovery timeout is already over at the next call
+    for _ in range(3):
+        with pytest.raises(ConnectionError):
+            cb.call(fail)
+    assert cb.state == 'OPEN'
+
+    assert cb.call(lambda: 'ok') == 'ok'
+    assert cb.state == 'CLOSED'
+    assert len(cb.outcomes) == 0
+
+
+def test_only_one_probe_while_half_open():
+    cb = make_breaker(recovery_timeout=-1)
+    for _ in range(3):
+        with pytest.raises(ConnectionError):
+            cb.call(fail)
+
+    def probe():
+        # Another caller arrives while the probe is in flight: it fails fast
+        with pytest.raises(CircuitBreakerOpenException):
+            cb.call(lambda: 'ok')
+        return 'probe'
+
+    assert cb.call(probe) == 'probe'
+    assert cb.state == 'CLOSED'
+
+
+def test_failed_probe_backs_off_exponentially():
+    cb = make_breaker(recovery_timeout=10, max_recovery_timeout=15)
+    for _ in range(3):
+        with pytest.raises(ConnectionError):
+            cb.call(fail)
+
+    for expected in (15, 15): # 10 * 2 capped at 15
+        cb.opened_at -= cb.recovery_timeout + 1 # Recovery timeout elapsed
+        with pytest.raises(ConnectionError):
+            cb.call(fail)
+        assert cb.state == 'OPEN'
+        assert cb.recovery_timeout == expected
+
+
+def test_cancelled_probe_lets_the_next_caller_probe():
+    cb = make_breaker(recovery_timeout=-1)
+    for _ in range(3):
+        with pytest.raises(ConnectionError):
+            cb.call(fail)
+
+    async def hang():
+        await asyncio.sleep(10)
+
+    async def cancel_probe():
+        probe = asyncio.ensure_future(cb.call_async(hang))
+        await asyncio.sleep(0.01)
+        assert cb.probe_in_flight
+        probe.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await probe
+
+    asyncio.run(cancel_probe())
+    assert cb.state == 'HALF_OPEN'
+    assert not cb.probe_in_flight
+
+    assert cb.call(lambda: 'ok') == 'ok'
+    assert cb.state == 'CLOSED'
+
+
+def test_interrupted_probe_lets_the_next_caller_probe():
+    cb = make_breaker(recovery_timeout=-1)
+    for _ in range(3):
+        with pytest.raises(ConnectionError):
+            cb.call(fail)
+
+    def interrupt():
+        raise KeyboardInterrupt()
+
+    with pytest.raises(KeyboardInterrupt):
+        cb.call(interrupt)
+    assert not cb.probe_in_flight
+    assert cb.call(lambda: 'ok') == 'ok'
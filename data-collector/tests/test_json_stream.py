@@ -0,0 +1,64 @@
+import json
+import random
+
+import pytest
+
+from json_stream import iter_json_array
+
+FLIGHTS = [
+    {
+        "icao24": "4b1815", "firstSeen": 1700000000, "estDepartureAirport": "LSZH", "lastSeen": 1700003600,
+        "estArrivalAirport": "LIRF", "callsign": "SWR1732 ", "estDepartureAirportHorizDistance": 1041,
+        "estDepartureAirportVertDistance": 56, "estArrivalAirportHorizDistance": None,
+        "estArrivalAirportVertDistance": None, "departureAirportCandidatesCount": 1, "arrivalAirportCandidatesCount": 0
+    },
+    {"icao24": "3c6444", "firstSeen": 1700000100, "callsign": None, "note": "caffè ✈ \"quoted\" [1, 2]", "nested": {"a": [1, {"b": None}]}},
+    12, -7, 1.5, -0.25, 3e2, 1E-3, 0, "text, with ] and ,", True, False, None, [], {}
+]
+
+
+def random_chunks(data, rng, max_size=7):
+    chunks = []
+    pos = 0
+    while pos < len(data):
+        size = rng.randint(1, max_size)
+        chunks.append(data[pos:pos + size])
+        pos += size
+    return chunks
+
+
+@pytest.mark.parametrize("seed", range(200))
+def test_random_splits_match_json_loads(seed):
+    rng = random.Random(seed)
+    body = json.dumps(FLIGHTS, indent=rng.choice([None, 1])).encode('utf-8')
+    assert list(iter_json_array(random_chunks(body, rng))) == FLIGHTS
+
+
+@pytest.mark.parametrize("body", [b"[1.5]", b"[1.5, 2]", b"[-12e3 ,4]", b"[ 0.125 ]", b"[10,20,30]"])
+def test_numbers_split_at_every_position(body):
+    expected = json.loads(body)
+    for i in range(1, len(body)):
+        assert list(iter_json_array([body[:i], body[i:]])) == expected, body[:i]
+
+
+def test_multibyte_character_split():
+    body = json.dumps(["✈"], ensure_ascii=False).encode('utf-8')
+    assert list(iter_json_array([bytes([b]) for b in body])) == ["✈"]
+
+
+@pytest.mark.parametrize("chunks", [[b"null"], [b"nu", b"ll"], [b""], [], [b"  ", b"\n"], [b"[", b"]"]])
+def test_empty_results(chunks):
+    assert list(iter_json_array(chunks)) == []
+
+
+@pytest.mark.parametrize("body", [b"1.5", b"42", b'"text"', b'{"a": 1}', b"true", b"nope"])
+def test_top_level_values_other_than_arrays_are_rejected(body):
+    for i in range(1, len(body) + 1):
+        with pytest.raises(ValueError):
+            list(iter_json_array([body[:i], body[i:]]))
+
+
+@pytest.mark.parametrize("body", [b"[1, 2", b'[{"a": 1}', b"[1.", b'[{"a": ]'])
+def test_truncated_or_invalid_arrays_are_rejected(body):
+    with pytest.raises(ValueError):
+        list(iter_json_array([body]))
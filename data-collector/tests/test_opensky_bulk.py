@@ -0,0 +1,68 @@
+import threading
+import time
+
+import pytest
+
+from opensky_client import OpenSkyClient
+
+
+def flight(icao24, first_seen, departure=None, arrival=None):
+    return {'icao24': icao24, 'firstSeen': first_seen, 'estDepartureAirport': departure, 'estArrivalAirport': arrival}
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setenv('OPENSKY_BULK_MAX_SLICES', '2')
+    return OpenSkyClient()
+
+
+def test_slices_are_filtered_and_deduplicated(client, monkeypatch):
+    slices = {
+        0: [flight('a1', 100, 'LIRF', 'KJFK'), flight('a2', 200, 'EGLL', 'LIMC'), flight('a3', 300, 'EGLL', 'KJFK')],
+        7200: [flight('a1', 100, 'LIRF', 'KJFK'), flight('a4', 7300, 'LIMC', 'LIRF'), flight(None, 7400, 'LIRF')],
+    }
+    monkeypatch.setattr(client, 'iter_all_flights', lambda begin, end: iter(slices[begin]))
+
+    result = client.get_flights_for_airports(['LIRF', 'LIMC'], 0, 10000)
+
+    assert [f['icao24'] for f in result['LIRF']['departures']] == ['a1'] # Seen in both slices, stored once
+    assert [f['icao24'] for f in result['LIRF']['arrivals']] == ['a4']
+    assert [f['icao24'] for f in result['LIMC']['departures']] == ['a4']
+    assert [f['icao24'] for f in result['LIMC']['arrivals']] == ['a2']
+    assert result['LIRF']['total'] == 2
+
+
+def test_slices_in_flight_are_bounded(client, monkeypatch):
+    active = [0]
+    peak = [0]
+    requested = []
+    lock = threading.Lock()
+
+    def iter_all_flights(begin, end):
+        assert end - begin <= OpenSkyClient.ALL_FLIGHTS_MAX_WINDOW
+        with lock:
+            requested.append(begin)
+            active[0] += 1
+            peak[0] = max(peak[0], active[0])
+        time.sleep(0.02)
+        yield flight(f"x{begin}", begin + 1, 'LIRF')
+        with lock:
+            active[0] -= 1
+
+    monkeypatch.setattr(client, 'iter_all_flights', iter_all_flights)
+
+    result = client.get_flights_for_airports(['LIRF'], 0, 24 * 3600)
+
+    assert len(requested) == 12
+    assert peak[0] <= 2
+    assert len(result['LIRF']['departures']) == 12
+
+
+def test_slice_error_is_raised(client, monkeypatch):
+    def iter_all_flights(begin, end):
+        raise Exception('Server Error: 503')
+
+    monkeypatch.setattr(client, 'iter_all_flights', iter_all_flights)
+
+    with pytest.raises(Exception, match='503'):
+        client.get_flights_for_airports(['LIRF'], 0, 24 * 3600)
@@ -0,0 +1,46 @@
+import time
+
+import pytest
+
+from rate_limiter import TokenBucketRateLimiter
+
+
+def test_burst_then_paced_waits():
+    limiter = TokenBucketRateLimiter(rate=10, capacity=2)
+    assert limiter._reserve() == 0
+    assert limiter._reserve() == 0
+    # The bucket is empty: every further token is a debt paid back at 'rate' tokens per second (FIFO)
+    assert limiter._reserve() == pytest.approx(0.1, abs=0.01)
+    assert limiter._reserve() == pytest.approx(0.2, abs=0.01)
+
+
+def test_low_credits_slow_down():
+    limiter = TokenBucketRateLimiter(rate=10, capacity=1, low_credits_threshold=100, low_credits_rate=1)
+    limiter.update_from_headers({'X-Rate-Limit-Remaining': '50'})
+    assert limiter.remaining_credits == 50
+    limiter._reserve()
+    assert limiter._reserve() == pytest.approx(1.0, abs=0.05)
+
+
+def test_retry_after_blocks_every_caller():
+    limiter = TokenBucketRateLimiter(rate=10, capacity=5)
+    limiter.update_from_headers({'Retry-After': '30'})
+    # Callers queued during the block are released one by one after it, not all at once
+    waits = [limiter._reserve() for _ in range(3)]
+    assert waits == [pytest.approx(30 + n / 10, abs=0.01) for n in (1, 2, 3)]
+
+
+def test_no_refill_while_blocked():
+    limiter = TokenBucketRateLimiter(rate=10, capacity=5)
+    limiter.block_for(0.2)
+    time.sleep(0.25)
+    # The block is over, but the bucket only started refilling when it ended
+    assert limiter._reserve() == pytest.approx(0.05, abs=0.04)
+
+
+def test_invalid_headers_are_ignored():
+    limiter = TokenBucketRateLimiter(rate=10, capacity=1)
+    limiter.update_from_headers({'X-Rate-Limit-Remaining': 'n/a', 'Retry-After': 'soon'})
+    limiter.update_from_headers(None)
+    assert limiter.remaining_credits is None
+    assert limiter._reserve() == 0
@@ -0,0 +1,29 @@
+from sharding import ConsistentHashRing
+
+AIRPORTS = [f"A{i:03d}" for i in range(1000)]
+
+
+def test_empty_ring():
+    assert ConsistentHashRing([]).get('LIRF') is None
+
+
+def test_assignment_is_deterministic_and_balanced():
+    nodes = ['collector-a', 'collector-b', 'collector-c']
+    ring = ConsistentHashRing(nodes)
+    again = ConsistentHashRing(list(reversed(nodes)))
+
+    owners = [ring.get(icao) for icao in AIRPORTS]
+    assert owners == [again.get(icao) for icao in AIRPORTS]
+    for node in nodes:
+        assert 200 < owners.count(node) < 470 # Roughly a third each
+
+
+def test_only_the_airports_of_a_leaving_node_move():
+    before = ConsistentHashRing(['collector-a', 'collector-b', 'collector-c'])
+    after = ConsistentHashRing(['collector-a', 'collector-b'])
+
+    for icao in AIRPORTS:
+        if before.get(icao) != 'collector-c':
+            assert after.get(icao) == before.get(icao)
+        else:
+            assert after.get(icao) in ('collector-a', 'collector-b')
@@ -0,0 +1,67 @@
+import threading
+import time
+
+import pytest
+
+from single_flight import SingleFlight
+
+
+def test_concurrent_calls_share_one_execution():
+    sf = SingleFlight()
+    calls = []
+    release = threading.Event()
+
+    def work():
+        calls.append(1)
+        release.wait(2)
+        return 'data'
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(sf.do('LIRF', work))) for _ in range(5)]
+    for t in threads:
+        t.start()
+    time.sleep(0.1)
+    release.set()
+    for t in threads:
+        t.join()
+
+    assert calls == [1]
+    assert results == ['data'] * 5
+    assert not sf.is_running('LIRF')
+
+
+def test_different_keys_run_independently():
+    sf = SingleFlight()
+    assert sf.do('LIRF', lambda: 1) == 1
+    assert sf.do('KJFK', lambda: 2) == 2
+
+
+def test_error_is_raised_to_every_waiter():
+    sf = SingleFlight()
+    is_leader, future = sf.begin('LIRF')
+    assert is_leader
+    _, waiter = sf.begin('LIRF')
+    assert waiter is future
+
+    sf.complete('LIRF', error=RuntimeError('boom'))
+    with pytest.raises(RuntimeError):
+        waiter.result()
+    assert not sf.is_running('LIRF')
+
+
+def test_caller_needing_newer_data_gets_a_rerun():
+    sf = SingleFlight()
+    _, first = sf.begin('LIRF')
+
+    # The in-flight call started before 'not_before': its data would be too old for this caller
+    is_leader, rerun = sf.begin('LIRF', not_before=time.time() + 1)
+    assert not is_leader
+    assert rerun is not first
+
+    assert sf.complete('LIRF', result='old') # The leader must run again
+    assert first.result() == 'old'
+    assert not rerun.done()
+
+    assert not sf.complete('LIRF', result='new')
+    assert rerun.result() == 'new'
+    assert not sf.is_running('LIRF')
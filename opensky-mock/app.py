@@ -0,0 +1,269 @@
+from flask import Flask, request, jsonify, Response
+import os
+import json
+import time
+import random
+import hashlib
+import threading
+import requests
+from functools import lru_cache
+
+# Offline stand-in for the OpenSky Network API (token endpoint + /flights/departure, /flights/arrival, /flights/all).
+# It lets us run the Data Collector without real credentials, benchmark collection throughput and
+# exercise the CircuitBreaker/rate limiter by injecting latency, 429s and 5xx errors.
+#
+# Modes (MOCK_MODE):
+#  - synthetic: deterministic generated traffic for MOCK_AIRPORT_COUNT airports (or the MOCK_AIRPORTS list)
+#  - replay:    serves the JSON fixtures found in MOCK_FIXTURES_DIR (falls back to synthetic if missing)
+#  - record:    proxies the calls to the real OpenSky API and saves the payloads as fixtures for later replay
+
+app = Flask(__name__)
+
+REAL_API_URL = "https://opensky-network.org/api"
+REAL_AUTH_URL = "https://auth.opensky-network.org/auth/realms/opensky-network/protocol/openid-connect/token"
+TOKEN_PATH = '/auth/realms/opensky-network/protocol/openid-connect/token'
+
+config = {
+    'mode': os.getenv('MOCK_MODE', 'synthetic'),
+    'fixtures_dir': os.getenv('MOCK_FIXTURES_DIR', '/app/fixtures'),
+    'airport_count': int(os.getenv('MOCK_AIRPORT_COUNT', '50')),
+    'airports': [a.strip().upper() for a in os.getenv('MOCK_AIRPORTS', '').split(',') if a.strip()],
+    'flights_per_hour': int(os.getenv('MOCK_FLIGHTS_PER_HOUR', '20')), # Departures per airport per hour
+    'seed': os.getenv('MOCK_SEED', 'opensky-mock'),
+    'latency_ms': int(os.getenv('MOCK_LATENCY_MS', '0')),
+    'latency_jitter_ms': int(os.getenv('MOCK_LATENCY_JITTER_MS', '0')),
+    'error_rate': float(os.getenv('MOCK_ERROR_RATE', '0')),         # Probability of a 5xx response
+    'rate_limit_rate': float(os.getenv('MOCK_RATE_LIMIT_RATE', '0')), # Probability of a 429 response
+    'retry_after_seconds': int(os.getenv('MOCK_RETRY_AFTER_SECONDS', '10')),
+    'credits': int(os.getenv('MOCK_CREDITS', '4000')),                # Daily credits, reported in X-Rate-Limit-Remaining
+    'token_expires_in': int(os.getenv('MOCK_TOKEN_EXPIRES_IN', '1800'))
+}
+
+stats = {'requests': 0, 'errors_injected': 0, 'rate_limited': 0}
+state_lock = threading.Lock()
+
+# ---------------- SYNTHETIC TRAFFIC ----------------
+
+def get_airports():
+    if config['airports']:
+        return config['airports']
+    return [f"X{i:03d}" for i in range(config['airport_count'])]
+
+def departures_in_hour(airport, hour):
+    return _departures_in_hour(airport, hour, config['seed'], config['flights_per_hour'], tuple(get_airports()))
+
+@lru_cache(maxsize=65536)
+def _departures_in_hour(airport, hour, seed, flights_per_hour, airports):
+    # Deterministic: the same (airport, hour) always produces the same flights, so departures,
+    # arrivals and /flights/all are consistent with each other and across repeated calls.
+    digest = hashlib.md5(f"{seed}:{airport}:{hour}".encode()).hexdigest()
+    rng = random.Random(int(digest, 16))
+
+    flights = []
+    for i in range(flights_per_hour):
+        first_seen = hour * 3600 + rng.randint(0, 3599)
+        duration = rng.randint(1800, 4 * 3600)
+        destination = rng.choice(airports)
+        airline = rng.choice(['AZA', 'RYR', 'DLH', 'AFR', 'BAW', 'EZY', 'KLM', 'UAE'])
+        flights.append({
+            'icao24': f"{rng.getrandbits(24):06x}",
+            'firstSeen': first_seen,
+            'estDepartureAirport': airport,
+            'lastSeen': first_seen + duration,
+            'estArrivalAirport': destination,
+            'callsign': f"{airline}{rng.randint(1, 9999):<5}",
+            'estDepartureAirportHorizDistance': rng.randint(0, 3000),
+            'estDepartureAirportVertDistance': rng.randint(0, 300),
+            'estArrivalAirportHorizDistance': rng.randint(0, 3000),
+            'estArrivalAirportVertDistance': rng.randint(0, 300),
+            'departureAirportCandidatesCount': rng.randint(0, 3),
+            'arrivalAirportCandidatesCount': rng.randint(0, 3)
+        })
+    return flights
+
+def synthetic_departures(airport, begin, end):
+    result = []
+    for hour in range(begin // 3600, end // 3600 + 1):
+        result.extend(f for f in departures_in_hour(airport, hour) if begin <= f['firstSeen'] <= end)
+    return result
+
+@lru_cache(maxsize=256)
+def _arrivals_index(hour, seed, flights_per_hour, airports):
+    # All the departures of one hour, grouped by destination (so an arrivals call doesn't rescan every airport)
+    index = {}
+    for origin in airports:
+        for f in _departures_in_hour(origin, hour, seed, flights_per_hour, airports):
+            index.setdefault(f['estArrivalAirport'], []).append(f)
+    return index
+
+def synthetic_arrivals(airport, begin, end):
+    airports = tuple(get_airports())
+    result = []
+    for hour in range((begin - 4 * 3600) // 3600, end // 3600 + 1): # Flights last at most 4 hours
+        index = _arrivals_index(hour, config['seed'], config['flights_per_hour'], airports)
+        result.extend(f for f in index.get(airport, []) if begin <= f['lastSeen'] <= end)
+    return result
+
+def synthetic_all(begin, end):
+    result = []
+    for airport in get_airports():
+        result.extend(synthetic_departures(airport, begin, end))
+    return result
+
+# ---------------- RECORD / REPLAY ----------------
+
+def fixture_path(endpoint, airport):
+    return os.path.join(config['fixtures_dir'], endpoint, f"{airport or 'all'}.json")
+
+def load_fixture(endpoint, airport):
+    path = fixture_path(endpoint, airport)
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r') as f:
+        return json.load(f)
+
+def record_fixture(endpoint, airport, payload):
+    path = fixture_path(endpoint, airport)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(payload, f)
+    print(f"[Mock] Registrata fixture {path} ({len(payload or [])} voli)", flush=True)
+
+real_token = {'value': None, 'expiry': 0}
+
+def real_headers():
+    if real_token['value'] is None or time.time() > real_token['expiry']:
+        response = requests.post(REAL_AUTH_URL, data={
+            'grant_type': 'client_credentials',
+            'client_id': os.getenv('CLIENT_ID'),
+            'client_secret': os.getenv('CLIENT_SECRET')
+        }, timeout=10)
+        response.raise_for_status()
+        data = response.json()
+        real_token['value'] = data['access_token']
+        real_token['expiry'] = time.time() + data.get('expires_in', 1800) - 120
+    return {'Authorization': f"Bearer {real_token['value']}"}
+
+# ---------------- FAULT INJECTION ----------------
+
+def inject_faults():
+    # Returns a ready-made error response, or None if the request should be served normally
+    delay = config['latency_ms'] + (random.randint(0, config['latency_jitter_ms']) if config['latency_jitter_ms'] else 0)
+    if delay > 0:
+        time.sleep(delay / 1000)
+
+    with state_lock:
+        stats['requests'] += 1
+
+        if config['rate_limit_rate'] and random.random() < config['rate_limit_rate']:
+            stats['rate_limited'] += 1
+            response = Response("Too many requests", status=429)
+            response.headers['X-Rate-Limit-Retry-After-Seconds'] = str(config['retry_after_seconds'])
+            return response
+
+        if config['error_rate'] and random.random() < config['error_rate']:
+            stats['errors_injected'] += 1
+            return Response("Injected server error", status=random.choice([500, 502, 503]))
+
+        config['credits'] = max(0, config['credits'] - 1)
+    return None
+
+def flights_response(payload):
+    response = Response(json.dumps(payload), status=200, mimetype='application/json')
+    response.headers['X-Rate-Limit-Remaining'] = str(config['credits'])
+    return response
+
+def serve_flights(endpoint, airport):
+    error = inject_faults()
+    if error is not None:
+        return error
+
+    if request.headers.get('Authorization', '') == '':
+        return Response("Unauthorized", status=401)
+
+    try:
+        begin = int(request.args['begin'])
+        end = int(request.args['end'])
+    except (KeyError, ValueError):
+        return Response("Invalid begin/end", status=400)
+
+    if endpoint == 'all' and end - begin > 2 * 3600:
+        return Response("Time interval too large (max 2 hours)", status=400)
+
+    mode = config['mode']
+
+    if mode == 'record':
+        params = {'begin': begin, 'end': end}
+        if airport:
+            params['airport'] = airport
+        upstream = requests.get(f"{REAL_API_URL}/flights/{endpoint}", params=params, headers=real_headers(), timeout=60)
+        if upstream.status_code == 200:
+            record_fixture(endpoint, airport, upstream.json())
+        return Response(upstream.content, status=upstream.status_code, mimetype='application/json')
+
+    if mode == 'replay':
+        payload = load_fixture(endpoint, airport)
+        if payload is not None:
+            return flights_response(payload)
+
+    if endpoint == 'departure':
+        payload = synthetic_departures(airport, begin, end)
+    elif endpoint == 'arrival':
+        payload = synthetic_arrivals(airport, begin, end)
+    else:
+        payload = synthetic_all(begin, end)
+
+    if not payload:
+        return Response("[]", status=404, mimetype='application/json') # Same behaviour as OpenSky for empty results
+    return flights_response(payload)
+
+# ---------------- ROUTES ----------------
+
+@app.route(TOKEN_PATH, methods=['POST'])
+def token():
+    error = inject_faults()
+    if error is not None:
+        return error
+
+    if request.form.get('grant_type') != 'client_credentials':
+        return jsonify({"error": "unsupported_grant_type"}), 400
+
+    return jsonify({
+        "access_token": f"mock-{int(time.time())}",
+        "expires_in": config['token_expires_in'],
+        "token_type": "Bearer"
+    }), 200
+
+@app.route('/api/flights/departure', methods=['GET'])
+def departures():
+    airport = (request.args.get('airport') or '').upper()
+    return serve_flights('departure', airport)
+
+@app.route('/api/flights/arrival', methods=['GET'])
+def arrivals():
+    airport = (request.args.get('airport') or '').upper()
+    return serve_flights('arrival', airport)
+
+@app.route('/api/flights/all', methods=['GET'])
+def all_flights():
+    return serve_flights('all', None)
+
+@app.route('/admin/config', methods=['GET', 'POST'])
+def admin_config():
+    # Runtime tuning of the mock (e.g. switch on 5xx errors in the middle of a benchmark)
+    if request.method == 'POST':
+        data = request.get_json(silent=True) or {}
+        with state_lock:
+            for key, value in data.items():
+                if key in config:
+                    config[key] = value
+    return jsonify({"config": config, "airports": len(get_airports()), "stats": stats}), 200
+
+@app.route('/health', methods=['GET'])
+def health_check():
+    return jsonify({"status": "healthy", "service": "opensky-mock", "mode": config['mode']}), 200
+
+if __name__ == '__main__':
+    port = int(os.getenv('MOCK_PORT', '8080'))
+    print(f"Avvio OpenSky Mock in modalità '{config['mode']}' sulla porta {port}...", flush=True)
+    app.run(host='0.0.0.0', port=port, debug=False, threaded=True)
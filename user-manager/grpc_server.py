@@ -4,10 +4,12 @@ import user_service_pb2
 import user_service_pb2_grpc
 from database import db
 from models import User
+import os
 
 class UserServiceServicer(user_service_pb2_grpc.UserServiceServicer):
     def __init__(self, app):
         self.app = app
+        self.max_batch_size = int(os.getenv('VERIFY_USERS_MAX_BATCH', '1000')) # Bounds the IN (...) list of a single query
 
     def VerifyUser(self, request, context):
         with self.app.app_context():
@@ -29,6 +31,48 @@ class UserServiceServicer(user_service_pb2_grpc.UserServiceServicer):
             finally:
                 db.session.remove()
 
+    def _verify_batch(self, request):
+        # A single SELECT ... WHERE email IN (...) for the whole batch
+        with self.app.app_context():
+            try:
+                emails = list(dict.fromkeys(request.emails))
+                found = set()
+                if emails:
+                    found = set(db.session.execute(db.select(User.email).where(User.email.in_(emails))).scalars().all())
+
+                return user_service_pb2.VerifyUsersResponse(results=[
+                    user_service_pb2.UserVerification(email=email, exists=email in found)
+                    for email in request.emails
+                ])
+            finally:
+                db.session.remove()
+
+    def VerifyUsers(self, request, context):
+        if len(request.emails) > self.max_batch_size:
+            context.set_code(grpc.StatusCode.INVALID_ARGUMENT)
+            context.set_details(f"Troppe email nel batch (max {self.max_batch_size})")
+            return user_service_pb2.VerifyUsersResponse()
+
+        try:
+            print(f"Ricevuta richiesta VerifyUsers ({len(request.emails)} email)...", flush=True)
+            return self._verify_batch(request)
+        except Exception as e:
+            context.set_code(grpc.StatusCode.INTERNAL)
+            context.set_details(str(e))
+            return user_service_pb2.VerifyUsersResponse()
+
+    def VerifyUsersStream(self, request_iterator, context):
+        # Bidirectional stream: every batch received is answered with one response, on the same connection
+        print("Aperto stream VerifyUsersStream...", flush=True)
+        for request in request_iterator:
+            if len(request.emails) > self.max_batch_size:
+                context.abort(grpc.StatusCode.INVALID_ARGUMENT, f"Troppe email nel batch (max {self.max_batch_size})")
+            try:
+                response = self._verify_batch(request)
+            except Exception as e:
+                context.abort(grpc.StatusCode.INTERNAL, str(e))
+            yield response
+
     def GetUser(self, request, context):
         with self.app.app_context():
             try: